@@ -48,7 +48,7 @@ sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "
 
 import json
 
-from mobdat.common import LayoutSettings
+from mobdat.common import LayoutSettings, WorldInfo, TravelTimeMatrix
 from mobdat.builder import WorldBuilder, OpenSimBuilder, SumoBuilder
 
 logger = logging.getLogger(__name__)
@@ -88,5 +88,20 @@ def Controller(settings, pushlist) :
     infofile = settings["General"].get("WorldInfoFile","info.js")
     logger.info('saving world data to %s',infofile)
 
+    # stream the world out one object at a time, a WorldInfoIndent of
+    # null or 0 drops the pretty printing to get a much smaller file
+    indent = settings["General"].get("WorldInfoIndent", 2)
     with open(infofile, "w") as fp :
-        json.dump(world.Dump(), fp, indent=2, ensure_ascii=True)
+        world.DumpToFile(fp, indent)
+
+    # the snapshot is written after the json file so that it is newer
+    # and will be picked up automatically by WorldInfo.LoadFromFile
+    snapfile = WorldInfo.SnapshotFileName(infofile)
+    logger.info('saving world snapshot to %s', snapfile)
+    world.SaveSnapshotFile(snapfile)
+
+    # precompute the travel times between capsules for the simulator
+    if settings["Builder"].get("TravelTimeMatrix", True) :
+        matfile = TravelTimeMatrix.MatrixFileName(infofile)
+        logger.info('saving travel time matrix to %s', matfile)
+        TravelTimeMatrix.TravelTimeMatrix.Build(world, matfile)
@@ -0,0 +1,283 @@
+#!/usr/bin/python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer. 
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution. 
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+
+@file    Placement.py
+@author  Mic Bowman
+@date    2014-04-12
+
+This file defines engines that place people in residential locations and
+businesses in business locations. Locations wait in a heap for each
+location profile ordered by how much of their capacity is used, so a
+placement looks at the head of each heap rather than at every location.
+
+"""
+
+import os, sys
+import logging
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import heapq
+
+logger = logging.getLogger(__name__)
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class ResidentialPlacement :
+    """
+    ResidentialPlacement -- assign people to the residential location with
+    the most spare capacity among the profiles that suit them
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, world) :
+        """
+        Args:
+            world -- WorldBuilder.WorldBuilder
+        """
+        self.World = world
+
+        # map profile node --> heap of [load, position, location, capacity]
+        self.Queues = {}
+
+        locations = world.FindNodes(nodetype = 'ResidentialLocation')
+        for position, location in enumerate(locations) :
+            capacity = location.ResidentialLocation.ResidentCapacity
+            count = location.ResidentialLocation.ResidentCount
+            if count >= capacity :
+                continue
+
+            profile = location.FindDecorationProvider('ResidentialLocationProfile')
+            entry = (float(count) / capacity, position, location, capacity)
+            self.Queues.setdefault(profile, []).append(entry)
+
+        for queue in self.Queues.itervalues() :
+            heapq.heapify(queue)
+
+    # -----------------------------------------------------------------
+    def PlaceResident(self, person) :
+        """
+        PlaceResident -- add a person to a residential location and set the
+        residence of the person, returns the location or None when there
+        is no room for the person
+
+        Args:
+            person -- SocialNodes.Person
+        """
+        while True :
+            bestqueue = None
+            bestfit = 0
+            for profile, queue in self.Queues.iteritems() :
+                if not queue :
+                    continue
+
+                fitness = (1.0 - queue[0][0]) * profile.ResidentialLocationProfile.Fitness(person)
+                if fitness > bestfit :
+                    bestfit = fitness
+                    bestqueue = queue
+
+            if bestqueue is None :
+                return None
+
+            load, position, location, capacity = bestqueue[0]
+            endpoint = location.ResidentialLocation.AddResident(person)
+            if endpoint is None :
+                # every capsule is full even though the location is not
+                heapq.heappop(bestqueue)
+                continue
+
+            self.World.SetResidence(person, endpoint)
+
+            count = location.ResidentialLocation.ResidentCount
+            if count >= capacity :
+                heapq.heappop(bestqueue)
+            else :
+                heapq.heapreplace(bestqueue, (float(count) / capacity, position, location, capacity))
+
+            return location
+
+    # -----------------------------------------------------------------
+    def PlaceResidents(self, people) :
+        """
+        PlaceResidents -- place a batch of people in order, returns the list
+        of people that did not fit once the locations are full
+
+        Args:
+            people -- list of SocialNodes.Person
+        """
+        for index, person in enumerate(people) :
+            if self.PlaceResident(person) is None :
+                logger.info('ran out of residences after %d of %d people', index, len(people))
+                return people[index:]
+
+        return []
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class BusinessPlacement :
+    """
+    BusinessPlacement -- assign businesses to the business location with
+    the most spare employee and customer capacity among the profiles that
+    prefer the type of the business
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, world) :
+        """
+        Args:
+            world -- WorldBuilder.WorldBuilder
+        """
+        self.World = world
+
+        # map profile node --> heap of [load, position, location, ecapacity, ccapacity]
+        self.Queues = {}
+
+        locations = world.FindNodes(nodetype = 'BusinessLocation')
+        for position, location in enumerate(locations) :
+            ecapacity = location.BusinessLocation.EmployeeCapacity
+            ccapacity = location.BusinessLocation.CustomerCapacity
+            entry = self._MakeEntry(position, location, ecapacity, ccapacity)
+            if entry :
+                profile = location.FindDecorationProvider('BusinessLocationProfile')
+                self.Queues.setdefault(profile, []).append(entry)
+
+        for queue in self.Queues.itervalues() :
+            heapq.heapify(queue)
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _MakeEntry(position, location, ecapacity, ccapacity) :
+        ecount = location.BusinessLocation.PeakEmployeeCount
+        ccount = location.BusinessLocation.PeakCustomerCount
+        if ecount >= ecapacity or ccount >= ccapacity :
+            return None
+
+        load = (float(ecount) / ecapacity + float(ccount) / ccapacity) / 2.0
+        return (load, position, location, ecapacity, ccapacity)
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _BusinessDemand(business) :
+        """
+        _BusinessDemand -- return the peak employee and customer counts that
+        a business adds to its location
+        """
+        employees = 0
+        if business.FindDecorationProvider('EmploymentProfile') :
+            employees = business.EmploymentProfile.PeakEmployeeCount()
+
+        customers = 0
+        if business.FindDecorationProvider('ServiceProfile') :
+            customers = business.ServiceProfile.PeakServiceCount()
+
+        return employees, customers
+
+    # -----------------------------------------------------------------
+    def _FindFit(self, queue, employees, customers) :
+        """
+        _FindFit -- return the least loaded entry in the queue with room for
+        the business, the entries passed over stay in the queue
+        """
+        skipped = []
+        found = None
+        while queue :
+            entry = queue[0]
+            location = entry[2]
+            if location.BusinessLocation.PeakEmployeeCount + employees < entry[3] and \
+               location.BusinessLocation.PeakCustomerCount + customers < entry[4] :
+                found = entry
+                break
+            skipped.append(heapq.heappop(queue))
+
+        for entry in skipped :
+            heapq.heappush(queue, entry)
+
+        return found
+
+    # -----------------------------------------------------------------
+    def PlaceBusiness(self, business) :
+        """
+        PlaceBusiness -- add a business to a business location and set the
+        residence of the business, returns the location or None when no
+        location that suits the business has room for it
+
+        Args:
+            business -- SocialNodes.Business
+        """
+        employees, customers = self._BusinessDemand(business)
+
+        bestqueue = None
+        bestentry = None
+        bestfit = 0
+        for profile, queue in self.Queues.iteritems() :
+            pfitness = profile.BusinessLocationProfile.Fitness(business)
+            if pfitness <= 0 :
+                continue
+
+            entry = self._FindFit(queue, employees, customers)
+            if entry and (1.0 - entry[0]) * pfitness > bestfit :
+                bestfit = (1.0 - entry[0]) * pfitness
+                bestqueue = queue
+                bestentry = entry
+
+        if bestentry is None :
+            return None
+
+        load, position, location, ecapacity, ccapacity = bestentry
+        capsule = location.BusinessLocation.AddBusiness(business)
+        self.World.SetResidence(business, capsule)
+
+        # entries that did not fit may sit ahead of the one that was used
+        if bestqueue[0] is bestentry :
+            heapq.heappop(bestqueue)
+        else :
+            bestqueue.remove(bestentry)
+            heapq.heapify(bestqueue)
+
+        entry = self._MakeEntry(position, location, ecapacity, ccapacity)
+        if entry :
+            heapq.heappush(bestqueue, entry)
+
+        return location
+
+    # -----------------------------------------------------------------
+    def PlaceBusinesses(self, businesses) :
+        """
+        PlaceBusinesses -- place a batch of businesses, returns the list of
+        businesses for which no location had room
+
+        Args:
+            businesses -- list of SocialNodes.Business
+        """
+        return [business for business in businesses if self.PlaceBusiness(business) is None]
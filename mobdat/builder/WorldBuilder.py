@@ -79,11 +79,8 @@ class WorldBuilder(WorldInfo.WorldInfo) :
     # -----------------------------------------------------------------
     @staticmethod
     def LoadFromFile(filename) :
-        with open(filename, 'r') as fp :
-            data = json.load(fp)
-
         graph = WorldBuilder()
-        graph.Load(data)
+        graph.LoadFile(filename)
 
         return graph
 
@@ -334,38 +331,38 @@ class WorldBuilder(WorldInfo.WorldInfo) :
 
     # -----------------------------------------------------------------
     def FindNodesInRange(self, x, y, dist) :
-        result = []
-        sqdist = int(dist) * int(dist)
-        for name, node in self.IterNodes() :
-            if not node.FindDecorationProvider('Coord') :
-                continue
+        return self.CoordIndex.FindNodesInRange(x, y, int(dist))
+
+    # -----------------------------------------------------------------
+    def FindNodesInRangeBatch(self, points, dist) :
+        """
+        Args:
+            points -- list of (x, y) tuples
+            dist -- distance from each point
+        """
+        return self.CoordIndex.FindNodesInRangeBatch(points, int(dist))
+
+    # -----------------------------------------------------------------
+    def FindNodesInBox(self, x0, y0, x1, y1) :
+        return self.CoordIndex.FindNodesInBox(x0, y0, x1, y1)
 
-            cdist = (node.Coord.X - x)**2 + (node.Coord.Y - y)**2
-            if cdist < sqdist :
-                result.append(node)
+    # -----------------------------------------------------------------
+    def FindNearestNodes(self, x, y, count = 1) :
+        return self.CoordIndex.FindNearestNodes(x, y, count)
 
-        return result
+    # -----------------------------------------------------------------
+    def FindNearestNodesBatch(self, points, count = 1) :
+        """
+        Args:
+            points -- list of (x, y) tuples
+            count -- number of nodes to find for each point
+        """
+        return self.CoordIndex.FindNearestNodesBatch(points, count)
 
     # -----------------------------------------------------------------
     def FindClosestNode(self, target) :
-        cnode = None
-        cdist = 0
-
-        for name, node in self.IterNodes() :
-            if not node.FindDecorationProvider('Coord') :
-                continue
-
-            if cnode == None :
-                cnode = node
-                cdist = (cnode.X - target.X)**2 + (cnode.Y - target.Y)**2
-                continue
-
-            dist = (node.X - target.X)**2 + (node.Y - target.Y)**2
-            if (dist < cdist) :
-                cnode = node
-                cdist = dist
-            
-        return cnode
+        nodes = self.CoordIndex.FindNearestNodes(target.Coord.X, target.Coord.Y, 1)
+        return nodes[0] if nodes else None
 
     # =================================================================
     # =================================================================
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+@file    BusinessIndex.py
+@author  Mic Bowman
+@date    2014-04-07
+
+This file defines an index of the businesses in a world keyed by business
+type and annotation. The index is built once per world so travelers can
+pick a business without scanning every node in the world.
+
+"""
+
+import os, sys
+import logging
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import random
+
+from mobdat.common.SpatialIndex import SpatialIndex
+
+logger = logging.getLogger(__name__)
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class BusinessIndex :
+
+    # -----------------------------------------------------------------
+    def __init__(self, world, cellsize = 100.0) :
+        """
+        Args:
+            world -- WorldInfo.WorldInfo
+            cellsize -- width of the grid cells used for nearest queries
+        """
+        self.CellSize = cellsize
+
+        # map (biztype, annotation) --> list of businesses, businesses are
+        # added in world order so random picks match a scan of the world;
+        # the annotation None holds every business of the type
+        self.Businesses = {}
+
+        # map (biztype, annotation) --> SpatialIndex, built on first use
+        self.Layout = {}
+
+        # map capsule name --> (x, y), many businesses share a capsule
+        self.CapsuleCoords = {}
+
+        for name, business in world.IterNodes(nodetype = 'Business') :
+            profile = business.BusinessProfile
+            self._AddBusiness((profile.BusinessType, None), business)
+            for word in profile.Annotations.iterkeys() :
+                self._AddBusiness((profile.BusinessType, word), business)
+
+        logger.info('indexed %d business classes', len(self.Businesses))
+
+    # -----------------------------------------------------------------
+    def _AddBusiness(self, key, business) :
+        if key not in self.Businesses :
+            self.Businesses[key] = []
+        self.Businesses[key].append(business)
+
+    # -----------------------------------------------------------------
+    def LocationCoord(self, entity) :
+        """
+        LocationCoord -- return the <x, y> center of the capsule where a person
+        or business resides, or None if the entity has no location
+
+        Args:
+            entity -- SocialNodes.Person or SocialNodes.Business
+        """
+        capsule = getattr(entity, 'ResidesAt', None)
+        if capsule is None :
+            return None
+
+        if capsule.Name not in self.CapsuleCoords :
+            points = [(m.Coord.X, m.Coord.Y) for m in getattr(capsule, 'Members', [])]
+            if points :
+                self.CapsuleCoords[capsule.Name] = (sum(p[0] for p in points) / float(len(points)),
+                                                    sum(p[1] for p in points) / float(len(points)))
+            else :
+                self.CapsuleCoords[capsule.Name] = None
+
+        return self.CapsuleCoords[capsule.Name]
+
+    # -----------------------------------------------------------------
+    def _FindLayout(self, key) :
+        if key not in self.Layout :
+            index = SpatialIndex(self.CellSize)
+            for business in self.Businesses.get(key, []) :
+                coord = self.LocationCoord(business)
+                if coord :
+                    index.AddNode(business, coord[0], coord[1])
+            self.Layout[key] = index
+
+        return self.Layout[key]
+
+    # -----------------------------------------------------------------
+    def FindBusinesses(self, biztype, bizclass = None) :
+        """
+        FindBusinesses -- return the list of businesses of a type with an
+        annotation, the list is shared and must not be modified
+
+        Args:
+            biztype -- SocialDecoration.BusinessType enum
+            bizclass -- string annotation, None for all businesses of the type
+        """
+        return self.Businesses.get((biztype, bizclass), [])
+
+    # -----------------------------------------------------------------
+    def PickBusiness(self, biztype, bizclass = None) :
+        """
+        PickBusiness -- return a random business of a type with an annotation
+        or None if there is no such business
+
+        Args:
+            biztype -- SocialDecoration.BusinessType enum
+            bizclass -- string annotation, None for all businesses of the type
+        """
+        businesses = self.Businesses.get((biztype, bizclass))
+        return random.choice(businesses) if businesses else None
+
+    # -----------------------------------------------------------------
+    def FindNearestBusinesses(self, biztype, bizclass, entity, count = 1) :
+        """
+        FindNearestBusinesses -- return up to count businesses of a type with an
+        annotation ordered by increasing distance from where an entity resides
+
+        Args:
+            biztype -- SocialDecoration.BusinessType enum
+            bizclass -- string annotation, None for all businesses of the type
+            entity -- SocialNodes.Person or SocialNodes.Business
+            count -- maximum number of businesses to return
+        """
+        coord = self.LocationCoord(entity)
+        if coord is None :
+            return []
+
+        return self._FindLayout((biztype, bizclass)).FindNearestNodes(coord[0], coord[1], count)
+
+    # -----------------------------------------------------------------
+    def PickNearbyBusiness(self, biztype, bizclass, entity, count = 1) :
+        """
+        PickNearbyBusiness -- return a random business from the count businesses
+        nearest to where an entity resides, falls back to a random business when
+        the entity has no location
+
+        Args:
+            biztype -- SocialDecoration.BusinessType enum
+            bizclass -- string annotation, None for all businesses of the type
+            entity -- SocialNodes.Person or SocialNodes.Business
+            count -- number of nearest businesses to choose from
+        """
+        nearest = self.FindNearestBusinesses(biztype, bizclass, entity, count)
+        return random.choice(nearest) if nearest else self.PickBusiness(biztype, bizclass)
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    # compare the index with a scan of the world and time both
+    #     python BusinessIndex.py <worldinfo.js>
+    import time
+    from mobdat.common.WorldInfo import WorldInfo
+    from mobdat.common.SocialDecoration import BusinessType, BusinessProfileDecoration
+
+    world = WorldInfo.LoadFromFile(sys.argv[1] if len(sys.argv) > 1 else 'world.js')
+
+    stime = time.time()
+    index = BusinessIndex(world)
+    print "built index over {0} classes in {1:.3f}s".format(len(index.Businesses), time.time() - stime)
+
+    queries = [(BusinessType.Food, 'coffee'), (BusinessType.Food, 'fastfood')] * 500
+
+    stime = time.time()
+    for biztype, bizclass in queries :
+        predicate = BusinessProfileDecoration.BusinessTypePred(biztype, bizclass)
+        expected = world.FindNodes(nodetype = 'Business', predicate = predicate)
+        assert expected == index.FindBusinesses(biztype, bizclass)
+    scan = time.time() - stime
+
+    stime = time.time()
+    for biztype, bizclass in queries :
+        index.PickBusiness(biztype, bizclass)
+    elapsed = time.time() - stime
+
+    print "{0} picks, scan {1:.3f}s, index {2:.3f}s".format(len(queries), scan, elapsed)
+
+    people = world.FindNodes(nodetype = 'Person')[:100]
+    for person in people :
+        home = index.LocationCoord(person)
+        nearest = index.FindNearestBusinesses(BusinessType.Food, 'coffee', person, 3)
+        dist = [(index.LocationCoord(b)[0] - home[0])**2 + (index.LocationCoord(b)[1] - home[1])**2 for b in nearest]
+        assert dist == sorted(dist)
+
+        allcoords = [index.LocationCoord(b) for b in index.FindBusinesses(BusinessType.Food, 'coffee')]
+        assert dist[0] == min((x - home[0])**2 + (y - home[1])**2 for x, y in allcoords)
@@ -59,6 +59,11 @@ class Constraint :
     def __init__(self) :
         self.ConstraintID = GenName('CONSTRAINT')
 
+    # -----------------------------------------------------------------
+    def Variables(self) :
+        """ Return the identifiers of the time variables the constraint reads or changes """
+        return ()
+
     # -----------------------------------------------------------------
     @staticmethod
     def fpcompare(v1, v2) :
@@ -88,6 +93,10 @@ class OrderConstraint(Constraint) :
         self.ID2 = id2
         self.Delta = delta
 
+    # -----------------------------------------------------------------
+    def Variables(self) :
+        return (self.ID1, self.ID2)
+
     # -----------------------------------------------------------------
     def Apply(self, varstore) :
         ev1 = varstore[self.ID1]
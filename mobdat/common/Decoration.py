@@ -69,6 +69,15 @@ class Decoration :
         """
         self.HostObject = obj
 
+    # -----------------------------------------------------------------
+    def MembersChanged(self) :
+        """
+        MembersChanged -- called when a member is added to or dropped from
+        the host object, decorations that keep state derived from the
+        members override this to discard it
+        """
+        pass
+
     # -----------------------------------------------------------------
     def Dump(self) : 
         result = dict()
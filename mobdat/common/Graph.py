@@ -51,10 +51,16 @@ from Decoration import *
 from Utilities import GenName
 
 import uuid, re
-import json
+import json, marshal
 
 logger = logging.getLogger(__name__)
 
+# binary snapshots are marshalled, the header identifies the format and
+# the version of python that wrote the snapshot since the marshal format
+# is not portable across python versions
+SnapshotMagic = 'mobdat-snapshot'
+SnapshotVersion = 2
+
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 def GenEdgeName(snode, enode) :
@@ -65,6 +71,73 @@ def GenEdgeName(snode, enode) :
 def GenNodeName(prefix = 'node') :
     return GenName(prefix)
 
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class ObjectSet(object) :
+    """
+    ObjectSet -- a list like container of graph objects that keeps the
+    objects in insertion order and supports constant time membership tests
+    and removal. Removing an object leaves a hole in the underlying list,
+    holes are squeezed out when the set is indexed or when they make up
+    half of the list.
+    """
+
+    _Hole = object()
+
+    # -----------------------------------------------------------------
+    def __init__(self, objects = []) :
+        self._Objects = []
+        self._Positions = {}
+        self._Holes = 0
+
+        for obj in objects :
+            self.append(obj)
+
+    # -----------------------------------------------------------------
+    def _Compact(self) :
+        self._Objects = [obj for obj in self._Objects if obj is not ObjectSet._Hole]
+        self._Positions = dict((obj, pos) for pos, obj in enumerate(self._Objects))
+        self._Holes = 0
+
+    # -----------------------------------------------------------------
+    def append(self, obj) :
+        if obj in self._Positions :
+            return
+
+        self._Positions[obj] = len(self._Objects)
+        self._Objects.append(obj)
+
+    # -----------------------------------------------------------------
+    def remove(self, obj) :
+        if obj not in self._Positions :
+            raise ValueError("object not in set")
+
+        self._Objects[self._Positions.pop(obj)] = ObjectSet._Hole
+        self._Holes += 1
+
+        if 2 * self._Holes > len(self._Objects) :
+            self._Compact()
+
+    # -----------------------------------------------------------------
+    def __contains__(self, obj) :
+        return obj in self._Positions
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self._Positions)
+
+    # -----------------------------------------------------------------
+    def __iter__(self) :
+        if not self._Holes :
+            return iter(self._Objects)
+        return (obj for obj in self._Objects if obj is not ObjectSet._Hole)
+
+    # -----------------------------------------------------------------
+    def __getitem__(self, index) :
+        if self._Holes :
+            self._Compact()
+        return self._Objects[index]
+
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class GraphObject :
@@ -75,8 +148,18 @@ class GraphObject :
         self.Decorations = {}
         self.Collections = {}
 
-        self.OutputEdges = []
-        self.InputEdges = []
+        self.OutputEdges = ObjectSet()
+        self.InputEdges = ObjectSet()
+
+        # map edge type name --> set of edges, in the order they were added
+        self.OutputEdgeTypes = {}
+        self.InputEdgeTypes = {}
+
+        # map end node --> list of output edges that reach it
+        self.OutputEdgeEnds = {}
+
+        # map attribute name --> value resolved by __getattr__
+        self.AttributeCache = {}
 
         self.AddDecoration(NodeTypeDecoration(self.__class__.__name__))
 
@@ -86,19 +169,53 @@ class GraphObject :
         __getattr__
 
         Look for a reference to the attribute among the collection of decorations
-        associated with the object and in the output edges. 
+        associated with the object and in the output edges. Resolved values are
+        cached until the decorations, collections or output edges of the object
+        change.
+        """
+
+        # special methods are never decorations, bail out quickly since python
+        # probes for these on every comparison of old style class instances
+        if attr.startswith('__') :
+            raise AttributeError(attr)
+
+        try :
+            return self.AttributeCache[attr]
+        except KeyError :
+            pass
+
+        value = self._ResolveAttribute(attr)
+        self.AttributeCache[attr] = value
+        return value
+
+    # -----------------------------------------------------------------
+    def __hash__(self) :
+        # graph objects are hashed by identity, defining this explicitly
+        # keeps python from probing __getattr__ for __hash__, __eq__ and
+        # __cmp__ every time an object is used as a dictionary key
+        return id(self)
+
+    # -----------------------------------------------------------------
+    def _ResolveAttribute(self, attr) :
+        """
+        _ResolveAttribute -- uncached lookup of a decoration or typed
+        output edge, this is the work that __getattr__ caches
+
+        Args:
+            attr -- string, attribute name
         """
 
         # First look for a decoration with the right name
+        # compare with None, testing an old style instance for truth makes
+        # python probe __nonzero__ and __len__ through __getattr__
         provider = self.FindDecorationProvider(attr)
-        if provider :
+        if provider is not None :
             return provider.Decorations[attr]
 
         # Next look for an edge with the right name, if there
         # are multiple then take the first one found
-        for edge in self.OutputEdges :
-            if edge.NodeType.Name == attr :
-                return edge.EndNode
+        if attr in self.OutputEdgeTypes :
+            return self.OutputEdgeTypes[attr][0].EndNode
 
         nodetype = self.__class__.__name__
         if 'NodeType' in self.Decorations :
@@ -107,69 +224,147 @@ class GraphObject :
         raise AttributeError("graph object %r of type %r has no attribute %r" % (self.Name, nodetype, attr))
 
     # -----------------------------------------------------------------
-    def _FindEdges(self, edgelist, edgetype) :
+    def InvalidateAttributeCache(self) :
+        """
+        InvalidateAttributeCache -- drop all values cached by __getattr__,
+        must be called whenever decorations, collections or output edges
+        of the object change
+        """
+        self.AttributeCache.clear()
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _EdgeType(edge) :
+        return edge.Decorations['NodeType'].Name
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _AddToEdgeTypes(edgetypes, edge, edgetype) :
+        if edgetype not in edgetypes :
+            edgetypes[edgetype] = ObjectSet()
+        edgetypes[edgetype].append(edge)
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _DropFromEdgeTypes(edgetypes, edge, edgetype) :
+        edges = edgetypes[edgetype]
+        edges.remove(edge)
+        if not edges :
+            del edgetypes[edgetype]
+
+    # -----------------------------------------------------------------
+    def _FindEdges(self, edgelist, edgetypes, edgetype) :
         """
         _FindEdges -- Build and return a list of edges that match the
         specified type.
 
         Args: 
             edgelist -- list of objects of type Graph.Edge
+            edgetypes -- dictionary mapping edge type name to edges
             edgetype -- string name of edge type
         """
-        edges = []
-        for edge in edgelist :
-            if edgetype and edge.NodeType.Name != edgetype :
-                continue
-            edges.append(edge)
-        return edges
+        if edgetype :
+            return list(edgetypes.get(edgetype, []))
+        return list(edgelist)
 
     def FindInputEdges(self, edgetype = None) :
-        return self._FindEdges(self.InputEdges, edgetype)
+        return self._FindEdges(self.InputEdges, self.InputEdgeTypes, edgetype)
 
     def FindOutputEdges(self, edgetype = None) :
-        return self._FindEdges(self.OutputEdges, edgetype)
+        return self._FindEdges(self.OutputEdges, self.OutputEdgeTypes, edgetype)
 
     # -----------------------------------------------------------------
-    def _IterEdges(self, edgelist, edgetype) :
+    def _IterEdges(self, edgelist, edgetypes, edgetype) :
         """
         _IterEdges -- Build and return an iterator over the edges of a
         specified type.
 
         Args: 
             edgelist -- list of objects of type Graph.Edge
+            edgetypes -- dictionary mapping edge type name to edges
             edgetype -- string name of edge type
         """
-        for edge in edgelist :
-            if edgetype and edge.NodeType.Name != edgetype :
-                continue
-            yield edge
+        if edgetype :
+            return iter(edgetypes.get(edgetype, []))
+        return iter(edgelist)
 
     def IterInputEdges(self, edgetype = None) :
-        return self._IterEdges(self.InputEdges, edgetype)
+        return self._IterEdges(self.InputEdges, self.InputEdgeTypes, edgetype)
 
     def IterOutputEdges(self, edgetype = None) :
-        return self._IterEdges(self.OutputEdges, edgetype)
+        return self._IterEdges(self.OutputEdges, self.OutputEdgeTypes, edgetype)
 
     # -----------------------------------------------------------------
     def AddInputEdge(self, edge) :
         self.InputEdges.append(edge)
+        self._AddToEdgeTypes(self.InputEdgeTypes, edge, self._EdgeType(edge))
 
     # -----------------------------------------------------------------
     def AddOutputEdge(self, edge) :
         self.OutputEdges.append(edge)
+        self._AddToEdgeTypes(self.OutputEdgeTypes, edge, self._EdgeType(edge))
+
+        if edge.EndNode not in self.OutputEdgeEnds :
+            self.OutputEdgeEnds[edge.EndNode] = []
+        self.OutputEdgeEnds[edge.EndNode].append(edge)
+
+        self.InvalidateAttributeCache()
+
+    # -----------------------------------------------------------------
+    def DropInputEdge(self, edge) :
+        self.InputEdges.remove(edge)
+        self._DropFromEdgeTypes(self.InputEdgeTypes, edge, self._EdgeType(edge))
+
+    # -----------------------------------------------------------------
+    def DropOutputEdge(self, edge) :
+        self.OutputEdges.remove(edge)
+        self._DropFromEdgeTypes(self.OutputEdgeTypes, edge, self._EdgeType(edge))
+
+        edges = self.OutputEdgeEnds[edge.EndNode]
+        edges.remove(edge)
+        if not edges :
+            del self.OutputEdgeEnds[edge.EndNode]
+
+        self.InvalidateAttributeCache()
+
+    # -----------------------------------------------------------------
+    def FindOutputEdgeTo(self, enode) :
+        """
+        FindOutputEdgeTo -- return the first output edge that ends at
+        the node or None if there is no such edge
+
+        Args:
+            enode -- object of type Graph.Node
+        """
+        edges = self.OutputEdgeEnds.get(enode)
+        return edges[0] if edges else None
+
+    # -----------------------------------------------------------------
+    def RetypeInputEdge(self, edge, oldtype) :
+        self._DropFromEdgeTypes(self.InputEdgeTypes, edge, oldtype)
+        self._AddToEdgeTypes(self.InputEdgeTypes, edge, self._EdgeType(edge))
+
+    # -----------------------------------------------------------------
+    def RetypeOutputEdge(self, edge, oldtype) :
+        self._DropFromEdgeTypes(self.OutputEdgeTypes, edge, oldtype)
+        self._AddToEdgeTypes(self.OutputEdgeTypes, edge, self._EdgeType(edge))
+        self.InvalidateAttributeCache()
 
     # -----------------------------------------------------------------
     def AddToCollection(self, collection) :
         self.Collections[collection.Name] = collection
+        self.InvalidateAttributeCache()
 
     # -----------------------------------------------------------------
     def DropFromCollection(self, collection) :
         del self.Collections[collection.Name]
+        self.InvalidateAttributeCache()
 
     # -----------------------------------------------------------------
     def AddDecoration(self, decoration) :
         decoration.HostObject = self
         self.Decorations[decoration.DecorationName] = decoration
+        self.InvalidateAttributeCache()
 
     # -----------------------------------------------------------------
     def FindDecorationProvider(self, attr) :
@@ -230,6 +425,10 @@ class Edge(GraphObject) :
     # -----------------------------------------------------------------
     def __init__(self, snode, enode, name = None) :
         if not name : name = GenEdgeName(snode, enode)
+
+        self.StartNode = None
+        self.EndNode = None
+
         GraphObject.__init__(self, name)
 
         self.StartNode = snode
@@ -238,6 +437,20 @@ class Edge(GraphObject) :
         snode.AddOutputEdge(self)
         enode.AddInputEdge(self)
 
+    # -----------------------------------------------------------------
+    def AddDecoration(self, decoration) :
+        # the end nodes file edges by type, loading an edge replaces
+        # the NodeType decoration after the edge is connected
+        if decoration.DecorationName != 'NodeType' or self.StartNode is None :
+            GraphObject.AddDecoration(self, decoration)
+            return
+
+        oldtype = self._EdgeType(self)
+        GraphObject.AddDecoration(self, decoration)
+
+        self.StartNode.RetypeOutputEdge(self, oldtype)
+        self.EndNode.RetypeInputEdge(self, oldtype)
+
     # -----------------------------------------------------------------
     def Dump(self) : 
         result = GraphObject.Dump(self)
@@ -269,12 +482,21 @@ class Node(GraphObject) :
     # -----------------------------------------------------------------
     def __init__(self, members = [], name = None, prefix = 'node') :
         if not name : name = GenNodeName(prefix)
+
+        self.Members = ObjectSet()
         GraphObject.__init__(self, name)
 
-        self.Members = []
         for member in members :
             self.AddMember(member)
 
+    # -----------------------------------------------------------------
+    def AddDecoration(self, decoration) :
+        GraphObject.AddDecoration(self, decoration)
+
+        # members inherit the decorations of the collection
+        for member in self.Members :
+            member.InvalidateAttributeCache()
+
     # -----------------------------------------------------------------
     def AddMember(self, member) :
         # add to the object the reference to the group
@@ -282,6 +504,7 @@ class Node(GraphObject) :
 
         # add to the group the reference to the object
         self.Members.append(member)
+        self._MembersChanged()
 
     # -----------------------------------------------------------------
     def DropMember(self, member) :
@@ -290,6 +513,13 @@ class Node(GraphObject) :
         
         # drop the object
         self.Members.remove(member)
+        self._MembersChanged()
+
+    # -----------------------------------------------------------------
+    def _MembersChanged(self) :
+        # let decorations discard anything derived from the members
+        for decoration in self.Decorations.itervalues() :
+            decoration.MembersChanged()
 
     # -----------------------------------------------------------------
     def Dump(self) :
@@ -323,6 +553,11 @@ class Graph :
         self.Edges = {}
         self.Nodes = {}
 
+        # secondary indexes keyed by the NodeType decoration name, these
+        # make typed queries proportional to the number of matching objects
+        self.NodeTypeMap = {}
+        self.EdgeTypeMap = {}
+
         for dtype in CommonDecorations :
             self.AddDecorationHandler(dtype)
 
@@ -341,6 +576,52 @@ class Graph :
         result['Edges'] = edges
 
         return result
+
+    # -----------------------------------------------------------------
+    def _DumpListToFile(self, fp, objects, indent, level) :
+        """
+        _DumpListToFile -- write a json list of the dumps of a sequence of
+        graph objects, formatted the way json.dump formats nested lists
+
+        Args:
+            fp -- file object opened for writing
+            objects -- iterator over objects of type Graph.GraphObject
+            indent -- integer indentation or None for compact output
+            level -- nesting depth of the list in the output
+        """
+        if indent :
+            inner = '\n' + ' ' * (indent * (level + 1))
+            outer = '\n' + ' ' * (indent * level)
+        else :
+            inner = outer = ''
+
+        fp.write('[')
+        separator = inner
+        for obj in objects :
+            text = json.dumps(obj.Dump(), indent=indent, ensure_ascii=True)
+            fp.write(separator)
+            fp.write(text.replace('\n', inner) if indent else text)
+            separator = ', ' + inner
+        fp.write(outer + ']' if separator != inner else ']')
+
+    # -----------------------------------------------------------------
+    def DumpToFile(self, fp, indent = None) :
+        """
+        DumpToFile -- write the json representation of the graph to a file,
+        the output is the same as json.dump(graph.Dump(), fp) but only one
+        node or edge is converted to a dictionary at a time
+
+        Args:
+            fp -- file object opened for writing
+            indent -- integer indentation for pretty printing, None for compact output
+        """
+        newline = '\n' + ' ' * indent if indent else ''
+
+        fp.write('{' + newline + '"Nodes": ')
+        self._DumpListToFile(fp, self.Nodes.itervalues(), indent, 1)
+        fp.write(', ' + newline + '"Edges": ')
+        self._DumpListToFile(fp, self.Edges.itervalues(), indent, 1)
+        fp.write('\n}' if indent else '}')
     
     # -----------------------------------------------------------------
     def Load(self, info) :
@@ -358,6 +639,175 @@ class Graph :
         for ninfo in info['Nodes'] :
             Node.LoadMembers(self, ninfo)
 
+    # =================================================================
+    # SNAPSHOT METHODS
+    # =================================================================
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _InternValue(value) :
+        """
+        _InternValue -- convert strings in a decoration dump to interned
+        byte strings, marshal writes an interned string once and refers
+        back to it on every later use
+
+        Args:
+            value -- a value from the dictionary representation of a decoration
+        """
+        if isinstance(value, unicode) :
+            try :
+                return intern(value.encode('ascii'))
+            except UnicodeEncodeError :
+                return value
+        elif isinstance(value, str) :
+            return intern(value)
+        elif isinstance(value, dict) :
+            return dict((Graph._InternValue(Graph._SnapshotKey(k)), Graph._InternValue(v)) for k, v in value.iteritems())
+        elif isinstance(value, (list, tuple)) :
+            return [Graph._InternValue(v) for v in value]
+
+        return value
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _SnapshotKey(key) :
+        """
+        _SnapshotKey -- convert a dictionary key the way json does so that
+        a world loaded from a snapshot matches the same world loaded from
+        the json world info file
+
+        Args:
+            key -- a dictionary key from the representation of a decoration
+        """
+        if isinstance(key, basestring) :
+            return key
+        elif key is True :
+            return 'true'
+        elif key is False :
+            return 'false'
+        elif key is None :
+            return 'null'
+        elif isinstance(key, float) :
+            return repr(key)
+
+        return str(key)
+
+    # -----------------------------------------------------------------
+    def _DumpSnapshotDecorations(self, obj, typeids, types) :
+        decorations = []
+        for decoration in obj.Decorations.itervalues() :
+            dinfo = decoration.Dump()
+            dtype = dinfo.pop('__TYPE__')
+            if dtype not in typeids :
+                typeids[dtype] = len(types)
+                types.append(dtype)
+
+            decorations.append((typeids[dtype], self._InternValue(dinfo)))
+
+        return decorations
+
+    # -----------------------------------------------------------------
+    def DumpSnapshot(self) :
+        """
+        DumpSnapshot -- build the compact representation of the graph that
+        is written to binary snapshots. Nodes and edges refer to each other by
+        their position in the snapshot and decorations carry an index into
+        the table of decoration types.
+        """
+        objids = {}
+        for node in self.Nodes.itervalues() :
+            objids[node] = len(objids)
+        for edge in self.Edges.itervalues() :
+            objids[edge] = len(objids)
+
+        types = []
+        typeids = {}
+
+        nodes = []
+        for node in self.Nodes.itervalues() :
+            decorations = self._DumpSnapshotDecorations(node, typeids, types)
+            members = [objids[member] for member in node.Members]
+            nodes.append((self._InternValue(node.Name), decorations, members))
+
+        edges = []
+        for edge in self.Edges.itervalues() :
+            decorations = self._DumpSnapshotDecorations(edge, typeids, types)
+            sid = objids[edge.StartNode]
+            eid = objids[edge.EndNode]
+            edges.append((self._InternValue(edge.Name), sid, eid, decorations))
+
+        return (types, nodes, edges)
+
+    # -----------------------------------------------------------------
+    def _LoadSnapshotDecorations(self, obj, decorations, handlers) :
+        for dtype, dinfo in decorations :
+            # if a handler for the decoration doesn't exist, we just skip loading
+            handler = handlers[dtype]
+            if handler :
+                obj.AddDecoration(handler.Load(self, dinfo))
+
+    # -----------------------------------------------------------------
+    def LoadSnapshot(self, snapshot) :
+        """
+        LoadSnapshot -- load the graph from the representation built by DumpSnapshot
+
+        Args:
+            snapshot -- tuple of decoration types, nodes and edges
+        """
+        types, nodes, edges = snapshot
+
+        handlers = []
+        for dtype in types :
+            handler = self.DecorationMap.get(dtype)
+            if not handler :
+                logger.info('no decoration handler found for type %s', dtype)
+            handlers.append(handler)
+
+        objects = []
+        for name, decorations, members in nodes :
+            node = Node(name = name)
+            self._LoadSnapshotDecorations(node, decorations, handlers)
+            self.AddNode(node)
+            objects.append(node)
+
+        for name, sid, eid, decorations in edges :
+            edge = Edge(objects[sid], objects[eid], name)
+            self._LoadSnapshotDecorations(edge, decorations, handlers)
+            self.AddEdge(edge)
+            objects.append(edge)
+
+        # as with Load, membership is set up after all objects exist
+        for index, (name, decorations, members) in enumerate(nodes) :
+            for mid in members :
+                objects[index].AddMember(objects[mid])
+
+    # -----------------------------------------------------------------
+    def SaveSnapshotFile(self, filename) :
+        with open(filename, 'wb') as fp :
+            marshal.dump((SnapshotMagic, SnapshotVersion, tuple(sys.version_info[:2])), fp, 2)
+            marshal.dump(self.DumpSnapshot(), fp, 2)
+
+    # -----------------------------------------------------------------
+    def LoadSnapshotFile(self, filename) :
+        """
+        LoadSnapshotFile -- load the graph from a binary snapshot, raises
+        ValueError before touching the graph if the snapshot was written
+        in an incompatible format
+
+        Args:
+            filename -- string name of the snapshot file
+        """
+        with open(filename, 'rb') as fp :
+            try :
+                header = marshal.load(fp)
+            except (EOFError, ValueError, TypeError) :
+                raise ValueError("%s is not a graph snapshot" % filename)
+
+            if header != (SnapshotMagic, SnapshotVersion, tuple(sys.version_info[:2])) :
+                raise ValueError("%s is not a compatible graph snapshot" % filename)
+
+            self.LoadSnapshot(marshal.load(fp))
+
     # =================================================================
     # DECORATION METHODS
     # =================================================================
@@ -381,6 +831,33 @@ class Graph :
     # UTILITY METHODS
     # =================================================================
 
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _ObjectType(obj) :
+        """
+        _ObjectType -- return the name of the type of a node or edge, the
+        NodeType decoration is always attached directly to the object so
+        there is no need to search the collections
+        """
+        return obj.Decorations['NodeType'].Name
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _AddToTypeMap(typemap, obj) :
+        otype = Graph._ObjectType(obj)
+        if otype not in typemap :
+            typemap[otype] = {}
+        typemap[otype][obj.Name] = obj
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def _DropFromTypeMap(typemap, obj) :
+        otype = Graph._ObjectType(obj)
+        if otype in typemap :
+            typemap[otype].pop(obj.Name, None)
+            if not typemap[otype] :
+                del typemap[otype]
+
     # -----------------------------------------------------------------
     def FindByName(self, name) :
         if name in self.Nodes :
@@ -396,7 +873,13 @@ class Graph :
 
     # -----------------------------------------------------------------
     def AddNode(self, node) :
+        # replacing a node with the same name must not leave the old
+        # node behind in the type map
+        if node.Name in self.Nodes :
+            self._DropFromTypeMap(self.NodeTypeMap, self.Nodes[node.Name])
+
         self.Nodes[node.Name] = node
+        self._AddToTypeMap(self.NodeTypeMap, node)
 
     # -----------------------------------------------------------------
     def DropNode(self, node) :
@@ -417,6 +900,7 @@ class Graph :
         for edge in node.OutputEdges[:] :
             self.DropEdge(edge)
 
+        self._DropFromTypeMap(self.NodeTypeMap, node)
         del self.Nodes[node.Name]
 
     # -----------------------------------------------------------------
@@ -466,10 +950,8 @@ class Graph :
             pattern -- string representing a regular expression
             nodetype -- string name of a node type
         """
-        for name, node in self.Nodes.iteritems() :
-            if nodetype and node.NodeType.Name != nodetype :
-                continue
-
+        nodes = self.NodeTypeMap.get(nodetype, {}) if nodetype else self.Nodes
+        for name, node in nodes.iteritems() :
             if pattern and not re.match(pattern, name) :
                 continue
 
@@ -484,7 +966,11 @@ class Graph :
 
     # -----------------------------------------------------------------
     def AddEdge(self, edge) :
+        if edge.Name in self.Edges :
+            self._DropFromTypeMap(self.EdgeTypeMap, self.Edges[edge.Name])
+
         self.Edges[edge.Name] = edge
+        self._AddToTypeMap(self.EdgeTypeMap, edge)
         return True
 
     # -----------------------------------------------------------------
@@ -494,9 +980,10 @@ class Graph :
         for collection in edge.Collections.values() :
             collection.DropMember(edge)
 
-        edge.StartNode.OutputEdges.remove(edge)
-        edge.EndNode.InputEdges.remove(edge)
+        edge.StartNode.DropOutputEdge(edge)
+        edge.EndNode.DropInputEdge(edge)
 
+        self._DropFromTypeMap(self.EdgeTypeMap, edge)
         del self.Edges[edge.Name]
         return True
 
@@ -528,13 +1015,7 @@ class Graph :
             edgetype -- string name of a edge type
         """
         edges = []
-        for name, edge in self.Edges.iteritems() :
-            if edgetype and edge.NodeType.Name != edgetype :
-                continue
-
-            if pattern and not re.match(pattern, name) :
-                continue
-
+        for name, edge in self.IterEdges(pattern, edgetype) :
             edges.append(edge)
 
         return edges
@@ -546,10 +1027,8 @@ class Graph :
             pattern -- string representing a regular expression
             edgetype -- string name of a edge type
         """
-        for name, edge in self.Edges.iteritems() :
-            if edgetype and edge.NodeType.Name != edgetype :
-                continue
-
+        edges = self.EdgeTypeMap.get(edgetype, {}) if edgetype else self.Edges
+        for name, edge in edges.iteritems() :
             if pattern and not re.match(pattern, name) :
                 continue
 
@@ -575,17 +1054,15 @@ class Graph :
             
     # -----------------------------------------------------------------
     def FindEdgeBetweenNodes(self, node1, node2) :
-        for e in node1.OutputEdges :
-            if e.EndNode == node2 :
-                return e
-        return None
+        return node1.FindOutputEdgeTo(node2)
 
 
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 if __name__ == '__main__' :
+    import time
     from mobdat.common.Utilities import GenNameFromCoordinates
-    from mobdat.common.Decoration import Decoration, CoordDecoration
+    from mobdat.common.LayoutDecoration import CoordDecoration
 
     # -----------------------------------------------------------------
     class TestDecoration(Decoration) :
@@ -642,17 +1119,17 @@ if __name__ == '__main__' :
     net1.AddDecorationHandler(TestDecoration)
     net1.AddDecorationHandler(EdgeTypeDecoration)
 
-    edges1 = Collection(name = 'type1edges')
+    edges1 = Node(name = 'type1edges')
     edges1.AddDecoration(EdgeTypeDecoration('type1', 25))
-    net1.AddCollection(edges1)
+    net1.AddNode(edges1)
 
-    edges2 = Collection(name = 'type2edges')
+    edges2 = Node(name = 'type2edges')
     edges2.AddDecoration(EdgeTypeDecoration('type2', 5))
-    net1.AddCollection(edges2)
+    net1.AddNode(edges2)
 
     for x in range(0, 5) :
         for y in range(0, 5) :
-            node = Node(GenNameFromCoordinates(x, y))
+            node = Node(name = GenNameFromCoordinates(x, y))
             node.AddDecoration(CoordDecoration(x, y))
             net1.AddNode(node)
             if x > 0 :
@@ -673,17 +1150,128 @@ if __name__ == '__main__' :
     net2 = Graph()
     net2.AddDecorationHandler(TestDecoration)
     net2.AddDecorationHandler(EdgeTypeDecoration)
+    net2.AddDecorationHandler(CoordDecoration)
 
     net2.Load(net1.Dump())
 
     # print json.dumps(net2.Dump(),indent=2)
     for e in net2.Nodes.itervalues() :
+        if 'TestDecoration' not in e.Decorations : continue
         print "{0} = {1}".format(e.Name, e.TestDecoration.Value1)
 
     print "type1edges"
-    for e in net2.Collections['type1edges'].Members :
+    for e in net2.Nodes['type1edges'].Members :
         print "{0} has weight {1}".format(e.Name, e.EdgeType.Weight)
 
     print "type2edges"
-    for e in net2.Collections['type2edges'].Members :
+    for e in net2.Nodes['type2edges'].Members :
         print "{0} has weight {1}".format(e.Name, e.EdgeType.Weight)
+
+    # -----------------------------------------------------------------
+    # microbenchmark for attribute access, compare the original linear
+    # scan resolution, the typed edge map resolution and the cached lookup
+    # -----------------------------------------------------------------
+    net3 = Graph()
+
+    kinds = Node(name = 'kinds')
+    kinds.AddDecoration(EdgeTypeDecoration('kind', 1))
+    net3.AddNode(kinds)
+
+    objects = []
+    for i in range(0, 1000) :
+        node = Node(name = 'obj{0}'.format(i))
+        node.AddDecoration(CoordDecoration(i, i))
+        node.AddDecoration(TestDecoration(i, i))
+        net3.AddNode(node)
+        kinds.AddMember(node)
+        objects.append(node)
+
+    # give each object a handful of typed output edges, the edge type is
+    # the NodeType of the edge so use subclasses to name them
+    class HomeEdge(Edge) : pass
+    class WorkEdge(Edge) : pass
+    class SchoolEdge(Edge) : pass
+
+    for i, node in enumerate(objects) :
+        for etype in [SchoolEdge, HomeEdge, WorkEdge] :
+            net3.AddEdge(etype(node, objects[(i + 1) % len(objects)]))
+
+    # -----------------------------------------------------------------
+    def LinearIsTrue(obj) :
+        """
+        LinearIsTrue -- truth test of a graph object as the original
+        resolution did it, python probes an old style instance for
+        __nonzero__ and __len__ and both probes went through __getattr__
+        """
+        for special in ['__nonzero__', '__len__'] :
+            try :
+                LinearResolveAttribute(obj, special)
+            except AttributeError :
+                pass
+
+        return True
+
+    # -----------------------------------------------------------------
+    def LinearResolveAttribute(obj, attr) :
+        """
+        LinearResolveAttribute -- copy of the original resolution that
+        scans the collections and the output edges on every access and
+        resolves the type of each edge and the truth of the provider with
+        the same uncached lookup, this is the baseline for the typed edge
+        maps and the attribute cache
+        """
+        provider = None
+        if attr in obj.Decorations :
+            provider = obj
+        else :
+            for coll in obj.Collections.itervalues() :
+                if attr in coll.Decorations :
+                    provider = coll
+                    break
+
+        if provider is not None and LinearIsTrue(provider) :
+            return provider.Decorations[attr]
+
+        for edge in obj.OutputEdges :
+            if LinearResolveAttribute(edge, 'NodeType').Name == attr :
+                return edge.EndNode
+
+        raise AttributeError("graph object %r has no attribute %r" % (obj.Name, attr))
+
+    attrs = ['Coord', 'TestDecoration', 'EdgeType', 'WorkEdge']
+    iterations = 100
+
+    for attr in attrs :
+        for node in objects :
+            assert getattr(node, attr) is node._ResolveAttribute(attr)
+            assert getattr(node, attr) is LinearResolveAttribute(node, attr)
+
+    stime = time.time()
+    for i in range(0, iterations) :
+        for node in objects :
+            for attr in attrs :
+                LinearResolveAttribute(node, attr)
+    linear = time.time() - stime
+
+    # every access goes through __getattr__, clear the cache first so the
+    # uncached lookups pay the same dispatch as the cached ones
+    stime = time.time()
+    for i in range(0, iterations) :
+        for node in objects :
+            for attr in attrs :
+                node.AttributeCache.clear()
+                getattr(node, attr)
+    uncached = time.time() - stime
+
+    stime = time.time()
+    for i in range(0, iterations) :
+        for node in objects :
+            for attr in attrs :
+                getattr(node, attr)
+    cached = time.time() - stime
+
+    count = iterations * len(objects) * len(attrs)
+    print "attribute access, {0} lookups".format(count)
+    print "linear:   {0:.3f}s ({1:.2f}us per lookup)".format(linear, 1.0e6 * linear / count)
+    print "uncached: {0:.3f}s ({1:.2f}us per lookup)".format(uncached, 1.0e6 * uncached / count)
+    print "cached:   {0:.3f}s ({1:.2f}us per lookup)".format(cached, 1.0e6 * cached / count)
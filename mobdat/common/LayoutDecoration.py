@@ -45,7 +45,7 @@ sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","p
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
-import random
+import random, heapq
 
 from mobdat.common.Decoration import Decoration, CommonDecorations
 
@@ -318,25 +318,6 @@ class BusinessLocationDecoration(Decoration) :
     def CustomerCapacity(self) :
         return self.EndPointCount * self.HostObject.BusinessLocationProfile.CustomersPerNode
 
-    # -----------------------------------------------------------------
-    def Fitness(self, business) :
-        ecount = self.PeakEmployeeCount
-        if business.FindDecorationProvider('EmploymentProfile') :
-            ecount += business.EmploymentProfile.PeakEmployeeCount()
-
-        ccount = self.PeakCustomerCount
-        if business.FindDecorationProvider('ServiceProfile') :
-            ccount += business.ServiceProfile.PeakServiceCount()
-
-        if ecount >= self.EmployeeCapacity : return 0
-        if ccount >= self.CustomerCapacity : return 0
-
-        invweight = (ecount / self.EmployeeCapacity + ccount / self.CustomerCapacity) / 2.0
-        pfitness = self.HostObject.BusinessLocationProfile.Fitness(business)
-        fitness = restrict(random.gauss(1.0 - invweight, 0.1), 0, 1.0) * pfitness
-
-        return fitness
-
     # -----------------------------------------------------------------
     def AddBusiness(self, business) :
         """
@@ -410,6 +391,7 @@ class ResidentialLocationDecoration(Decoration) :
 
         self.ResidentCount = 0
         self.ResidenceList = {}
+        self.CapsuleQueue = None
 
     # -----------------------------------------------------------------
     @property
@@ -429,14 +411,6 @@ class ResidentialLocationDecoration(Decoration) :
     def ResidentCapacity(self) :
         return self.EndPointCount * self.HostObject.ResidentialLocationProfile.ResidentsPerNode
 
-    # -----------------------------------------------------------------
-    def Fitness(self, person) :
-        if self.ResidentCount >= self.ResidentCapacity : return 0
-
-        invweight = self.ResidentCount / self.ResidentCapacity
-        pfitness = self.HostObject.ResidentialLocationProfile.Fitness(person)
-        return restrict(random.gauss(1.0 - invweight, 0.1), 0, 1.0) * pfitness
-
     # -----------------------------------------------------------------
     def AddResident(self, person) :
         """
@@ -446,24 +420,27 @@ class ResidentialLocationDecoration(Decoration) :
         Args:
             person -- SocialNodes.Person
         """
-        bestcnt = self.HostObject.ResidentialLocationProfile.ResidentsPerNode + 1
-        bestfit = None
+        # capsules wait in a heap ordered by the number of people assigned
+        # to them and then by their position in the location, the first
+        # unused capsule comes first and otherwise the least loaded one, this
+        # is really just a way of balancing load across residential units
+        if self.CapsuleQueue is None :
+            self.CapsuleQueue = []
+            for position, capsule in enumerate(self.HostObject.Members) :
+                count = len(self.ResidenceList.get(capsule.Name, []))
+                self.CapsuleQueue.append((count, position, capsule))
+            heapq.heapify(self.CapsuleQueue)
 
-        # this just goes through the entire list of capsules in the residential
-        # location and finds the one with the least number of people assigned to
-        # it, really just a way of balancing load across residential units
-        for capsule in self.HostObject.Members :
-            if capsule.Name not in self.ResidenceList :
-                self.ResidenceList[capsule.Name] = []
-                bestfit = capsule
-                break
-            elif len(self.ResidenceList[capsule.Name]) < bestcnt :
-                bestcnt = len(self.ResidenceList[capsule.Name])
+        bestfit = None
+        if self.CapsuleQueue :
+            count, position, capsule = self.CapsuleQueue[0]
+            if count <= self.HostObject.ResidentialLocationProfile.ResidentsPerNode :
                 bestfit = capsule
+                heapq.heapreplace(self.CapsuleQueue, (count + 1, position, capsule))
 
         if bestfit :
             self.ResidentCount += 1
-            self.ResidenceList[bestfit.Name].append(person)
+            self.ResidenceList.setdefault(bestfit.Name, []).append(person)
 
         # this returns a Capsle
         return bestfit
@@ -482,9 +459,15 @@ class ResidentialLocationDecoration(Decoration) :
 
         self.ResidenceList[nodename].append(person)
         self.ResidentCount += 1
+        self.CapsuleQueue = None  # so we'll rebuild the queue when needed
 
         return nodename
 
+    # -----------------------------------------------------------------
+    def MembersChanged(self) :
+        # capsules were added to or dropped from the location
+        self.CapsuleQueue = None
+
     # -----------------------------------------------------------------
     def Dump(self) :
         return Decoration.Dump(self)
@@ -0,0 +1,382 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+@file    PopulationStore.py
+@author  Mic Bowman
+@date    2014-04-10
+
+This file defines a columnar store for the people in a world. Each person
+is a row in a set of integer arrays that index tables of the profiles,
+employers, residences, jobs and vehicle types shared by many people. The
+store is built from the Person nodes of a world and can write them back,
+PersonView gives the attributes existing code reads from a Person node.
+
+"""
+
+import os, sys
+import logging
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import json
+from array import array
+
+from mobdat.common import Graph, SocialNodes, SocialDecoration
+from mobdat.common.Decoration import NodeTypeDecoration
+
+logger = logging.getLogger(__name__)
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class ValueTable :
+    """
+    ValueTable -- the distinct values of one column, a column holds the
+    index of the value or -1 for none
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self) :
+        self.Values = []
+        self.Index = {}
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self.Values)
+
+    # -----------------------------------------------------------------
+    def Intern(self, key, value) :
+        """
+        Intern -- return the index of the value with the key, adding the
+        value if the key is new
+
+        Args:
+            key -- hashable key that identifies the value
+            value -- the value, None is stored as -1
+        """
+        if value is None :
+            return -1
+
+        index = self.Index.get(key)
+        if index is None :
+            index = self.Index[key] = len(self.Values)
+            self.Values.append(value)
+
+        return index
+
+    # -----------------------------------------------------------------
+    def Get(self, index) :
+        return self.Values[index] if index >= 0 else None
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class PersonView :
+    """
+    PersonView -- the attributes of a Person node for one row of the store,
+    this is what Traveler, Trip and BusinessIndex read from a person
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, store, index) :
+        """
+        Args:
+            store -- PopulationStore
+            index -- integer row of the person
+        """
+        self.Store = store
+        self.Index = index
+
+        self.Name = store.Names[index]
+        self.EmployedBy = store.Employers.Get(store.Employer[index])
+        self.ResidesAt = store.Residences.Get(store.Residence[index])
+        self.JobDescription = store.Jobs.Get(store.Job[index])
+        self.Vehicle = store.FindVehicle(index)
+
+    # -----------------------------------------------------------------
+    def __str__(self) :
+        return self.Name
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class PopulationStore :
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def FromWorld(world, drop = False) :
+        """
+        FromWorld -- build a store from the Person nodes of a world
+
+        Args:
+            world -- WorldInfo.WorldInfo
+            drop -- boolean, remove the Person nodes from the world once stored
+        """
+        store = PopulationStore()
+
+        people = world.FindNodes(nodetype = 'Person')
+        for person in people :
+            store.AddPersonNode(person)
+
+        if drop :
+            for person in people :
+                world.DropNode(person)
+
+        logger.info('stored %d people with %d jobs, %d employers and %d residences',
+                    len(store), len(store.Jobs), len(store.Employers), len(store.Residences))
+        return store
+
+    # -----------------------------------------------------------------
+    def __init__(self) :
+        self.Names = []
+        self.NameIndex = {}
+
+        # tables of the values shared by many people, nodes are keyed by name
+        # and jobs by their dumped form since every person has a copy
+        self.Profiles = ValueTable()
+        self.Employers = ValueTable()
+        self.Residences = ValueTable()
+        self.Jobs = ValueTable()
+        self.VehicleTypes = ValueTable()
+
+        # the columns, one entry per person
+        self.Profile = array('i')
+        self.Employer = array('i')
+        self.Residence = array('i')
+        self.Job = array('i')
+        self.VehicleType = array('i')
+
+        # vehicle names are 'veh' + vehicle type + number, the number is
+        # kept in the column and names that do not fit are kept in the map
+        self.VehicleNumber = array('l')
+        self.VehicleNames = {}
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self.Names)
+
+    # -----------------------------------------------------------------
+    def __contains__(self, name) :
+        return name in self.NameIndex
+
+    # -----------------------------------------------------------------
+    def AddPerson(self, name, profile = None, employer = None, residence = None, job = None, vehiclename = None, vehicletype = None) :
+        """
+        AddPerson -- add a row for a person, returns the index of the row
+
+        Args:
+            name -- string name of the person
+            profile -- Graph.Node, the person profile
+            employer -- Graph.Node, the business that employs the person
+            residence -- Graph.Node, the location where the person lives
+            job -- SocialDecoration.JobDescription
+            vehiclename -- string name of the vehicle
+            vehicletype -- string name of the vehicle type
+        """
+        if name in self.NameIndex :
+            raise ValueError('person {0} is already in the store'.format(name))
+
+        index = len(self.Names)
+        self.Names.append(name)
+        self.NameIndex[name] = index
+
+        self.Profile.append(self.Profiles.Intern(profile.Name if profile else None, profile))
+        self.Employer.append(self.Employers.Intern(employer.Name if employer else None, employer))
+        self.Residence.append(self.Residences.Intern(residence.Name if residence else None, residence))
+        self.Job.append(self.Jobs.Intern(json.dumps(job.Dump(), sort_keys = True) if job else None, job))
+        self.VehicleType.append(self.VehicleTypes.Intern(vehicletype, vehicletype))
+
+        number = -1
+        if vehiclename is not None :
+            prefix = 'veh' + (vehicletype or '')
+            suffix = vehiclename[len(prefix):]
+            if vehiclename.startswith(prefix) and suffix.isdigit() and str(int(suffix)) == suffix :
+                number = int(suffix)
+            else :
+                self.VehicleNames[index] = vehiclename
+        self.VehicleNumber.append(number)
+
+        return index
+
+    # -----------------------------------------------------------------
+    def AddPersonNode(self, person) :
+        """
+        AddPersonNode -- add a row for a Person node, the person keeps the
+        first profile it is a member of, its job, vehicle and the ends of
+        its EmployedBy and ResidesAt edges
+
+        Args:
+            person -- Graph.Node (NodeType == Person) or SocialNodes.Person
+        """
+        profile = None
+        for collection in person.Collections.itervalues() :
+            if collection.Decorations['NodeType'].Name == 'PersonProfile' :
+                profile = collection
+                break
+
+        employer = person.OutputEdgeTypes.get('EmployedBy')
+        residence = person.OutputEdgeTypes.get('ResidesAt')
+
+        job = person.Decorations.get(SocialDecoration.JobDescriptionDecoration.DecorationName)
+        vehicle = person.Decorations.get(SocialDecoration.VehicleDecoration.DecorationName)
+
+        return self.AddPerson(person.Name, profile,
+                              employer[0].EndNode if employer else None,
+                              residence[0].EndNode if residence else None,
+                              job.JobDescription if job else None,
+                              vehicle.VehicleName if vehicle else None,
+                              vehicle.VehicleType if vehicle else None)
+
+    # -----------------------------------------------------------------
+    def FindVehicle(self, index) :
+        """
+        FindVehicle -- return a VehicleDecoration for the vehicle of a person
+        or None if the person has no vehicle
+        """
+        vtype = self.VehicleTypes.Get(self.VehicleType[index])
+        if index in self.VehicleNames :
+            return SocialDecoration.VehicleDecoration(self.VehicleNames[index], vtype)
+        if self.VehicleNumber[index] < 0 :
+            return None
+        return SocialDecoration.VehicleDecoration('veh' + (vtype or '') + str(self.VehicleNumber[index]), vtype)
+
+    # -----------------------------------------------------------------
+    def PersonAt(self, index) :
+        return PersonView(self, index)
+
+    # -----------------------------------------------------------------
+    def FindPerson(self, name) :
+        index = self.NameIndex.get(name)
+        return PersonView(self, index) if index is not None else None
+
+    # -----------------------------------------------------------------
+    def IterPeople(self) :
+        for index, name in enumerate(self.Names) :
+            yield name, PersonView(self, index)
+
+    # -----------------------------------------------------------------
+    def ExportToWorld(self, world) :
+        """
+        ExportToWorld -- add a Person node for every person in the store to
+        a world, the profiles, employers and residences are found by name
+
+        Args:
+            world -- WorldInfo.WorldInfo
+        """
+        for index, name in enumerate(self.Names) :
+            profile = self.Profiles.Get(self.Profile[index])
+            if profile is not None :
+                person = SocialNodes.Person(name, world.Nodes[profile.Name])
+            else :
+                person = Graph.Node(name = name)
+                person.AddDecoration(NodeTypeDecoration('Person'))
+
+            job = self.Jobs.Get(self.Job[index])
+            if job is not None :
+                person.SetJob(job)
+
+            vehicle = self.FindVehicle(index)
+            if vehicle is not None :
+                person.AddDecoration(vehicle)
+
+            world.AddPerson(person)
+
+            employer = self.Employers.Get(self.Employer[index])
+            if employer is not None :
+                world.SetEmployer(person, world.Nodes[employer.Name])
+
+            residence = self.Residences.Get(self.Residence[index])
+            if residence is not None :
+                world.SetResidence(person, world.Nodes[residence.Name])
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    # check that the store round trips the people of a world, then compare
+    # the memory used by a population of Person nodes and by the store, each
+    # population is built in its own process
+    #     python PopulationStore.py <worldinfo.js> [people]
+    import resource, multiprocessing
+    from mobdat.common.WorldInfo import WorldInfo
+
+    # -----------------------------------------------------------------
+    def DumpPerson(person) :
+        decorations = sorted(json.dumps(d.Dump(), sort_keys = True) for d in person.Decorations.itervalues())
+        edges = sorted(json.dumps(e.Dump(), sort_keys = True) for e in person.OutputEdges)
+        collections = sorted(person.Collections)
+        return (person.Name, decorations, edges, collections)
+
+    # -----------------------------------------------------------------
+    def BuildPopulation(mode, infofile, count, results) :
+        world = WorldInfo.LoadFromFile(infofile)
+        store = PopulationStore.FromWorld(world, drop = True)
+        people = [store.PersonAt(i) for i in range(0, len(store))]
+        base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+        template = PopulationStore()
+        for i in xrange(0, count) :
+            index = i % len(people)
+            source = people[index]
+            name = '{0}x{1}'.format(source.Name, i)
+            vehicle = source.Vehicle
+            if mode == 'store' :
+                template.AddPerson(name, store.Profiles.Get(store.Profile[index]), source.EmployedBy, source.ResidesAt,
+                                   source.JobDescription, vehicle.VehicleName + 'x', vehicle.VehicleType)
+            else :
+                person = SocialNodes.Person(name, store.Profiles.Get(store.Profile[index]))
+                person.SetJob(source.JobDescription)
+                person.AddDecoration(SocialDecoration.VehicleDecoration(vehicle.VehicleName + 'x', vehicle.VehicleType))
+                world.AddPerson(person)
+                world.SetEmployer(person, source.EmployedBy)
+                world.SetResidence(person, source.ResidesAt)
+
+        results.put(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - base)
+
+    infofile = sys.argv[1] if len(sys.argv) > 1 else 'world.js'
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    world = WorldInfo.LoadFromFile(infofile)
+    before = sorted(DumpPerson(person) for person in world.FindNodes(nodetype = 'Person'))
+    store = PopulationStore.FromWorld(world, drop = True)
+    remaining = len(world.FindNodes(nodetype = 'Person'))
+    store.ExportToWorld(world)
+    after = sorted(DumpPerson(person) for person in world.FindNodes(nodetype = 'Person'))
+    print "{0} people, {1} left in the world after the store was built, round trip {2}".format(
+        len(store), remaining, 'matches' if before == after else 'differs')
+
+    for mode in ['graph', 'store'] :
+        results = multiprocessing.Queue()
+        proc = multiprocessing.Process(target = BuildPopulation, args = (mode, infofile, count, results))
+        proc.start()
+        growth = results.get()
+        proc.join()
+        print "{0:6s} {1} people, {2}KB, {3:.0f} bytes per person".format(mode, count, growth, 1024.0 * growth / count)
@@ -0,0 +1,219 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+@file    RoadNetwork.py
+@author  Mic Bowman
+@date    2014-04-03
+
+This file defines a routing engine over the Road edges of a world. It
+computes free flow travel times between locations with Dijkstra's
+algorithm and caches the shortest path trees it computes.
+
+"""
+
+import os, sys
+import logging
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import math, heapq
+from array import array
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class RoadNetwork :
+    Unreachable = float('inf')
+
+    # -----------------------------------------------------------------
+    def __init__(self, world, timescale = 1.0 / 3600.0, maxtrees = 1024) :
+        """
+        Args:
+            world -- WorldInfo.WorldInfo with Road edges between Coord nodes
+            timescale -- hours of world time per unit of distance / speed
+            maxtrees -- maximum number of shortest path trees kept in the cache
+        """
+        self.TimeScale = timescale
+        self.MaximumTrees = maxtrees
+
+        # map node name --> integer index used in the adjacency lists
+        self.NodeIndex = {}
+
+        # Adjacency[i] is a list of (j, hours) for the roads leaving node i
+        self.Adjacency = []
+
+        # map tuple of source node indexes --> array of hours to every node,
+        # kept in least recently used order
+        self.TreeCache = OrderedDict()
+
+        self.CacheHits = 0
+        self.CacheMisses = 0
+
+        self._BuildAdjacency(world)
+
+    # -----------------------------------------------------------------
+    def _NodeID(self, name) :
+        if name not in self.NodeIndex :
+            self.NodeIndex[name] = len(self.Adjacency)
+            self.Adjacency.append([])
+        return self.NodeIndex[name]
+
+    # -----------------------------------------------------------------
+    def _BuildAdjacency(self, world) :
+        count = 0
+        for name, road in world.IterEdges(edgetype = 'Road') :
+            snode = road.StartNode
+            enode = road.EndNode
+
+            length = math.sqrt((enode.Coord.X - snode.Coord.X)**2 + (enode.Coord.Y - snode.Coord.Y)**2)
+            speed = road.RoadType.Speed
+            if speed <= 0 :
+                logger.warn('road %s has no speed, skipping', name)
+                continue
+
+            sid = self._NodeID(snode.Name)
+            eid = self._NodeID(enode.Name)
+            self.Adjacency[sid].append((eid, self.TimeScale * length / speed))
+            count += 1
+
+        logger.info('built road network with %d nodes and %d roads', len(self.Adjacency), count)
+
+    # -----------------------------------------------------------------
+    def _Sources(self, location) :
+        """
+        _Sources -- return the indexes of the network nodes for a location,
+        a location is either a node on the road network or a collection such
+        as a LocationCapsule whose members are on the road network
+
+        Args:
+            location -- Graph.Node
+        """
+        if location.Name in self.NodeIndex :
+            return (self.NodeIndex[location.Name],)
+
+        members = getattr(location, 'Members', [])
+        return tuple(sorted(self.NodeIndex[m.Name] for m in members if m.Name in self.NodeIndex))
+
+    # -----------------------------------------------------------------
+    def _ShortestPathTree(self, sources) :
+        """
+        _ShortestPathTree -- run Dijkstra from a set of source nodes and return
+        an array with the travel time to every node in the network
+
+        Args:
+            sources -- tuple of node indexes
+        """
+        dist = array('d', [RoadNetwork.Unreachable]) * len(self.Adjacency)
+        queue = []
+        for sid in sources :
+            dist[sid] = 0.0
+            queue.append((0.0, sid))
+
+        adjacency = self.Adjacency
+        while queue :
+            d, nid = heapq.heappop(queue)
+            if d > dist[nid] :
+                continue
+
+            for eid, hours in adjacency[nid] :
+                nd = d + hours
+                if nd < dist[eid] :
+                    dist[eid] = nd
+                    heapq.heappush(queue, (nd, eid))
+
+        return dist
+
+    # -----------------------------------------------------------------
+    def _FindTree(self, sources) :
+        tree = self.TreeCache.pop(sources, None)
+        if tree is None :
+            self.CacheMisses += 1
+            tree = self._ShortestPathTree(sources)
+            if len(self.TreeCache) >= self.MaximumTrees :
+                self.TreeCache.popitem(last = False)
+        else :
+            self.CacheHits += 1
+
+        self.TreeCache[sources] = tree
+        return tree
+
+    # -----------------------------------------------------------------
+    def ComputeTravelTime(self, src, dst) :
+        """
+        ComputeTravelTime -- return the free flow travel time in hours between
+        two locations or None if there is no route between them
+
+        Args:
+            src -- Graph.Node, a road network node or a capsule of end points
+            dst -- Graph.Node, a road network node or a capsule of end points
+        """
+        sources = self._Sources(src)
+        targets = self._Sources(dst)
+        if not sources or not targets :
+            return None
+
+        tree = self._FindTree(sources)
+        hours = min(tree[tid] for tid in targets)
+        return hours if hours < RoadNetwork.Unreachable else None
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    # measure the query rate for travel times between the capsules of a world
+    #     python RoadNetwork.py <worldinfo.js>
+    import random, time
+    from mobdat.common.WorldInfo import WorldInfo
+
+    world = WorldInfo.LoadFromFile(sys.argv[1] if len(sys.argv) > 1 else 'world.js')
+
+    stime = time.time()
+    network = RoadNetwork(world)
+    print "built network with {0} nodes in {1:.3f}s".format(len(network.Adjacency), time.time() - stime)
+
+    capsules = world.FindNodes(nodetype = 'LocationCapsule')
+    random.seed(1)
+    pairs = [(random.choice(capsules), random.choice(capsules)) for i in range(0, 100000)]
+
+    stime = time.time()
+    unreachable = 0
+    for src, dst in pairs :
+        if network.ComputeTravelTime(src, dst) is None :
+            unreachable += 1
+    elapsed = time.time() - stime
+
+    print "{0} queries over {1} capsules in {2:.3f}s, {3:.0f} queries per second".format(len(pairs), len(capsules), elapsed, len(pairs) / elapsed)
+    print "{0} trees computed, {1} cache hits, {2} unreachable pairs".format(network.CacheMisses, network.CacheHits, unreachable)
@@ -50,8 +50,8 @@ from mobdat.common.Decoration import Decoration
 from mobdat.common.ValueTypes import MakeEnum, DaysOfTheWeek
 from mobdat.common.Schedule import WeeklySchedule
 from mobdat.common.Decoration import Decoration
+from mobdat.common.WeightedSampler import WeightedSampler
 
-import random
 
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
@@ -321,7 +321,7 @@ class VehicleTypeDecoration(Decoration) :
         Decoration.__init__(self)
 
         self.VehicleTypeMap = {}
-        self.VehicleTypeList = None
+        self.VehicleTypeSampler = None
 
     # -----------------------------------------------------------------
     def AddVehicleType(self, name, rate) :
@@ -331,16 +331,27 @@ class VehicleTypeDecoration(Decoration) :
             rate -- relative frequency of occurance 
         """
         self.VehicleTypeMap[name] = rate
-        self.VehicleTypeList = None  # so we'll rebuild the map when needed
+        self.VehicleTypeSampler = None  # so we'll rebuild the sampler when needed
+
+    # -----------------------------------------------------------------
+    def _Sampler(self) :
+        if not self.VehicleTypeSampler :
+            self.VehicleTypeSampler = WeightedSampler(self.VehicleTypeMap)
+        return self.VehicleTypeSampler
 
     # -----------------------------------------------------------------
     def PickVehicleType(self) :
-        if not self.VehicleTypeList :
-            self.VehicleTypeList = []
-            for name, rate in self.VehicleTypeMap.iteritems() :
-                self.VehicleTypeList.extend([name for x in range(rate)])
+        return self._Sampler().Pick()
 
-        return random.choice(self.VehicleTypeList)
+    # -----------------------------------------------------------------
+    def PickVehicleTypes(self, count) :
+        """
+        PickVehicleTypes -- pick vehicle types for count people at once
+
+        Args:
+            count -- integer number of vehicle types to pick
+        """
+        return self._Sampler().PickMany(count)
 
     # -----------------------------------------------------------------
     def Dump(self) :
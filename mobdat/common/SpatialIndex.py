@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+@file    SpatialIndex.py
+@author  Mic Bowman
+@date    2014-04-02
+
+This file defines a uniform grid index over nodes decorated with
+coordinates. It answers range, bounding box and nearest neighbor
+queries by looking only at the grid cells near the query.
+
+"""
+
+import os, sys
+import logging
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import math, heapq
+
+logger = logging.getLogger(__name__)
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class SpatialIndex :
+
+    # -----------------------------------------------------------------
+    def __init__(self, cellsize = 100.0) :
+        """
+        Args:
+            cellsize -- width of the square grid cells in world coordinates
+        """
+        self.CellSize = float(cellsize)
+
+        # map (cellx, celly) --> dictionary of node name --> (x, y, node)
+        self.Cells = {}
+
+        # map node name --> cell, coordinates are captured when the node
+        # is added so the node can always be found again when it is dropped
+        self.NodeCells = {}
+
+        # bounds of the cells that have held nodes, the bounds never shrink
+        # which is fine since they only limit the nearest neighbor search
+        self.Extent = None
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self.NodeCells)
+
+    # -----------------------------------------------------------------
+    def _Cell(self, x, y) :
+        return (int(math.floor(x / self.CellSize)), int(math.floor(y / self.CellSize)))
+
+    # -----------------------------------------------------------------
+    def AddNode(self, node, x = None, y = None) :
+        """
+        AddNode -- add a node with a Coord decoration to the index, a node
+        with the same name that is already in the index is replaced
+
+        Args:
+            node -- object of type Graph.Node
+            x, y -- coordinates for nodes without a Coord decoration
+        """
+        self.DropNode(node)
+
+        if x is None or y is None :
+            x = node.Coord.X
+            y = node.Coord.Y
+
+        cell = self._Cell(x, y)
+
+        if cell not in self.Cells :
+            self.Cells[cell] = {}
+        self.Cells[cell][node.Name] = (x, y, node)
+        self.NodeCells[node.Name] = cell
+
+        if self.Extent is None :
+            self.Extent = [cell[0], cell[1], cell[0], cell[1]]
+        else :
+            self.Extent = [min(self.Extent[0], cell[0]), min(self.Extent[1], cell[1]),
+                           max(self.Extent[2], cell[0]), max(self.Extent[3], cell[1])]
+
+    # -----------------------------------------------------------------
+    def DropNode(self, node) :
+        cell = self.NodeCells.pop(node.Name, None)
+        if cell is None :
+            return
+
+        entries = self.Cells[cell]
+        del entries[node.Name]
+        if not entries :
+            del self.Cells[cell]
+
+    # -----------------------------------------------------------------
+    def _IterCellsInBox(self, x0, y0, x1, y1) :
+        """
+        _IterCellsInBox -- iterate over the non-empty cells that overlap a box,
+        when the box covers more cells than are occupied it is cheaper to
+        filter the occupied cells
+        """
+        cx0, cy0 = self._Cell(x0, y0)
+        cx1, cy1 = self._Cell(x1, y1)
+
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self.Cells) :
+            for (cx, cy), entries in self.Cells.iteritems() :
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1 :
+                    yield entries
+            return
+
+        for cx in range(cx0, cx1 + 1) :
+            for cy in range(cy0, cy1 + 1) :
+                entries = self.Cells.get((cx, cy))
+                if entries :
+                    yield entries
+
+    # -----------------------------------------------------------------
+    def FindNodesInBox(self, x0, y0, x1, y1) :
+        """
+        FindNodesInBox -- return the nodes with x0 <= X <= x1 and y0 <= Y <= y1
+        """
+        result = []
+        for entries in self._IterCellsInBox(x0, y0, x1, y1) :
+            for x, y, node in entries.itervalues() :
+                if x0 <= x <= x1 and y0 <= y <= y1 :
+                    result.append(node)
+
+        return result
+
+    # -----------------------------------------------------------------
+    def FindNodesInRange(self, x, y, dist) :
+        """
+        FindNodesInRange -- return the nodes strictly closer than dist to <x, y>
+        """
+        result = []
+        sqdist = dist * dist
+        for entries in self._IterCellsInBox(x - dist, y - dist, x + dist, y + dist) :
+            for nx, ny, node in entries.itervalues() :
+                if (nx - x)**2 + (ny - y)**2 < sqdist :
+                    result.append(node)
+
+        return result
+
+    # -----------------------------------------------------------------
+    def FindNearestNodes(self, x, y, count = 1) :
+        """
+        FindNearestNodes -- return up to count nodes ordered by increasing
+        distance from <x, y>. Cells are searched in rings around the cell
+        that holds the point until no unsearched cell can hold a closer node.
+        """
+        if not self.Cells or count <= 0 :
+            return []
+
+        cx, cy = self._Cell(x, y)
+
+        # the ring beyond which there are no occupied cells
+        minx, miny, maxx, maxy = self.Extent
+        maxring = max(cx - minx, maxx - cx, cy - miny, maxy - cy, 0)
+
+        # heap of the best candidates so far, distances are negated so
+        # the root is the farthest of the candidates
+        best = []
+        ring = 0
+        while ring <= maxring :
+            for cell in self._RingCells(cx, cy, ring) :
+                entries = self.Cells.get(cell)
+                if not entries :
+                    continue
+
+                for nx, ny, node in entries.itervalues() :
+                    sqdist = (nx - x)**2 + (ny - y)**2
+                    if len(best) < count :
+                        heapq.heappush(best, (-sqdist, node.Name, node))
+                    elif sqdist < -best[0][0] :
+                        heapq.heapreplace(best, (-sqdist, node.Name, node))
+
+            # every node in a cell outside the ring is at least ring cells away
+            bound = ring * self.CellSize
+            if len(best) == count and -best[0][0] <= bound * bound :
+                break
+
+            ring += 1
+
+        best.sort(reverse = True)
+        return [node for sqdist, name, node in best]
+
+    # -----------------------------------------------------------------
+    def _RingCells(self, cx, cy, ring) :
+        if ring == 0 :
+            yield (cx, cy)
+            return
+
+        for ox in range(-ring, ring + 1) :
+            yield (cx + ox, cy - ring)
+            yield (cx + ox, cy + ring)
+
+        for oy in range(-ring + 1, ring) :
+            yield (cx - ring, cy + oy)
+            yield (cx + ring, cy + oy)
+
+    # =================================================================
+    # BATCH QUERIES
+    # =================================================================
+
+    # -----------------------------------------------------------------
+    def FindNodesInRangeBatch(self, points, dist) :
+        """
+        FindNodesInRangeBatch -- return a list with the result of FindNodesInRange
+        for each point. Points that fall in the same cell share the scan of the
+        neighboring cells.
+
+        Args:
+            points -- list of (x, y) tuples
+            dist -- distance from each point
+        """
+        groups = {}
+        for index, (x, y) in enumerate(points) :
+            cell = self._Cell(x, y)
+            if cell not in groups :
+                groups[cell] = []
+            groups[cell].append(index)
+
+        span = int(math.ceil(dist / self.CellSize))
+        sqdist = dist * dist
+        results = [None] * len(points)
+
+        for (cx, cy), indexes in groups.iteritems() :
+            x0 = (cx - span) * self.CellSize
+            y0 = (cy - span) * self.CellSize
+            x1 = (cx + span + 1) * self.CellSize - 1.0e-9
+            y1 = (cy + span + 1) * self.CellSize - 1.0e-9
+
+            candidates = []
+            for entries in self._IterCellsInBox(x0, y0, x1, y1) :
+                candidates.extend(entries.itervalues())
+
+            for index in indexes :
+                x, y = points[index]
+                result = []
+                for nx, ny, node in candidates :
+                    if (nx - x)**2 + (ny - y)**2 < sqdist :
+                        result.append(node)
+                results[index] = result
+
+        return results
+
+    # -----------------------------------------------------------------
+    def FindNearestNodesBatch(self, points, count = 1) :
+        """
+        FindNearestNodesBatch -- return a list with the result of FindNearestNodes
+        for each point
+
+        Args:
+            points -- list of (x, y) tuples
+            count -- number of nodes to find for each point
+        """
+        return [self.FindNearestNodes(x, y, count) for (x, y) in points]
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    import random, time
+    from mobdat.common.Graph import Node
+    from mobdat.common.LayoutDecoration import CoordDecoration
+
+    # compare the index with a scan of all nodes, then time both
+    random.seed(1)
+
+    nodes = []
+    index = SpatialIndex(50)
+    for i in range(0, 20000) :
+        node = Node(name = 'node{0}'.format(i))
+        node.AddDecoration(CoordDecoration(random.randint(-2000, 2000), random.randint(-2000, 2000)))
+        index.AddNode(node)
+        nodes.append(node)
+
+    for node in nodes[::3] :
+        index.DropNode(node)
+    nodes = [node for i, node in enumerate(nodes) if i % 3]
+
+    def ScanRange(x, y, dist) :
+        return set(n.Name for n in nodes if (n.Coord.X - x)**2 + (n.Coord.Y - y)**2 < dist * dist)
+
+    def ScanNearest(x, y) :
+        return min((n.Coord.X - x)**2 + (n.Coord.Y - y)**2 for n in nodes)
+
+    points = [(random.uniform(-2500, 2500), random.uniform(-2500, 2500)) for i in range(0, 200)]
+
+    batch = index.FindNodesInRangeBatch(points, 120)
+    for (x, y), result in zip(points, batch) :
+        assert set(n.Name for n in index.FindNodesInRange(x, y, 120)) == ScanRange(x, y, 120)
+        assert set(n.Name for n in result) == ScanRange(x, y, 120)
+
+        nearest = index.FindNearestNodes(x, y, 5)
+        ndist = [(n.Coord.X - x)**2 + (n.Coord.Y - y)**2 for n in nearest]
+        assert ndist == sorted(ndist) and ndist[0] == ScanNearest(x, y)
+
+        box = set(n.Name for n in index.FindNodesInBox(x - 100, y - 50, x + 100, y + 50))
+        assert box == set(n.Name for n in nodes if x - 100 <= n.Coord.X <= x + 100 and y - 50 <= n.Coord.Y <= y + 50)
+
+    stime = time.time()
+    for x, y in points :
+        ScanRange(x, y, 120)
+        ScanNearest(x, y)
+    scan = time.time() - stime
+
+    stime = time.time()
+    for x, y in points :
+        index.FindNodesInRange(x, y, 120)
+        index.FindNearestNodes(x, y, 1)
+    indexed = time.time() - stime
+
+    print "{0} range and nearest queries over {1} nodes".format(len(points), len(index))
+    print "scan:    {0:.3f}s".format(scan)
+    print "indexed: {0:.3f}s".format(indexed)
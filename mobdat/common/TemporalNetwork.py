@@ -0,0 +1,258 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+@file    TemporalNetwork.py
+@author  Mic Bowman
+@date    2014-04-08
+
+This file defines a solver that treats the time variables and order
+constraints of a schedule as a simple temporal network. The network is
+compiled into a distance graph with an origin node; the earliest time of
+a variable is the negated distance from the variable to the origin and
+the latest time is the distance from the origin to the variable.
+
+"""
+
+import os, sys
+import logging
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import heapq, copy
+from collections import deque
+
+from mobdat.common.TimeVariable import TimeVariable
+from mobdat.common.Constraint import OrderConstraint
+
+logger = logging.getLogger(__name__)
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class TemporalNetwork :
+
+    # -----------------------------------------------------------------
+    def __init__(self, cstore, varstore) :
+        """
+        Args:
+            cstore -- list of OrderConstraint objects
+            varstore -- TimedEvent.TimeVariableStore with the variables of the constraints
+        """
+        self.VariableStore = varstore
+
+        # node i of the graph is the time variable VariableIDs[i], the
+        # origin is implicit in the bounds of the variables
+        self.VariableIDs = varstore.keys()
+        self.NodeIndex = dict((varid, i) for i, varid in enumerate(self.VariableIDs))
+
+        self.Lower = [varstore[varid].STime for varid in self.VariableIDs]
+        self.Upper = [varstore[varid].ETime for varid in self.VariableIDs]
+
+        # an order constraint t2 - t1 >= delta raises the earliest time of
+        # t2 and lowers the latest time of t1; Successors[i] holds (j, delta)
+        # and Predecessors[j] holds (i, delta) for each constraint
+        self.Successors = [[] for varid in self.VariableIDs]
+        self.Predecessors = [[] for varid in self.VariableIDs]
+
+        for constraint in cstore :
+            if not isinstance(constraint, OrderConstraint) :
+                raise ValueError("unsupported constraint {0}".format(constraint.ConstraintID))
+
+            i = self.NodeIndex[constraint.ID1]
+            j = self.NodeIndex[constraint.ID2]
+            self.Successors[i].append((j, constraint.Delta))
+            self.Predecessors[j].append((i, constraint.Delta))
+
+        # position of each node in a topological order, None when the
+        # constraints contain a cycle
+        self.Position = self._TopologicalOrder()
+
+    # -----------------------------------------------------------------
+    def Copy(self) :
+        """ Create a copy of the network that shares the constraint graph
+        but has its own bounds, fixing variables in the copy leaves this
+        network unchanged """
+        network = copy.copy(self)
+        network.Lower = list(self.Lower)
+        network.Upper = list(self.Upper)
+        return network
+
+    # -----------------------------------------------------------------
+    def _TopologicalOrder(self) :
+        indegree = [len(preds) for preds in self.Predecessors]
+        queue = deque(i for i, count in enumerate(indegree) if count == 0)
+
+        position = [None] * len(indegree)
+        count = 0
+        while queue :
+            i = queue.popleft()
+            position[i] = count
+            count += 1
+
+            for j, delta in self.Successors[i] :
+                indegree[j] -= 1
+                if indegree[j] == 0 :
+                    queue.append(j)
+
+        return position if count == len(indegree) else None
+
+    # -----------------------------------------------------------------
+    def _Inconsistent(self, i) :
+        return self.Lower[i] - self.Upper[i] >= TimeVariable.MinimalVariance
+
+    # -----------------------------------------------------------------
+    def ComputeMinimalNetwork(self) :
+        """ Compute the earliest and latest time of every variable with a
+        single shortest path pass, in topological order when the constraints
+        are acyclic and with Bellman-Ford otherwise
+
+        Returns:
+            True if the network is consistent, False if there is a negative cycle
+        """
+        lower = self.Lower
+        upper = self.Upper
+
+        if self.Position is not None :
+            order = sorted(range(0, len(self.Position)), key = lambda i : self.Position[i])
+            for i in order :
+                for j, delta in self.Successors[i] :
+                    if lower[i] + delta > lower[j] :
+                        lower[j] = lower[i] + delta
+
+            for j in reversed(order) :
+                for i, delta in self.Predecessors[j] :
+                    if upper[j] - delta < upper[i] :
+                        upper[i] = upper[j] - delta
+        else :
+            # a positive cycle of constraints is a negative cycle in the distance
+            # graph, the bounds still change after a pass for every node
+            for count in range(0, len(lower) + 1) :
+                changed = False
+                for i, succs in enumerate(self.Successors) :
+                    for j, delta in succs :
+                        if lower[i] + delta > lower[j] :
+                            lower[j] = lower[i] + delta
+                            changed = True
+                        if upper[j] - delta < upper[i] :
+                            upper[i] = upper[j] - delta
+                            changed = True
+                if not changed :
+                    break
+            else :
+                logger.warn('schedule constraints contain a negative cycle')
+                return False
+
+        for i in range(0, len(lower)) :
+            if self._Inconsistent(i) :
+                logger.warn('variable {0} is inconsistent; <{1}:{2}>'.format(self.VariableIDs[i], lower[i], upper[i]))
+                return False
+
+        return True
+
+    # -----------------------------------------------------------------
+    def FixVariable(self, i, value) :
+        """ Fix a variable to a value and update the bounds of the variables
+        that depend on it, only nodes reachable from the variable are visited
+
+        Args:
+            i -- integer node index of the variable
+            value -- float value for the variable
+
+        Returns:
+            True if the network is still consistent
+        """
+        lower = self.Lower
+        upper = self.Upper
+
+        lower[i] = value
+        upper[i] = value
+
+        # in an acyclic network visiting nodes in topological order updates
+        # each node once, otherwise nodes are revisited until the bounds settle
+        position = self.Position
+        key = (lambda n : position[n]) if position is not None else (lambda n : 0)
+
+        queue = [(key(i), i)]
+        while queue :
+            p, n = heapq.heappop(queue)
+            for j, delta in self.Successors[n] :
+                if lower[n] + delta > lower[j] :
+                    lower[j] = lower[n] + delta
+                    if self._Inconsistent(j) :
+                        return False
+                    heapq.heappush(queue, (key(j), j))
+
+        queue = [(-key(i), i)]
+        while queue :
+            p, n = heapq.heappop(queue)
+            for j, delta in self.Predecessors[n] :
+                if upper[n] - delta < upper[j] :
+                    upper[j] = upper[n] - delta
+                    if self._Inconsistent(j) :
+                        return False
+                    heapq.heappush(queue, (-key(j), j))
+
+        return True
+
+    # -----------------------------------------------------------------
+    def StoreBounds(self) :
+        for i, varid in enumerate(self.VariableIDs) :
+            var = self.VariableStore[varid]
+            var.STime = self.Lower[i]
+            var.ETime = self.Upper[i]
+
+    # -----------------------------------------------------------------
+    def SolveConstraints(self) :
+        """ Give every variable a value, variables are picked in the same
+        order as ConstraintStore.SolveConstraints
+
+        Returns:
+            True if the variable store is valid after all variables have been given a value
+        """
+        if not self.ComputeMinimalNetwork() :
+            self.StoreBounds()
+            return False
+
+        self.StoreBounds()
+        for var in self.VariableStore.FindFreeVariables() :
+            i = self.NodeIndex[var.ID]
+            var.STime = self.Lower[i]
+            var.ETime = self.Upper[i]
+
+            if not self.FixVariable(i, var.PickValue()) :
+                self.StoreBounds()
+                return False
+
+        self.StoreBounds()
+        return True
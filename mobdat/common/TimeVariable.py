@@ -45,9 +45,14 @@ sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","p
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
-import random, math
+import random, math, itertools
 from mobdat.common.Utilities import GenName
 
+# creation order of time variables, unlike the generated identifiers the
+# relative order of the variables in a schedule does not depend on how
+# many other schedules the process has built
+_Sequence = itertools.count()
+
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class TimeVariable :
@@ -67,6 +72,7 @@ class TimeVariable :
         self.STime = min(stime, etime or stime)
         self.ETime = max(stime, etime or stime)
         self.ID = id or GenName('TV')
+        self.Sequence = next(_Sequence)
 
     # -----------------------------------------------------------------
     def __str__(self) :
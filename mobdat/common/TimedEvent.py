@@ -46,10 +46,14 @@ sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
+import heapq
+from collections import OrderedDict
+
 from mobdat.common.Utilities import GenName
 from mobdat.common.TimeVariable import *
 from mobdat.common.Constraint import *
 from mobdat.common.TravelTimeEstimator import TravelTimeEstimator
+from mobdat.common.TemporalNetwork import TemporalNetwork
 
 logger = logging.getLogger(__name__)
 
@@ -110,7 +114,12 @@ class TravelEvent :
     def __init__(self, srcplace, dstplace, estimator = None, id = None) :
         self.SrcPlace = srcplace
         self.DstPlace = dstplace
-        self.Duration = estimator.ComputeTravelTime(srcplace.Details, dstplace.Details) if estimator else self.DefaultDuration
+        self.Duration = self.DefaultDuration
+        if estimator :
+            # the departure time is not known until the schedule is solved,
+            # use the middle of the window for the end of the source event
+            when = (srcplace.ETime.STime + srcplace.ETime.ETime) / 2.0
+            self.Duration = estimator.ComputeTravelTime(srcplace.Details, dstplace.Details, when)
         self.EventID = id or GenName('TRAVEL')
 
     # -----------------------------------------------------------------
@@ -172,7 +181,9 @@ class TimeVariableStore(dict) :
     # -----------------------------------------------------------------
     def FindFreeVariables(self) :
         """ Find the time variables with values that have not been
-        set. Ignore invalid variables.
+        set. Ignore invalid variables. Variables with the same priority
+        are returned in the order they were created so that a schedule
+        picks values in the same order in any process.
         
         Returns:
             A possibly empty list of variable identifiers
@@ -181,7 +192,7 @@ class TimeVariableStore(dict) :
         for var in self.itervalues() :
             if not var.IsFixed() : variables.append(var)
             
-        return sorted(variables, key= lambda var : var.Priority, reverse=True)
+        return sorted(variables, key= lambda var : (-var.Priority, var.Sequence))
         
     # -----------------------------------------------------------------
     def DumpToLog(self) :
@@ -197,6 +208,11 @@ class ConstraintStore(list) :
     def __init__(self, *args) :
         list.__init__(self, args)
 
+        # map variable id --> increasing list of the indexes of the
+        # constraints on the variable, rebuilt when constraints are added
+        self.VariableIndex = {}
+        self.IndexedCount = 0
+
     # -----------------------------------------------------------------
     def DumpToLog(self, varstore) :
         for constraint in self :
@@ -224,16 +240,95 @@ class ConstraintStore(list) :
         return varstore.StoreIsValid()
 
     # -----------------------------------------------------------------
-    def SolveConstraints(self, varstore) :
+    def IndexConstraints(self) :
+        """ Build the map from variable identifiers to the constraints on them """
+        if self.IndexedCount == len(self) :
+            return self.VariableIndex
+
+        self.VariableIndex = {}
+        for index, constraint in enumerate(self) :
+            for varid in constraint.Variables() :
+                if varid not in self.VariableIndex :
+                    self.VariableIndex[varid] = []
+                self.VariableIndex[varid].append(index)
+
+        self.IndexedCount = len(self)
+        return self.VariableIndex
+
+    # -----------------------------------------------------------------
+    def PropagateConstraints(self, varstore, varids = None) :
+        """ Apply constraints until the variable space stabilizes, only
+        constraints on variables that changed are applied again. The
+        constraints are visited in the same order as the sweeps made by
+        ApplyConstraints so the two produce the same variables. Constraints
+        only narrow intervals so a variable that becomes invalid stays
+        invalid and only the variables that change need to be checked.
+
+        Args:
+            varstore -- store of TimeVariables, all valid on entry
+            varids -- identifiers of the variables that changed, None for all
+
+        Returns:
+            True if all constraints applied, False if there was a conflict
+        """
+        varindex = self.IndexConstraints()
+
+        if varids is None :
+            current = range(0, len(self))
+        else :
+            current = sorted(set(index for varid in varids for index in varindex.get(varid, [])))
+        queued = set(current)
+
+        # constraints made dirty by a constraint later in the sweep are
+        # applied in the next sweep, in order
+        pending = []
+        pendset = set()
+
+        while current :
+            while current :
+                index = heapq.heappop(current)
+                queued.discard(index)
+
+                constraint = self[index]
+                if not constraint.Apply(varstore) :
+                    continue
+
+                for varid in constraint.Variables() :
+                    var = varstore[varid]
+                    if not var.IsValid() :
+                        logger.warn('variable {0} is inconsistent; {1}'.format(var.ID, str(var)))
+                        return False
+
+                    # the constraint itself is satisfied once it is applied
+                    for other in varindex[varid] :
+                        if other > index :
+                            if other not in queued :
+                                heapq.heappush(current, other)
+                                queued.add(other)
+                        elif other < index :
+                            if other not in pendset :
+                                heapq.heappush(pending, other)
+                                pendset.add(other)
+
+            current, queued, pending, pendset = pending, pendset, [], set()
+
+        return True
+
+    # -----------------------------------------------------------------
+    def SolveConstraints(self, varstore, incremental = True) :
         """ Apply constraints repeatedly until all variables have been given a value
 
         Args:
             varstore -- store of TimeVariables over which constraints will be applied
+            incremental -- propagate changes with a worklist rather than full sweeps
 
         Returns:
             True if the variable store is valid after all variables have been given a value
         """
-        if not self.ApplyConstraints(varstore) :
+        if incremental :
+            if not varstore.StoreIsValid() or not self.PropagateConstraints(varstore) :
+                return False
+        elif not self.ApplyConstraints(varstore) :
             return False
 
         variables = varstore.FindFreeVariables()
@@ -243,19 +338,153 @@ class ConstraintStore(list) :
             # print "Pick variable {0} and set value to {1}".format(var.ID, var.STime)
             # print "================================================================="
 
-            if not self.ApplyConstraints(varstore) :
+            if incremental :
+                if not self.PropagateConstraints(varstore, [var.ID]) :
+                    return False
+            elif not self.ApplyConstraints(varstore) :
                 return False
 
         return True
         
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class ScheduleTemplate :
+    """
+    ScheduleTemplate -- the propagated but unsampled constraint network of
+    a TimedEventList. Sampling the template picks values in the same order
+    as the stn solver, so a sample matches solving a copy of the list.
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, evlist) :
+        """
+        Args:
+            evlist -- TimedEventList with unsolved events, used only to build the template
+        """
+        cstore = ConstraintStore()
+        evlist.BaseEvent.AddConstraints(cstore)
+
+        self.Network = TemporalNetwork(cstore, evlist.TimeVariableStore)
+        self.Consistent = self.Network.ComputeMinimalNetwork()
+
+        # (node index, variable) for the free variables in the order they
+        # are picked, the variables are scratch copies used only to sample
+        self.Picks = []
+
+        # (node index of the departure time, source, destination) for the trips
+        self.Trips = []
+
+        if not self.Consistent :
+            return
+
+        self.Network.StoreBounds()
+        for var in evlist.TimeVariableStore.FindFreeVariables() :
+            self.Picks.append((self.Network.NodeIndex[var.ID], var.Copy()))
+
+        event = evlist.BaseEvent
+        while event.NextPlace() :
+            self.Trips.append((self.Network.NodeIndex[event.ETime.ID], event.Details, event.NextPlace().Details))
+            event = event.NextPlace()
+
+    # -----------------------------------------------------------------
+    def Sample(self) :
+        """ Pick values for the free variables of the template
+
+        Returns:
+            List of (start time, source details, destination details) for the
+            trips in the schedule, None if the constraints could not be resolved
+        """
+        if not self.Consistent :
+            return None
+
+        network = self.Network.Copy()
+        for i, var in self.Picks :
+            var.STime = network.Lower[i]
+            var.ETime = network.Upper[i]
+            if not network.FixVariable(i, var.PickValue()) :
+                return None
+
+        return [(network.Lower[i], src, dst) for i, src, dst in self.Trips]
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class ScheduleTemplateCache :
+    """
+    ScheduleTemplateCache -- a bounded cache of schedule templates, the least
+    recently used template is dropped when the cache is full
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, capacity = 1000) :
+        """
+        Args:
+            capacity -- maximum number of templates held in the cache
+        """
+        self.Capacity = capacity
+        self.Templates = OrderedDict()
+
+        self.Hits = 0
+        self.Misses = 0
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self.Templates)
+
+    # -----------------------------------------------------------------
+    @property
+    def HitRate(self) :
+        lookups = self.Hits + self.Misses
+        return float(self.Hits) / lookups if lookups else 0.0
+
+    # -----------------------------------------------------------------
+    def FindTemplate(self, key, builder) :
+        """ Return the template for a key, building it on a miss
+
+        Args:
+            key -- hashable description of everything that shapes the schedule
+            builder -- function that returns a new ScheduleTemplate
+        """
+        template = self.Templates.pop(key, None)
+        if template is None :
+            self.Misses += 1
+            template = builder()
+            if len(self.Templates) >= self.Capacity :
+                self.Templates.popitem(last = False)
+        else :
+            self.Hits += 1
+
+        self.Templates[key] = template
+        return template
+
+    # -----------------------------------------------------------------
+    def DumpToLog(self) :
+        logger.info('schedule template cache holds %d templates, %d hits, %d misses, hit rate %0.3f',
+                    len(self.Templates), self.Hits, self.Misses, self.HitRate)
+
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class TimedEventList :
+    # sweep and worklist propagate bounds through the ConstraintStore, stn
+    # solves the constraints as a simple temporal network
+    Solvers = ('sweep', 'worklist', 'stn')
+
     # -----------------------------------------------------------------
-    def __init__(self, details, lifespan, estimator = None) :
+    def __init__(self, details, lifespan, estimator = None, solver = 'worklist') :
+        """
+        Args:
+            details -- string name of the initial place
+            lifespan -- float hours covered by the list
+            estimator -- TravelTimeEstimator used for travel events
+            solver -- string name of the constraint solver, one of Solvers
+        """
+        if solver not in self.Solvers :
+            raise ValueError("unknown constraint solver {0}".format(solver))
+
         self.Events = {}
         self.TimeVariableStore = TimeVariableStore()
         self.TravelTimeEstimator = estimator or TravelTimeEstimator()
+        self.Solver = solver
+        self.Lifespan = lifespan
 
         baseid = self.AddPlaceEvent(details, MinimumTimeVariable(0.0), MaximumTimeVariable(lifespan))
         self.BaseEvent = self.Events[baseid]
@@ -296,6 +525,46 @@ class TimedEventList :
         self.BaseEvent = dplace
         return TripEvent(stime, splace, dplace)
 
+    # -----------------------------------------------------------------
+    def PruneHistory(self) :
+        """
+        PruneHistory -- drop the events that come before the base event and
+        their time variables. The constraints are built from the base event
+        forward so the history only costs memory in the variable store; the
+        solved start time of the base event anchors the rest of the list.
+        """
+        self.BaseEvent.Arrival = None
+
+        events = {}
+        store = TimeVariableStore()
+
+        event = self.BaseEvent
+        while event :
+            events[event.EventID] = event
+            store[event.STime.ID] = self.TimeVariableStore[event.STime.ID]
+            store[event.ETime.ID] = self.TimeVariableStore[event.ETime.ID]
+            event = event.NextPlace()
+
+        self.Events = events
+        self.TimeVariableStore = store
+
+    # -----------------------------------------------------------------
+    def RollHorizon(self, worldtime) :
+        """
+        RollHorizon -- prune the history and push the end of the last event
+        out to worldtime + Lifespan so that events can be added past the
+        original lifespan of the list
+
+        Args:
+            worldtime -- float, time at the start of the events to be added
+        """
+        self.PruneHistory()
+
+        last = self.LastEvent
+        horizon = max(last.ETime.ETime, worldtime + self.Lifespan)
+        last.ETime = MaximumTimeVariable(last.STime.STime, horizon, last.ETime.ID)
+        self.TimeVariableStore[last.ETime.ID] = last.ETime
+
     # -----------------------------------------------------------------
     def AddPlaceEvent(self, details, svar, evar, duration = 0.01, id = None) :
         """ Create a PlaceEvent object from the parameters and save it in the list of events
@@ -387,7 +656,10 @@ class TimedEventList :
     def SolveConstraints(self) :
         cstore = ConstraintStore()
         self.BaseEvent.AddConstraints(cstore)
-        return cstore.SolveConstraints(self.TimeVariableStore)
+
+        if self.Solver == 'stn' :
+            return TemporalNetwork(cstore, self.TimeVariableStore).SolveConstraints()
+        return cstore.SolveConstraints(self.TimeVariableStore, self.Solver == 'worklist')
 
     # -----------------------------------------------------------------
     def DumpToLogTimeVariables(self) :
@@ -470,7 +742,7 @@ if __name__ == '__main__' :
 
     ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
     ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
-    def BuildOneDay(evlist) :
+    def BuildOneDay(evlist, day) :
         lastev = evlist.LastEvent.EventID
 
         workev = AddWorkEvent(evlist, lastev, day)
@@ -487,15 +759,120 @@ if __name__ == '__main__' :
         if random.uniform(0.0, 1.0) > 0.8 :
             AddShoppingTrip(evlist, day)
 
-        if not evlist.SolveConstraints() :
-            print 'resolution failed'
-            sys.exit(1)
+    ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+    ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+    def BuildSchedule(days, solver, seed) :
+        """Build and solve a schedule one day at a time the way a traveler
+        does, return the solve time and the times of every place event
+        """
+        random.seed(seed)
+        evlist = TimedEventList('home', days * 24.0, solver = solver)
+
+        elapsed = 0.0
+        for day in range(0, days) :
+            BuildOneDay(evlist, day)
+
+            stime = time.time()
+            success = evlist.SolveConstraints()
+            elapsed += time.time() - stime
+            if not success :
+                return elapsed, None
+
+        result = []
+        event = evlist.BaseEvent
+        while event :
+            result.append((event.Details, event.STime.STime, event.ETime.STime))
+            event = event.NextPlace()
+
+        return elapsed, result
+
+    ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+    ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+    def Difference(result1, result2) :
+        """Return the largest difference between the times of two schedules,
+        the stn solver does not round bounds so its times differ slightly
+        """
+        if result1 is None or result2 is None :
+            return 0.0 if result1 == result2 else float('inf')
+        if [r[0] for r in result1] != [r[0] for r in result2] :
+            return float('inf')
+        return max([abs(a - b) for r1, r2 in zip(result1, result2) for a, b in zip(r1[1:], r2[1:])] or [0.0])
 
     # -----------------------------------------------------------------
+    import time
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'benchmark' :
+        # compare the solvers on multi-day schedules
+        #     python TimedEvent.py benchmark [days ...]
+        for days in [int(arg) for arg in sys.argv[2:]] or [1, 7, 14, 28] :
+            times = {}
+            for solver in TimedEventList.Solvers :
+                times[solver], result = BuildSchedule(days, solver, days)
+                if solver == 'sweep' :
+                    expected = result
+                elif solver == 'worklist' :
+                    assert result == expected
+                else :
+                    difference = Difference(result, expected)
+
+            print "{0:3d} days, {1:4d} places, sweep {2:.3f}s, worklist {3:.3f}s, stn {4:.3f}s, stn difference {5:.2g}{6}".format(
+                days, len(expected or []), times['sweep'], times['worklist'], times['stn'], difference, '' if expected else ', unsolvable')
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'throughput' :
+        # solve one schedule for each of a number of travelers with each solver
+        #     python TimedEvent.py throughput [travelers] [days]
+        travelers = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+        days = int(sys.argv[3]) if len(sys.argv) > 3 else 7
+        for solver in TimedEventList.Solvers :
+            elapsed = 0.0
+            failed = 0
+            for traveler in range(0, travelers) :
+                solvetime, result = BuildSchedule(days, solver, traveler)
+                elapsed += solvetime
+                failed += 1 if result is None else 0
+
+            print "{0:8s} {1} {2}-day schedules in {3:.3f}s, {4:.0f} schedules per second, {5} failed".format(
+                solver, travelers, days, elapsed, travelers / max(elapsed, 1e-6), failed)
+        sys.exit(0)
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'rolling' :
+        # solve a schedule one day at a time with and without pruning the
+        # events that have been consumed, report the cost for each week
+        #     python TimedEvent.py rolling [days]
+        days = int(sys.argv[2]) if len(sys.argv) > 2 else 56
+        for rolling in [False, True] :
+            random.seed(days)
+            evlist = TimedEventList('home', (7 if rolling else days) * 24.0, solver = 'stn')
+
+            elapsed = 0.0
+            for day in range(0, days) :
+                if rolling :
+                    evlist.RollHorizon(day * 24.0)
+                BuildOneDay(evlist, day)
+
+                stime = time.time()
+                if not evlist.SolveConstraints() :
+                    print 'resolution failed on day {0}'.format(day)
+                    break
+                elapsed += time.time() - stime
+
+                while evlist.MoreTripEvents() :
+                    evlist.PopTripEvent()
+
+                if day % 7 == 6 :
+                    print "{0:8s} week {1:2d}, solve {2:.4f}s, {3:5d} events, {4:5d} variables".format(
+                        'rolling' if rolling else 'growing', day / 7, elapsed, len(evlist.Events), len(evlist.TimeVariableStore))
+                    elapsed = 0.0
+        sys.exit(0)
+
     evlist = TimedEventList('home', 1000 * 24.0)
 
     for day in range(0, 1000) :
-        BuildOneDay(evlist)
+        BuildOneDay(evlist, day)
+        if not evlist.SolveConstraints() :
+            print 'resolution failed'
+            sys.exit(1)
 
         print 'day = {0}'.format(day)
         while evlist.MoreTripEvents() :
@@ -503,4 +880,3 @@ if __name__ == '__main__' :
             print str(trip)
 
     # evlist.DumpToLog()
-
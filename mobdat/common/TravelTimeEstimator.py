@@ -46,7 +46,110 @@ sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
-import random
+import random, json
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class TravelTimeTable :
+    """
+    TravelTimeTable -- observed travel times shared by all travelers, keyed
+    by source capsule, destination capsule and time of day bucket. The table
+    holds at most Capacity routes, the least recently used route is evicted
+    to make room for a new one.
+    """
+
+    HistoryFactor = 5
+
+    # -----------------------------------------------------------------
+    def __init__(self, buckets = 24, capacity = 100000) :
+        """
+        Args:
+            buckets -- number of equal time of day buckets
+            capacity -- maximum number of (source, destination, bucket) entries
+        """
+        self.Buckets = buckets
+        self.Capacity = capacity
+
+        # map (source name, destination name, bucket) --> [hours, samples]
+        self.Routes = OrderedDict()
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self.Routes)
+
+    # -----------------------------------------------------------------
+    def Bucket(self, when) :
+        return int((when % 24.0) * self.Buckets / 24.0) % self.Buckets
+
+    # -----------------------------------------------------------------
+    def Lookup(self, src, dst, when) :
+        """
+        Lookup -- return the observed travel time in hours or None if the
+        route has not been observed in the time of day bucket
+
+        Args:
+            src -- string name of the source capsule
+            dst -- string name of the destination capsule
+            when -- world time of the departure in hours
+        """
+        key = (src, dst, self.Bucket(when))
+        entry = self.Routes.pop(key, None)
+        if entry is None :
+            return None
+
+        self.Routes[key] = entry
+        return entry[0]
+
+    # -----------------------------------------------------------------
+    def Observe(self, src, dst, when, delta) :
+        """
+        Observe -- fold an observed trip duration into the table
+
+        Args:
+            src -- string name of the source capsule
+            dst -- string name of the destination capsule
+            when -- world time of the departure in hours
+            delta -- duration of the trip in hours
+        """
+        key = (src, dst, self.Bucket(when))
+        entry = self.Routes.pop(key, None)
+        if entry is None :
+            entry = [delta, 0]
+            while len(self.Routes) >= self.Capacity :
+                self.Routes.popitem(last = False)
+
+        entry[0] = (self.HistoryFactor * entry[0] + delta) / (self.HistoryFactor + 1)
+        entry[1] += 1
+        self.Routes[key] = entry
+
+    # -----------------------------------------------------------------
+    def LoadFromFile(self, filename) :
+        with open(filename, 'r') as fp :
+            data = json.load(fp)
+
+        if data['Buckets'] != self.Buckets :
+            logger.warn('ignoring travel times in %s, bucket count %s does not match %s', filename, data['Buckets'], self.Buckets)
+            return
+
+        # entries are saved from least to most recently used
+        for src, dst, bucket, hours, samples in data['Routes'][-self.Capacity:] :
+            self.Routes[(src, dst, bucket)] = [hours, samples]
+
+        logger.info('loaded %d travel times from %s', len(self.Routes), filename)
+
+    # -----------------------------------------------------------------
+    def SaveToFile(self, filename) :
+        routes = []
+        for (src, dst, bucket), (hours, samples) in self.Routes.iteritems() :
+            routes.append([src, dst, bucket, hours, samples])
+
+        with open(filename, 'w') as fp :
+            json.dump({'Buckets' : self.Buckets, 'Routes' : routes}, fp)
+
+        logger.info('saved %d travel times to %s', len(routes), filename)
 
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
@@ -55,20 +158,68 @@ class TravelTimeEstimator :
     HistoryFactor = 5
 
     # -----------------------------------------------------------------
-    def __init__(self) :
+    def __init__(self, prior = None, resolver = None, table = None) :
+        """
+        Args:
+            prior -- RoadNetwork.RoadNetwork or TravelTimeMatrix.TravelTimeMatrix used
+                for routes with no history
+            resolver -- function that maps a place name to a location node or None
+            table -- TravelTimeTable shared with other estimators, when set the
+                history is kept in the table rather than in the estimator
+        """
         self.RouteData = {}
+        self.Prior = prior
+        self.Resolver = resolver
+        self.Table = table
 
     # -----------------------------------------------------------------
-    def ComputeTravelTime(self, src, dst) :
-        if src in self.RouteData :
+    def ComputeTravelTime(self, src, dst, when = None) :
+        """
+        Args:
+            src -- source place name or location
+            dst -- destination place name or location
+            when -- expected world time of the departure in hours, if known
+        """
+        if self.Resolver :
+            src = self.Resolver(src)
+            dst = self.Resolver(dst)
+            if src is None or dst is None :
+                return self.DefaultTravelTime
+
+        if self.Table is not None :
+            if when is not None :
+                hours = self.Table.Lookup(src.Name, dst.Name, when)
+                if hours is not None :
+                    return hours
+
+        elif src in self.RouteData :
             if dst in self.RouteData[src] :
                 return self.RouteData[src][dst]
 
+        # with no history for the route, use the free flow travel
+        # time through the road network as the prior
+        if self.Prior :
+            hours = self.Prior.ComputeTravelTime(src, dst)
+            if hours is not None :
+                return hours
+
         #return max(self.DefaultTravelTime, random.gauss(1.5 * self.DefaultTravelTime, 0.1))
         return self.DefaultTravelTime
 
     # -----------------------------------------------------------------
-    def SaveTravelTime(self, src, dst, delta) :
+    def SaveTravelTime(self, src, dst, delta, when = None) :
+        """
+        Args:
+            src -- source location
+            dst -- destination location
+            delta -- duration of the trip in hours
+            when -- world time of the departure in hours
+        """
+        if self.Table is not None :
+            if when is not None :
+                self.Table.Observe(src.Name, dst.Name, when, delta)
+            return
+
         if src not in self.RouteData :
             self.RouteData[src] = {}
 
@@ -76,6 +227,3 @@ class TravelTimeEstimator :
             self.RouteData[src][dst] = delta
 
         self.RouteData[src][dst] = (self.HistoryFactor * self.RouteData[src][dst] + delta) / (self.HistoryFactor + 1)
-
-        
-            
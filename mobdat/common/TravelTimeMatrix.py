@@ -0,0 +1,161 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+@file    TravelTimeMatrix.py
+@author  Mic Bowman
+@date    2014-04-04
+
+This file defines a precomputed matrix of free flow travel times between
+location capsules. The matrix is written by the builder and memory mapped
+by the simulator so that every process shares a single copy.
+
+The file holds a header, the newline separated capsule names and then a
+dense row major matrix of little endian 32 bit floats, one row for each
+source capsule. Times are stored in units of road length / road speed and
+scaled to hours when they are read.
+
+"""
+
+import os, sys
+import logging
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import mmap, struct
+from array import array
+
+from mobdat.common.RoadNetwork import RoadNetwork
+
+logger = logging.getLogger(__name__)
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+def MatrixFileName(infofile) :
+    """
+    MatrixFileName -- return the name of the travel time matrix that
+    accompanies a world info file
+    """
+    return os.path.splitext(infofile)[0] + '.ttm'
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class TravelTimeMatrix :
+    Magic = 'MBTTM001'
+
+    # magic, capsule count, length of the name block
+    HeaderFormat = '<8sII'
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def Build(world, filename, nodetype = 'LocationCapsule') :
+        """
+        Build -- compute the travel times between all capsules in the world
+        and write them to a matrix file, rows are written as they are
+        computed so only one row is held in memory
+
+        Args:
+            world -- WorldInfo.WorldInfo
+            filename -- string name of the matrix file
+            nodetype -- string name of the type of the locations in the matrix
+        """
+        network = RoadNetwork(world, timescale = 1.0, maxtrees = 1)
+        capsules = sorted(world.FindNodes(nodetype = nodetype), key = lambda n : n.Name)
+
+        names = '\n'.join(capsule.Name for capsule in capsules)
+        header = struct.pack(TravelTimeMatrix.HeaderFormat, TravelTimeMatrix.Magic, len(capsules), len(names))
+        padding = '\0' * (-(len(header) + len(names)) % 8)
+
+        with open(filename, 'wb') as fp :
+            fp.write(header)
+            fp.write(names)
+            fp.write(padding)
+
+            for src in capsules :
+                # the network keeps the tree for src so the row is one dijkstra
+                row = array('f')
+                for dst in capsules :
+                    ttime = network.ComputeTravelTime(src, dst)
+                    row.append(RoadNetwork.Unreachable if ttime is None else ttime)
+
+                if sys.byteorder == 'big' :
+                    row.byteswap()
+                row.tofile(fp)
+
+        logger.info('wrote travel times between %d capsules to %s', len(capsules), filename)
+
+    # -----------------------------------------------------------------
+    def __init__(self, filename, timescale = 1.0 / 3600.0) :
+        """
+        Args:
+            filename -- string name of the matrix file
+            timescale -- hours of world time per unit of distance / speed
+        """
+        self.TimeScale = timescale
+
+        with open(filename, 'rb') as fp :
+            self.Map = mmap.mmap(fp.fileno(), 0, access = mmap.ACCESS_READ)
+
+        magic, count, namelen = struct.unpack_from(TravelTimeMatrix.HeaderFormat, self.Map, 0)
+        if magic != TravelTimeMatrix.Magic :
+            raise ValueError("%s is not a travel time matrix" % filename)
+
+        start = struct.calcsize(TravelTimeMatrix.HeaderFormat)
+        names = self.Map[start:start + namelen].split('\n') if count else []
+
+        self.Count = count
+        self.CapsuleIndex = dict((name, index) for index, name in enumerate(names))
+        self.Offset = start + namelen + (-(start + namelen) % 8)
+
+        if self.Offset + 4 * count * count > len(self.Map) :
+            raise ValueError("%s is truncated" % filename)
+
+    # -----------------------------------------------------------------
+    def ComputeTravelTime(self, src, dst) :
+        """
+        ComputeTravelTime -- return the free flow travel time in hours between
+        two capsules or None if either capsule is not in the matrix or there
+        is no route between them
+
+        Args:
+            src -- Graph.Node, source capsule
+            dst -- Graph.Node, destination capsule
+        """
+        sindex = self.CapsuleIndex.get(src.Name)
+        dindex = self.CapsuleIndex.get(dst.Name)
+        if sindex is None or dindex is None :
+            return None
+
+        value = struct.unpack_from('<f', self.Map, self.Offset + 4 * (sindex * self.Count + dindex))[0]
+        return self.TimeScale * value if value < RoadNetwork.Unreachable else None
@@ -162,11 +162,20 @@ class Quaternion :
     # -----------------------------------------------------------------
     @classmethod
     def FromHeading(self, heading) :
+        return Quaternion(*Quaternion.HeadingComponents(heading))
+
+    # -----------------------------------------------------------------
+    @staticmethod
+    def HeadingComponents(heading) :
+        """
+        HeadingComponents -- return the x, y, z, w tuple of the quaternion
+        for a heading without building the quaternion
+        """
         c1 = math.cos(heading)
         s1 = math.sin(heading)
         w = math.sqrt(2.0 + 2.0 * c1) / 2.0
         z = (2.0 * s1) / (4.0 * w) if w != 0 else 1.0
-        return Quaternion(0.0, 0.0, z, w)
+        return (0.0, 0.0, z, w)
 
     # -----------------------------------------------------------------
     def Equals(self, other) :
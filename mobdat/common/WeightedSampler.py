@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+@file    WeightedSampler.py
+@author  Mic Bowman
+@date    2014-04-11
+
+This file defines a sampler for weighted categorical choices using
+Walker's alias method. The tables take time proportional to the number
+of choices to build and every pick costs one uniform random number
+regardless of the weights.
+
+"""
+
+import os, sys
+import logging
+
+# we need to import python modules from the $SUMO_HOME/tools directory
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import random
+from array import array
+
+logger = logging.getLogger(__name__)
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class WeightedSampler :
+
+    # -----------------------------------------------------------------
+    def __init__(self, choices) :
+        """
+        Args:
+            choices -- dictionary or sequence of (value, weight) pairs, weights
+                are non-negative numbers relative to each other
+        """
+        if isinstance(choices, dict) :
+            choices = choices.iteritems()
+
+        self.Values = []
+        weights = []
+        for value, weight in choices :
+            if weight < 0 :
+                raise ValueError('negative weight {0} for {1}'.format(weight, value))
+            if weight > 0 :
+                self.Values.append(value)
+                weights.append(float(weight))
+
+        total = sum(weights)
+        if total <= 0 :
+            raise ValueError('no choices with a positive weight')
+
+        # Probability[i] is the chance of keeping value i when column i is
+        # picked, the rest of the column belongs to value Alias[i]
+        count = len(weights)
+        scaled = [w * count / total for w in weights]
+        self.Probability = array('d', [1.0]) * count
+        self.Alias = array('i', range(0, count))
+
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large :
+            sindex = small.pop()
+            lindex = large[-1]
+
+            self.Probability[sindex] = scaled[sindex]
+            self.Alias[sindex] = lindex
+
+            scaled[lindex] = (scaled[lindex] + scaled[sindex]) - 1.0
+            if scaled[lindex] < 1.0 :
+                small.append(large.pop())
+
+        # whatever is left is 1.0 up to rounding error and keeps its own value
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self.Values)
+
+    # -----------------------------------------------------------------
+    def Pick(self, rng = random) :
+        """
+        Pick -- return one value chosen with probability proportional to its weight
+
+        Args:
+            rng -- random.Random or the random module, source of uniform numbers
+        """
+        u = rng.random() * len(self.Values)
+        index = int(u)
+        if u - index >= self.Probability[index] :
+            index = self.Alias[index]
+        return self.Values[index]
+
+    # -----------------------------------------------------------------
+    def PickMany(self, count, rng = random) :
+        """
+        PickMany -- return a list of count values chosen independently, this
+        gives the same values as count calls to Pick with the same generator
+
+        Args:
+            count -- integer number of values to pick
+            rng -- random.Random or the random module, source of uniform numbers
+        """
+        values = self.Values
+        prob = self.Probability
+        alias = self.Alias
+        size = len(values)
+        uniform = rng.random
+
+        result = []
+        append = result.append
+        for i in xrange(0, count) :
+            u = uniform() * size
+            index = int(u)
+            append(values[index] if u - index < prob[index] else values[alias[index]])
+
+        return result
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    # compare the alias sampler with choosing from a list that repeats each
+    # value weight times and check the frequencies of the picks
+    #     python WeightedSampler.py [picks]
+    import time
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    weights = {'car' : 1000, 'truck' : 120, 'van' : 55, 'bus' : 8, 'bike' : 1}
+
+    stime = time.time()
+    expanded = []
+    for value, weight in weights.iteritems() :
+        expanded.extend([value] * weight)
+    picks = [random.choice(expanded) for i in xrange(0, count)]
+    print "repeated list {0:.3f}s for {1} picks from {2} entries".format(time.time() - stime, count, len(expanded))
+
+    stime = time.time()
+    sampler = WeightedSampler(weights)
+    picks = [sampler.Pick() for i in xrange(0, count)]
+    print "alias pick    {0:.3f}s for {1} picks from {2} entries".format(time.time() - stime, count, len(sampler))
+
+    stime = time.time()
+    picks = sampler.PickMany(count)
+    print "alias many    {0:.3f}s for {1} picks from {2} entries".format(time.time() - stime, count, len(sampler))
+
+    total = float(sum(weights.itervalues()))
+    for value in sorted(weights, key = lambda v : -weights[v]) :
+        print "{0:6s} expected {1:.5f} observed {2:.5f}".format(value, weights[value] / total, picks.count(value) / float(count))
+
+    rng1 = random.Random(7)
+    rng2 = random.Random(7)
+    same = [sampler.Pick(rng1) for i in xrange(0, 1000)] == sampler.PickMany(1000, rng2)
+    print "Pick and PickMany agree: {0}".format(same)
@@ -50,11 +50,20 @@ sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "
 from mobdat.common import Graph, Decoration
 from mobdat.common import LayoutNodes, LayoutEdges, LayoutDecoration
 from mobdat.common import SocialNodes, SocialEdges, SocialDecoration
+from mobdat.common import SpatialIndex
 
 import json
 
 logger = logging.getLogger(__name__)
 
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+def SnapshotFileName(infofile) :
+    """
+    SnapshotFileName -- return the name of the binary snapshot that
+    accompanies a world info file
+    """
+    return os.path.splitext(infofile)[0] + '.snap'
 
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
@@ -63,11 +72,8 @@ class WorldInfo(Graph.Graph) :
     # -----------------------------------------------------------------
     @staticmethod
     def LoadFromFile(filename) :
-        with open(filename, 'r') as fp :
-            data = json.load(fp)
-
         graph = WorldInfo()
-        graph.Load(data)
+        graph.LoadFile(filename)
 
         return graph
 
@@ -75,12 +81,57 @@ class WorldInfo(Graph.Graph) :
     def __init__(self) :
         Graph.Graph.__init__(self)
 
+        # grid index over the nodes that carry a Coord decoration, it is
+        # kept in sync by AddNode and DropNode
+        self.CoordIndex = SpatialIndex.SpatialIndex()
+
         for dtype in LayoutDecoration.CommonDecorations :
             self.AddDecorationHandler(dtype)
 
         for dtype in SocialDecoration.Decorations :
             self.AddDecorationHandler(dtype)
 
+    # -----------------------------------------------------------------
+    def LoadFile(self, filename) :
+        """
+        LoadFile -- load the world from a json world info file, the binary
+        snapshot written alongside the file is used instead when it is at
+        least as new as the json file
+
+        Args:
+            filename -- string name of the json world info file
+        """
+        snapfile = SnapshotFileName(filename)
+        if os.path.exists(snapfile) :
+            if not os.path.exists(filename) or os.path.getmtime(snapfile) >= os.path.getmtime(filename) :
+                try :
+                    self.LoadSnapshotFile(snapfile)
+                    logger.info('loaded world data from snapshot %s', snapfile)
+                    return
+                except ValueError as detail :
+                    logger.warn('ignoring snapshot; %s', detail)
+
+        with open(filename, 'r') as fp :
+            data = json.load(fp)
+
+        self.Load(data)
+
+    # -----------------------------------------------------------------
+    def AddNode(self, node) :
+        # a node replaced by one with the same name leaves the index first
+        if node.Name in self.Nodes :
+            self.CoordIndex.DropNode(self.Nodes[node.Name])
+
+        Graph.Graph.AddNode(self, node)
+
+        if LayoutDecoration.CoordDecoration.DecorationName in node.Decorations :
+            self.CoordIndex.AddNode(node)
+
+    # -----------------------------------------------------------------
+    def DropNode(self, node) :
+        self.CoordIndex.DropNode(node)
+        Graph.Graph.DropNode(self, node)
+
     # =================================================================
     # =================================================================
 
@@ -232,3 +283,114 @@ class WorldInfo(Graph.Graph) :
             etype -- object of type LayoutInfo.RoadType (Graph.Node)
         """
         self.AddEdge(road)
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    # compare the time and peak memory needed to load a world from the json
+    # world info file and from the binary snapshot, each load runs in its own
+    # process so that the peak resident set size of one does not hide the other
+    #     python WorldInfo.py <worldinfo.js>
+    import time, resource, multiprocessing, marshal
+
+    # -----------------------------------------------------------------
+    def LoadWorld(loader, filename, results) :
+        stime = time.time()
+        world = WorldInfo()
+        if loader == 'json' :
+            with open(filename, 'r') as fp :
+                world.Load(json.load(fp))
+        else :
+            world.LoadSnapshotFile(filename)
+        ltime = time.time() - stime
+
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        results.put((ltime, maxrss, len(world.Nodes), len(world.Edges)))
+
+    # -----------------------------------------------------------------
+    def CompareWorlds(infofile, snapfile, results) :
+        jsonworld = WorldInfo()
+        with open(infofile, 'r') as fp :
+            jsonworld.Load(json.load(fp))
+
+        snapworld = WorldInfo()
+        snapworld.LoadSnapshotFile(snapfile)
+
+        # decorations and some of their contents (the jobs of an employment
+        # profile) are dumped from dictionaries in hash order, sort lists of
+        # dictionaries so only the content is compared
+        def Canonical(value) :
+            if isinstance(value, dict) :
+                return dict((k, Canonical(v)) for k, v in value.iteritems())
+            elif isinstance(value, list) :
+                values = [Canonical(v) for v in value]
+                if values and all(isinstance(v, dict) for v in values) :
+                    values.sort(key = lambda v : json.dumps(v, sort_keys = True))
+                return values
+            return value
+
+        mismatches = []
+        for objects in ['Nodes', 'Edges'] :
+            jsonobjs = getattr(jsonworld, objects)
+            snapobjs = getattr(snapworld, objects)
+            for name in set(jsonobjs.keys()) | set(snapobjs.keys()) :
+                if name not in jsonobjs or name not in snapobjs or Canonical(jsonobjs[name].Dump()) != Canonical(snapobjs[name].Dump()) :
+                    mismatches.append(name)
+
+        results.put(mismatches)
+
+    # -----------------------------------------------------------------
+    def SnapshotIsCurrent(infofile, snapfile) :
+        if not os.path.exists(snapfile) or os.path.getmtime(snapfile) < os.path.getmtime(infofile) :
+            return False
+
+        # only read the header, the world itself must not be loaded here
+        with open(snapfile, 'rb') as fp :
+            try :
+                header = marshal.load(fp)
+            except (EOFError, ValueError, TypeError) :
+                return False
+
+        return header == (Graph.SnapshotMagic, Graph.SnapshotVersion, tuple(sys.version_info[:2]))
+
+    # -----------------------------------------------------------------
+    def SaveSnapshot(infofile, snapfile) :
+        WorldInfo.LoadFromFile(infofile).SaveSnapshotFile(snapfile)
+
+    # -----------------------------------------------------------------
+    def RunLoader(loader, filename) :
+        results = multiprocessing.Queue()
+        proc = multiprocessing.Process(target = LoadWorld, args = (loader, filename, results))
+        proc.start()
+        result = results.get()
+        proc.join()
+        return result
+
+    infofile = sys.argv[1] if len(sys.argv) > 1 else 'world.js'
+    snapfile = SnapshotFileName(infofile)
+
+    # write the snapshot in a child process as well, loading the world in
+    # this process would be inherited by the measuring processes and
+    # inflate their peak resident set size
+    if not SnapshotIsCurrent(infofile, snapfile) :
+        print 'writing snapshot {0}'.format(snapfile)
+        proc = multiprocessing.Process(target = SaveSnapshot, args = (infofile, snapfile))
+        proc.start()
+        proc.join()
+        if proc.exitcode != 0 :
+            sys.exit('failed to write snapshot {0}'.format(snapfile))
+
+    # both loaders must produce the same world
+    results = multiprocessing.Queue()
+    proc = multiprocessing.Process(target = CompareWorlds, args = (infofile, snapfile, results))
+    proc.start()
+    mismatches = results.get()
+    proc.join()
+    if mismatches :
+        sys.exit('json and snapshot worlds differ in {0} objects, e.g. {1}'.format(len(mismatches), ', '.join(sorted(mismatches)[:5])))
+    print 'json and snapshot worlds are identical'
+
+    for loader, filename in [('json', infofile), ('snapshot', snapfile)] :
+        ltime, maxrss, nodes, edges = RunLoader(loader, filename)
+        size = os.path.getsize(filename) / 1024
+        print '{0:10s} {1:8d}KB file, {2:6.2f}s load, {3:8d}KB peak rss, {4} nodes, {5} edges'.format(loader, size, ltime, maxrss, nodes, edges)
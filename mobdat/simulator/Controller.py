@@ -47,7 +47,7 @@ sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
 import platform, time, threading, cmd, readline
-import EventRouter, EventTypes
+import EventRouter, EventTypes, RingQueue
 from mobdat.common import LayoutSettings, WorldInfo
 from multiprocessing import Process
 
@@ -220,19 +220,28 @@ def Controller(settings) :
 
     cnames = settings["General"].get("Connectors",['sumo', 'opensim', 'social', 'stats'])
 
-    evrouter = EventRouter.EventRouter()
+    # with DirectEvents the connectors publish straight into the queues of
+    # the subscribers and the router only manages the subscriptions, the
+    # EventTransport setting picks the queues, "ring" for shared memory rings,
+    # and EventEncoding the codec of the events, "binary" or "pickle"
+    queuefactory = RingQueue.QueueFactory(settings["General"])
+    evrouter = EventRouter.EventRouter(settings["General"].get("DirectEvents", False), queuefactory)
 
-    # initialize the connectors first
+    # initialize the connectors first, all of them register with the router
+    # before any is started so every process inherits every handler queue
     connectors = []
     for cname in cnames :
         if cname not in _SimulationControllers :
             logger.warn('skipping unknown simulation connector; %s' % (cname))
             continue
 
-        connector = _SimulationControllers[cname](evrouter, settings, world, laysettings)
+        connectors.append(_SimulationControllers[cname](evrouter, settings, world, laysettings))
+
+    connprocs = []
+    for connector in connectors :
         connproc = Process(target=connector.SimulationStart, args=())
         connproc.start()
-        connectors.append(connproc)
+        connprocs.append(connproc)
             
     evrouterproc = Process(target=evrouter.RouteEvents, args=())
     evrouterproc.start()
@@ -247,7 +256,7 @@ def Controller(settings) :
     thread.join()
 
     # send the shutdown event to the connectors
-    for connproc in connectors :
+    for connproc in connprocs :
         connproc.join()
 
     # and send the shutdown event to the router
@@ -0,0 +1,565 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer.
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution.
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission.
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+
+@file    EventCodec.py
+@author  Mic Bowman
+@date    2014-04-14
+
+This module defines the binary encoding of events for the event queues.
+Each event class declares its fields once in EventFields as a sequence of
+(attribute, kind) pairs and gets an integer tag from EventClasses. The
+numeric fields of an event are packed with a single struct, the strings
+are interned per producer so a name crosses a queue in full only the
+first time, later events carry a two byte reference. Events of classes
+without a tag, or with a value that does not fit its declared kind, are
+pickled.
+
+A message starts with one struct of the tag, the process id and serial
+number of the producer, the number of new strings, the numeric fields
+and the references of the string fields. The definitions of the new
+strings follow, then the string lists, arrays and pickled objects. A
+pickled event is the tag zero and the pickle.
+
+"""
+
+import os, sys
+import logging
+
+sys.path.append(os.path.join(os.environ.get("SUMO_HOME"), "tools"))
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import struct, thread, types, cPickle
+from array import array
+from operator import attrgetter
+
+import EventTypes
+from mobdat.common import ValueTypes
+
+logger = logging.getLogger(__name__)
+
+# the tag of an event class is its index in this list plus one, tag zero
+# is a pickled event, new classes go at the end so tags stay stable
+EventClasses = [
+    EventTypes.SubscribeEvent,
+    EventTypes.UnsubscribeEvent,
+    EventTypes.SubscriptionTableEvent,
+    EventTypes.ShutdownEvent,
+    EventTypes.StatsEvent,
+    EventTypes.TripStatsEvent,
+    EventTypes.TripBegStatsEvent,
+    EventTypes.TripEndStatsEvent,
+    EventTypes.SumoConnectorStatsEvent,
+    EventTypes.OpenSimConnectorStatsEvent,
+    EventTypes.TimerEvent,
+    EventTypes.ObjectEvent,
+    EventTypes.EventCreateObject,
+    EventTypes.EventAddVehicle,
+    EventTypes.EventDeleteObject,
+    EventTypes.EventPropertyChange,
+    EventTypes.EventObjectDynamics,
+    EventTypes.EventObjectDynamicsBatch,
+    EventTypes.EventInductionLoop,
+    EventTypes.EventTrafficLightStateChange
+    ]
+
+# struct codes of the kinds of fields that are packed together
+FixedKinds = {
+    'int' : 'q',
+    'float' : 'd',
+    'bool' : '?',
+    'vector3' : 'ddd',
+    'quaternion' : 'dddd'
+    }
+
+# kinds of fields that follow the packed fields, a string is interned
+# and may be None, strings is a list of them sent as the new definitions
+# followed by an array of references, doubles is an array('d') and an
+# object is pickled
+VariableKinds = set(['string', 'strings', 'doubles', 'object'])
+
+Header = struct.Struct('<BIHH')
+Tag = struct.Struct('<B')
+Length = struct.Struct('<I')
+Definition = struct.Struct('<HH')
+
+ResetFlag = 0x8000
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class StringTable :
+    """
+    StringTable -- the strings one producer has sent through a queue,
+    the consumer builds the same table from the definitions in the
+    messages since the messages of a producer arrive in order
+    """
+
+    # a table this full starts over so references fit in 16 bits, the
+    # strings of one event have to fit in the rest
+    ResetCount = 0x8000
+    MaximumCount = 0x10000
+
+    # -----------------------------------------------------------------
+    def __init__(self, pid, serial) :
+        self.Pid = pid
+        self.Serial = serial
+        self.Reset()
+        self.Mark()
+
+    # -----------------------------------------------------------------
+    def Reset(self) :
+        # reference zero is None
+        self.Strings = { None : 0 }
+        self.Count = 1
+        self.ResetPending = True
+
+    # -----------------------------------------------------------------
+    def Mark(self) :
+        """
+        Mark -- start an event, the strings added from here on are removed
+        if the event is rolled back
+        """
+        self.Added = []
+        self.MarkCount = self.Count
+        self.MarkReset = False
+
+    # -----------------------------------------------------------------
+    def Begin(self) :
+        """
+        Begin -- return the serial number for the header of a message,
+        with the reset flag when the consumer must clear its table
+        """
+        if self.Count > StringTable.ResetCount :
+            self.Reset()
+            self.MarkCount = self.Count
+
+        if self.ResetPending :
+            self.ResetPending = False
+            self.MarkReset = True
+            return self.Serial | ResetFlag
+
+        return self.Serial
+
+    # -----------------------------------------------------------------
+    def Rollback(self) :
+        """
+        Rollback -- forget the strings defined since the mark, the message
+        that defined them never reached the consumer
+        """
+        for value in self.Added :
+            del self.Strings[value]
+
+        self.Count = self.MarkCount
+        self.ResetPending = self.ResetPending or self.MarkReset
+        self.Mark()
+
+    # -----------------------------------------------------------------
+    def References(self, values, definitions) :
+        """
+        References -- return the list of references for a sequence of
+        strings, the definitions of new strings are added to definitions
+
+        Args:
+            values -- sequence of strings or None
+            definitions -- list of strings
+        """
+        strings = self.Strings
+        idents = map(strings.get, values)
+        if None not in idents :
+            return idents
+
+        for index, ident in enumerate(idents) :
+            if ident is not None :
+                continue
+
+            # a string repeated in values is defined once, the value is
+            # checked before the table changes
+            value = values[index]
+            ident = strings.get(value)
+            if ident is None :
+                if value.__class__ is not str or len(value) > 0xFFFF :
+                    raise TypeError('cannot intern {0!r}'.format(value))
+                if self.Count >= StringTable.MaximumCount :
+                    raise ValueError('string table is full')
+
+                ident = self.Count
+                self.Count += 1
+                strings[value] = ident
+                self.Added.append(value)
+                definitions.append(Definition.pack(ident, len(value)))
+                definitions.append(value)
+
+            idents[index] = ident
+
+        return idents
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class EventSchema :
+    """
+    EventSchema -- the compiled layout of one event class, the header,
+    the numeric fields and the references of the string fields are one
+    struct followed by the new string definitions and then the lists,
+    arrays and objects
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, tag, evclass) :
+        """
+        Args:
+            tag -- integer tag of the class in messages
+            evclass -- event class with an EventFields declaration
+        """
+        self.Tag = tag
+        self.EventClass = evclass
+        self.OldStyle = isinstance(evclass, types.ClassType)
+
+        self.FixedFields = []
+        self.StringNames = []
+        self.VariableFields = []
+        fmt = ''
+        for name, kind in evclass.EventFields :
+            if kind in FixedKinds :
+                self.FixedFields.append((name, kind))
+                fmt += FixedKinds[kind]
+            elif kind == 'string' :
+                self.StringNames.append(name)
+            elif kind in VariableKinds :
+                self.VariableFields.append((name, kind))
+            else :
+                raise ValueError('unknown kind {0} of field {1} in {2}'.format(kind, name, evclass.__name__))
+
+        self.Prefix = struct.Struct(Header.format + fmt + 'H' * len(self.StringNames))
+        self.FixedCount = len(fmt)
+
+        # without vectors the packed values are the attributes in order
+        self.Scalar = len(fmt) == len(self.FixedFields)
+        self.FixedNames = [name for name, kind in self.FixedFields]
+        self.FixedGetter = attrgetter(*self.FixedNames) if self.FixedNames else None
+        self.StringGetter = attrgetter(*self.StringNames) if self.StringNames else None
+
+    # -----------------------------------------------------------------
+    def _FixedValues(self, event) :
+        if self.Scalar :
+            if len(self.FixedNames) > 1 :
+                return list(self.FixedGetter(event))
+            return [self.FixedGetter(event)] if self.FixedGetter else []
+
+        # vectors are ValueTypes or sequences of their components, the
+        # length is checked so a short sequence cannot shift the fields
+        values = []
+        for name, kind in self.FixedFields :
+            value = getattr(event, name)
+            if kind == 'vector3' :
+                if isinstance(value, (tuple, list)) :
+                    if len(value) != 3 :
+                        raise ValueError('{0} is not a vector'.format(name))
+                    values.extend(value)
+                else :
+                    values.extend((value.x, value.y, value.z))
+            elif kind == 'quaternion' :
+                if isinstance(value, (tuple, list)) :
+                    if len(value) != 4 :
+                        raise ValueError('{0} is not a quaternion'.format(name))
+                    values.extend(value)
+                else :
+                    values.extend((value.x, value.y, value.z, value.w))
+            else :
+                values.append(value)
+        return values
+
+    # -----------------------------------------------------------------
+    def Encode(self, event, table) :
+        serial = table.Begin()
+        values = self._FixedValues(event)
+
+        definitions = []
+        if self.StringGetter :
+            strings = self.StringGetter(event)
+            values.extend(table.References(strings if len(self.StringNames) > 1 else (strings,), definitions))
+
+        parts = []
+        for name, kind in self.VariableFields :
+            value = getattr(event, name)
+            if kind == 'strings' :
+                parts.append(Length.pack(len(value)))
+                parts.append(array('H', table.References(value, definitions)).tostring())
+            elif kind == 'doubles' :
+                if not isinstance(value, array) or value.typecode != 'd' :
+                    value = array('d', value)
+                parts.append(Length.pack(len(value)))
+                parts.append(value.tostring())
+            else :
+                value = cPickle.dumps(value, cPickle.HIGHEST_PROTOCOL)
+                parts.append(Length.pack(len(value)))
+                parts.append(value)
+
+        prefix = self.Prefix.pack(self.Tag, table.Pid, serial, len(definitions) / 2, *values)
+        return prefix + ''.join(definitions) + ''.join(parts)
+
+    # -----------------------------------------------------------------
+    def Decode(self, data, values, table) :
+        """
+        Decode -- rebuild an event
+
+        Args:
+            data -- string from Encode
+            values -- tuple unpacked from the start of data with Prefix
+            table -- list of the strings of the producer
+        """
+        offset = self.Prefix.size
+        for i in xrange(0, values[3]) :
+            ident, length = Definition.unpack_from(data, offset)
+            if ident != len(table) :
+                raise ValueError('string {0} defined out of order'.format(ident))
+            table.append(data[offset + 4:offset + 4 + length])
+            offset += 4 + length
+
+        if self.Scalar :
+            attrs = dict(zip(self.FixedNames, values[4:4 + self.FixedCount]))
+        else :
+            attrs = {}
+            index = 4
+            for name, kind in self.FixedFields :
+                if kind == 'vector3' :
+                    attrs[name] = ValueTypes.Vector3(values[index], values[index + 1], values[index + 2])
+                    index += 3
+                elif kind == 'quaternion' :
+                    attrs[name] = ValueTypes.Quaternion(values[index], values[index + 1], values[index + 2], values[index + 3])
+                    index += 4
+                else :
+                    attrs[name] = values[index]
+                    index += 1
+
+        if self.StringNames :
+            attrs.update(zip(self.StringNames, map(table.__getitem__, values[4 + self.FixedCount:])))
+
+        for name, kind in self.VariableFields :
+            count = Length.unpack_from(data, offset)[0]
+            offset += 4
+            if kind == 'strings' :
+                idents = array('H')
+                idents.fromstring(data[offset:offset + 2 * count])
+                attrs[name] = map(table.__getitem__, idents)
+                offset += 2 * count
+            elif kind == 'doubles' :
+                value = array('d')
+                value.fromstring(data[offset:offset + 8 * count])
+                attrs[name] = value
+                offset += 8 * count
+            else :
+                attrs[name] = cPickle.loads(data[offset:offset + count])
+                offset += count
+
+        # events are rebuilt from their fields without calling __init__
+        if self.OldStyle :
+            return types.InstanceType(self.EventClass, attrs)
+
+        event = self.EventClass.__new__(self.EventClass)
+        event.__dict__.update(attrs)
+        return event
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class EventCodec :
+    """
+    EventCodec -- encode events to strings and back for one queue, a
+    codec must not be shared between queues since the strings a producer
+    has interned are only known to the consumer of the queue they went to
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, evclasses = None) :
+        """
+        Args:
+            evclasses -- list of event classes in tag order, EventClasses by default
+        """
+        self.Schemas = {}
+        self.SchemasByTag = [None]
+        for index, evclass in enumerate(evclasses or EventClasses) :
+            schema = EventSchema(index + 1, evclass)
+            self.Schemas[evclass] = schema
+            self.SchemasByTag.append(schema)
+
+        # map (process id, thread id) --> StringTable of a producer, and
+        # (process id, serial) --> list of strings of a producer, the
+        # tables of the parent are copied on fork but keyed by its pid
+        self.EncodeTables = {}
+        self.DecodeTables = {}
+
+    # -----------------------------------------------------------------
+    def _ProducerTable(self) :
+        pid = os.getpid()
+        key = (pid, thread.get_ident())
+        table = self.EncodeTables.get(key)
+        if table is None :
+            serial = len([k for k in self.EncodeTables if k[0] == pid])
+            table = self.EncodeTables[key] = StringTable(pid, serial)
+        return table
+
+    # -----------------------------------------------------------------
+    def Encode(self, event) :
+        """
+        Encode -- return the string for an event
+
+        Args:
+            event -- event object
+        """
+        table = self._ProducerTable()
+        table.Mark()
+
+        schema = self.Schemas.get(event.__class__)
+        if schema is not None :
+            try :
+                return schema.Encode(event, table)
+            except (AttributeError, TypeError, ValueError, struct.error) as detail :
+                logger.debug('pickling %s; %s', event.__class__.__name__, str(detail))
+                table.Rollback()
+
+        return Tag.pack(0) + cPickle.dumps(event, cPickle.HIGHEST_PROTOCOL)
+
+    # -----------------------------------------------------------------
+    def Rollback(self) :
+        """
+        Rollback -- undo the last Encode of the calling thread when its
+        message could not be queued
+        """
+        self._ProducerTable().Rollback()
+
+    # -----------------------------------------------------------------
+    def Decode(self, data) :
+        """
+        Decode -- return the event for a string from Encode
+
+        Args:
+            data -- string
+        """
+        tag = ord(data[0])
+        if tag == 0 :
+            return cPickle.loads(data[1:])
+
+        schema = self.SchemasByTag[tag]
+        values = schema.Prefix.unpack_from(data, 0)
+        pid, serial = values[1:3]
+        if serial & ResetFlag :
+            table = self.DecodeTables[(pid, serial & ~ResetFlag)] = [None]
+        else :
+            table = self.DecodeTables[(pid, serial)]
+
+        return schema.Decode(data, values, table)
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class PickleCodec :
+    """
+    PickleCodec -- the codec interface over cPickle
+    """
+
+    # -----------------------------------------------------------------
+    def Encode(self, event) :
+        return cPickle.dumps(event, cPickle.HIGHEST_PROTOCOL)
+
+    # -----------------------------------------------------------------
+    def Rollback(self) :
+        pass
+
+    # -----------------------------------------------------------------
+    def Decode(self, data) :
+        return cPickle.loads(data)
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    # compare the encode and decode time and the size of each event type
+    # with pickle, names cycle through a pool so the codec is measured with
+    # the names already interned as they are in a running simulation
+    #     python EventCodec.py [iterations]
+    import time
+
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    names = ['veh%d' % i for i in range(0, 1000)]
+
+    def MakeBatch(i) :
+        batch = EventTypes.EventObjectDynamicsBatch()
+        for j in range(0, 100) :
+            batch.AddObject(names[(i + j) % len(names)], (i, j, 0.0), (0.0, 0.0, 0.5, 0.8), (1.0, 2.0, 0.0))
+        return batch
+
+    samples = [
+        ('TimerEvent', lambda i : EventTypes.TimerEvent(i, 1397000000.0 + i)),
+        ('EventObjectDynamics', lambda i : EventTypes.EventObjectDynamics(names[i % len(names)], ValueTypes.Vector3(i, i, 0.0), ValueTypes.Quaternion(0.0, 0.0, 0.5, 0.8), ValueTypes.Vector3(1.0, 2.0, 0.0))),
+        ('EventObjectDynamicsBatch', MakeBatch),
+        ('EventAddVehicle', lambda i : EventTypes.EventAddVehicle(names[i % len(names)], 'car', 'rc%d' % (i % 50), 'tc%d' % (i % 70))),
+        ('EventCreateObject', lambda i : EventTypes.EventCreateObject(names[i % len(names)], 'car')),
+        ('EventDeleteObject', lambda i : EventTypes.EventDeleteObject(names[i % len(names)])),
+        ('TripBegStatsEvent', lambda i : EventTypes.TripBegStatsEvent(i, 'person%d' % (i % 500), 'person%d_trip%d' % (i % 500, i % 3), 'rc%d' % (i % 50), 'tc%d' % (i % 70))),
+        ('SumoConnectorStatsEvent', lambda i : EventTypes.SumoConnectorStatsEvent(i, 0.01, 300)),
+        ('SubscribeEvent', lambda i : EventTypes.SubscribeEvent('handler%d' % (i % 4), EventTypes.TimerEvent)),
+        ]
+
+    def Fields(event) :
+        result = {}
+        for name, value in vars(event).iteritems() :
+            if isinstance(value, (ValueTypes.Vector3, ValueTypes.Quaternion)) :
+                value = vars(value)
+            elif isinstance(value, array) :
+                value = list(value)
+            result[name] = value
+        return result
+
+    for name, maker in samples :
+        count = iterations if name != 'EventObjectDynamicsBatch' else iterations / 100
+        events = [maker(i) for i in xrange(0, count)]
+
+        codec = EventCodec()
+        for event in events[:len(names)] :
+            codec.Decode(codec.Encode(event))
+
+        results = []
+        for cname, encode, decode in [('pickle', PickleCodec().Encode, PickleCodec().Decode), ('codec', codec.Encode, codec.Decode)] :
+            stime = time.time()
+            encoded = [encode(event) for event in events]
+            etime = time.time() - stime
+
+            # the decoded events are not kept while timing, collecting a long
+            # list of new objects would dominate both
+            stime = time.time()
+            for data in encoded :
+                decode(data)
+            dtime = time.time() - stime
+
+            check = codec if cname == 'codec' else PickleCodec()
+            assert all(Fields(a) == Fields(check.Decode(b)) and a.__class__ == check.Decode(b).__class__ for a, b in zip(events[:100], encoded[:100]))
+            size = sum(len(data) for data in encoded) / float(count)
+            results.append("{0} {1:6.2f}us {2:6.2f}us {3:6.0f}B".format(cname, 1000000.0 * etime / count, 1000000.0 * dtime / count, size))
+
+        print "{0:26s} {1}   {2}".format(name, results[0], results[1])
@@ -47,7 +47,7 @@ sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
 from multiprocessing import Process, Queue
-import EventTypes
+import EventTypes, EventRouter
 import random
 
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
@@ -56,13 +56,22 @@ class EventHandler :
     # -----------------------------------------------------------------
     def __init__(self, router) :
         self.RouterQueue = router.RouterQueue
-        self.HandlerQueue = Queue()
+        self.HandlerQueue = router.CreateQueue()
         self.HandlerID = 'ID%x' % random.randint(0,1000000)
         self.HandlerRegistry = {}
 
         self._Logger = logging.getLogger(__name__)
         router.RegisterHandler(self.HandlerID, self.HandlerQueue)
 
+        # with direct delivery events are written into the queues of the
+        # subscribers once the router has sent its subscription table, the
+        # queues come from the registry inherited when the handler forked.
+        # Until the first table arrives events go through the router.
+        self.DirectDelivery = router.DirectDelivery
+        self.HandlerQueues = router.RouterRegistry
+        self.SubscriptionTable = None
+        self.DispatchTable = {}
+
     # -----------------------------------------------------------------
     def SubscribeEvent(self, evtype, handler) :
         if not evtype in self.HandlerRegistry :
@@ -72,9 +81,50 @@ class EventHandler :
 
         self.HandlerRegistry[evtype].append(handler)
 
+        # dynamics are published in batches, handlers that take one object
+        # at a time get the batches expanded into per object events
+        if evtype == EventTypes.EventObjectDynamics and len(self.HandlerRegistry[evtype]) == 1 :
+            self.SubscribeEvent(EventTypes.EventObjectDynamicsBatch, self.ExpandObjectDynamicsBatch)
+
+    # -----------------------------------------------------------------
+    def ExpandObjectDynamicsBatch(self, batch) :
+        # a handler that takes the batch itself sees the objects there
+        if len(self.HandlerRegistry[EventTypes.EventObjectDynamicsBatch]) > 1 :
+            return
+
+        for event in batch.ToObjectEvents() :
+            self.HandleEvent(EventTypes.EventObjectDynamics, event)
+
     # -----------------------------------------------------------------
     def PublishEvent(self, event) :
-        self.RouterQueue.put(event)
+        if self.SubscriptionTable is None :
+            self.RouterQueue.put(event)
+            return
+
+        evtype = event.__class__
+        queues = self.DispatchTable.get(evtype)
+        if queues is None :
+            ids = EventRouter.CollectSubscribers(self.SubscriptionTable, evtype)
+            queues = self.DispatchTable[evtype] = [self.HandlerQueues[hid] for hid in ids]
+
+        for queue in queues :
+            queue.put(event)
+
+    # -----------------------------------------------------------------
+    def HandleSubscriptionTable(self, event) :
+        if not self.DirectDelivery :
+            return
+
+        # a handler registered after this one forked has a queue we cannot
+        # reach, keep sending through the router rather than lose its events
+        missing = [hid for ids in event.Subscriptions.itervalues() for hid in ids if hid not in self.HandlerQueues]
+        if missing :
+            self._Logger.warn('no queue for handlers %s, routing events through the router', ', '.join(sorted(set(missing))))
+            self.SubscriptionTable = None
+        else :
+            self.SubscriptionTable = event.Subscriptions
+
+        self.DispatchTable = {}
 
     # -----------------------------------------------------------------
     def HandleEvents(self) :
@@ -95,6 +145,10 @@ class EventHandler :
                 event = self.HandlerQueue.get()
                 evtype = event.__class__
 
+                if evtype == EventTypes.SubscriptionTableEvent :
+                    self.HandleSubscriptionTable(event)
+                    continue
+
                 self.HandleEvent(evtype, event)
 
                 if evtype == EventTypes.ShutdownEvent :
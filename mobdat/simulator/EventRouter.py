@@ -49,16 +49,64 @@ sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "
 from multiprocessing import Process, Queue
 import EventTypes
 
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+def CollectSubscribers(subscriptions, evtype) :
+    """
+    CollectSubscribers -- collect the subscribers to an event class and the
+    chain of classes it derives from, a subscriber at more than one level
+    of the chain is listed once
+
+    Args:
+        subscriptions -- dictionary mapping event class --> list of subscribers
+        evtype -- event class
+    """
+    subscribers = []
+    while evtype :
+        for subscriber in subscriptions.get(evtype, []) :
+            if subscriber not in subscribers :
+                subscribers.append(subscriber)
+
+        bases = evtype.__bases__
+        evtype = bases[0] if bases else None
+
+    return subscribers
+
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class EventRouter :
     # -----------------------------------------------------------------
-    def __init__(self) :
-        self.RouterQueue = Queue()
+    def __init__(self, direct = False, queuefactory = None) :
+        """
+        Args:
+            direct -- boolean, push the subscriptions to the handlers so they
+                publish straight into the queues of the subscribers
+            queuefactory -- function that returns a new event queue, the
+                router and every handler use it, multiprocessing.Queue by default
+        """
+        self.QueueFactory = queuefactory or Queue
+        self.RouterQueue = self.CreateQueue()
         self.RouterRegistry = {}
         self.Subscriptions = {}
         self._Logger = logging.getLogger(__name__)
 
+        # with direct delivery the router keeps the handler ids of the
+        # subscribers for each event class and sends the table to every
+        # handler when it changes, the handlers must all be registered
+        # before any of them is forked so each inherits every queue
+        self.DirectDelivery = direct
+        self.SubscriberIDs = {}
+        self.TablePending = False
+
+        # map event class --> queues subscribed to the class or any class it
+        # derives from, filled as events arrive and cleared when the
+        # subscriptions change
+        self.DispatchTable = {}
+
+    # -----------------------------------------------------------------
+    def CreateQueue(self) :
+        return self.QueueFactory()
+
     # -----------------------------------------------------------------
     def RegisterHandler(self, handler, queue) :
         self.RouterRegistry[handler] = queue
@@ -71,6 +119,10 @@ class EventRouter :
     def RouteEventsLoop(self) :
         while True :
             try :
+                # send the table once the burst of subscriptions is handled
+                if self.TablePending and self.RouterQueue.empty() :
+                    self.PushSubscriptionTable()
+
                 event = self.RouterQueue.get()
                 evtype = event.__class__
 
@@ -85,6 +137,9 @@ class EventRouter :
                 if evtype == EventTypes.ShutdownEvent and event.RouterShutdown :
                     return
 
+                if self.TablePending :
+                    self.PushSubscriptionTable()
+
                 self.RouteEvent(evtype, event)
             except :
                 exctype, value =  sys.exc_info()[:2]
@@ -93,13 +148,36 @@ class EventRouter :
     # -----------------------------------------------------------------
     def RouteEvent(self, evtype, event) :
         # print "PublishEvent: " + evtype.__name__ + " for " + str(event)
-        if evtype in self.Subscriptions :
-            for queue in self.Subscriptions[evtype] :
-                queue.put(event)
+        queues = self.DispatchTable.get(evtype)
+        if queues is None :
+            queues = self.DispatchTable[evtype] = self.BuildDispatchEntry(evtype)
 
-        bases = evtype.__bases__
-        if bases :
-            self.RouteEvent(bases[0], event)
+        for queue in queues :
+            queue.put(event)
+
+    # -----------------------------------------------------------------
+    def BuildDispatchEntry(self, evtype) :
+        """
+        BuildDispatchEntry -- collect the queues subscribed to an event class
+        and the chain of classes it derives from, a queue subscribed at more
+        than one level of the chain gets the event once
+
+        Args:
+            evtype -- event class
+        """
+        return CollectSubscribers(self.Subscriptions, evtype)
+
+    # -----------------------------------------------------------------
+    def PushSubscriptionTable(self) :
+        """
+        PushSubscriptionTable -- send the handler ids subscribed to each event
+        class to every registered handler
+        """
+        table = dict((evtype, list(ids)) for evtype, ids in self.SubscriberIDs.iteritems() if ids)
+        for queue in self.RouterRegistry.itervalues() :
+            queue.put(EventTypes.SubscriptionTableEvent(table))
+
+        self.TablePending = False
 
     # -----------------------------------------------------------------
     def HandleSubscribeEvent(self, event) :
@@ -110,6 +188,11 @@ class EventRouter :
                 self.Subscriptions[event.EventType] = []
 
             self.Subscriptions[event.EventType].append(queue)
+            self.DispatchTable = {}
+
+            if self.DirectDelivery :
+                self.SubscriberIDs.setdefault(event.EventType, []).append(event.Handler)
+                self.TablePending = True
 
     # -----------------------------------------------------------------
     def HandleUnsubscribeEvent(self, event) :
@@ -118,4 +201,136 @@ class EventRouter :
             queue = self.RouterRegistry[event.Handler]
             if event.EventType in self.Subscriptions :
                 self.Subscriptions[event.EventType].remove(queue)
-    
+                self.DispatchTable = {}
+
+                if self.DirectDelivery :
+                    self.SubscriberIDs[event.EventType].remove(event.Handler)
+                    self.TablePending = True
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    # measure router throughput with synthetic publishers and subscribers,
+    # first the cost of dispatch alone with in process queues and then the
+    # rate through a router process with publisher and subscriber processes
+    #     python EventRouter.py [events] [publishers] [subscribers] [queue|ring]
+    import time
+    import EventHandler, RingQueue
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    npublishers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    nsubscribers = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+    queuefactory = RingQueue.QueueFactory({ "EventTransport" : sys.argv[4] if len(sys.argv) > 4 else "queue" })
+
+    # subscribers take dynamics, object events or timer events in turn
+    subtypes = [EventTypes.EventObjectDynamics, EventTypes.ObjectEvent, EventTypes.TimerEvent]
+
+    def MakeEvent(i) :
+        if i % 10 == 0 :
+            return EventTypes.TimerEvent(i, i)
+        return EventTypes.EventObjectDynamics('veh%d' % (i % 1000), (i, i, 0), (0, 0, 0, 1), (1, 1, 0))
+
+    # -----------------------------------------------------------------
+    class CountingQueue :
+        def __init__(self) :
+            self.Count = 0
+
+        def put(self, event) :
+            self.Count += 1
+
+    # -----------------------------------------------------------------
+    class RecursiveRouter(EventRouter) :
+        # the router before dispatch tables, for comparison
+        def RouteEvent(self, evtype, event) :
+            if evtype in self.Subscriptions :
+                for queue in self.Subscriptions[evtype] :
+                    queue.put(event)
+
+            bases = evtype.__bases__
+            if bases :
+                self.RouteEvent(bases[0], event)
+
+    events = [MakeEvent(i) for i in xrange(0, count)]
+    for rclass in [RecursiveRouter, EventRouter] :
+        router = rclass()
+        queues = []
+        for i in range(0, nsubscribers) :
+            queue = CountingQueue()
+            router.RegisterHandler('sub%d' % i, queue)
+            router.HandleSubscribeEvent(EventTypes.SubscribeEvent('sub%d' % i, subtypes[i % len(subtypes)]))
+            queues.append(queue)
+
+        stime = time.time()
+        for event in events :
+            router.RouteEvent(event.__class__, event)
+        elapsed = time.time() - stime
+
+        delivered = sum(queue.Count for queue in queues)
+        print "{0:16s} {1:.0f} events per second, {2} deliveries".format(rclass.__name__, count / elapsed, delivered)
+
+    # -----------------------------------------------------------------
+    class Subscriber(EventHandler.EventHandler) :
+        def __init__(self, router, evtype, results) :
+            EventHandler.EventHandler.__init__(self, router)
+            self.Results = results
+            self.Count = 0
+            self.SubscribeEvent(evtype, self.HandleCount)
+            self.SubscribeEvent(EventTypes.ShutdownEvent, self.HandleShutdown)
+
+        def HandleCount(self, event) :
+            self.Count += 1
+
+        def HandleShutdown(self, event) :
+            self.Results.put(self.Count)
+
+    # -----------------------------------------------------------------
+    class Publisher(EventHandler.EventHandler) :
+        def Publish(self, first, last) :
+            # with direct delivery wait for the table so every event skips the router
+            if self.DirectDelivery :
+                self.HandleSubscriptionTable(self.HandlerQueue.get())
+            for i in xrange(first, last) :
+                self.PublishEvent(MakeEvent(i))
+
+    for direct in [False, True] :
+        router = EventRouter(direct, queuefactory)
+        results = Queue()
+
+        # every handler has to register before any process starts, the
+        # dynamics and timer subscribers count only their exact event class
+        subscribers = []
+        for i in range(0, nsubscribers) :
+            evtype = subtypes[i % len(subtypes)]
+            if evtype == EventTypes.ObjectEvent :
+                evtype = EventTypes.EventObjectDynamics
+            subscriber = Subscriber(router, evtype, results)
+            subscribers.append(Process(target = subscriber.HandleEvents))
+
+        chunk = (count + npublishers - 1) / npublishers
+        publishers = []
+        for i in range(0, npublishers) :
+            publisher = Publisher(router)
+            publishers.append(Process(target = publisher.Publish, args = (i * chunk, min(count, (i + 1) * chunk))))
+
+        routerproc = Process(target = router.RouteEvents)
+        routerproc.start()
+        for proc in subscribers :
+            proc.start()
+
+        stime = time.time()
+        for proc in publishers :
+            proc.start()
+        for proc in publishers :
+            proc.join()
+
+        router.RouterQueue.put(EventTypes.ShutdownEvent(False))
+        delivered = sum(results.get() for proc in subscribers)
+        elapsed = time.time() - stime
+
+        router.RouterQueue.put(EventTypes.ShutdownEvent(True))
+        for proc in subscribers :
+            proc.join()
+        routerproc.join()
+
+        print "{0:6s} {1} publishers, {2} subscribers: {3:.0f} events per second, {4} deliveries".format(
+            'direct' if direct else 'router', npublishers, nsubscribers, count / elapsed, delivered)
@@ -45,9 +45,17 @@ sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","p
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
+from array import array
+from mobdat.common import ValueTypes
+
+# every event class declares EventFields, the (attribute, kind) pairs that
+# EventCodec packs, see EventCodec for the kinds
+
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class SubscribeEvent :
+    EventFields = (('Handler', 'string'), ('EventType', 'object'))
+
     # -----------------------------------------------------------------
     def __init__(self, handler, evtype) :
         self.Handler = handler
@@ -56,14 +64,31 @@ class SubscribeEvent :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class UnsubscribeEvent :
+    EventFields = (('Handler', 'string'), ('EventType', 'object'))
+
     # -----------------------------------------------------------------
     def __init__(self, handler, evtype) :
         self.Handler = handler
         self.EventType = evtype
 
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class SubscriptionTableEvent :
+    EventFields = (('Subscriptions', 'object'),)
+
+    # -----------------------------------------------------------------
+    def __init__(self, subscriptions) :
+        """
+        Args:
+            subscriptions -- dictionary mapping event class --> list of handler ids
+        """
+        self.Subscriptions = subscriptions
+
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class ShutdownEvent :
+    EventFields = (('RouterShutdown', 'bool'),)
+
     # -----------------------------------------------------------------
     def __init__(self, router) :
         self.RouterShutdown = router
@@ -71,6 +96,8 @@ class ShutdownEvent :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class StatsEvent :
+    EventFields = (('StatKey', 'string'), ('CurrentStep', 'int'))
+
     # -----------------------------------------------------------------
     def __init__(self, timestep, skey = None) :
         self.StatKey = self.__class__.__name__ if not skey else skey
@@ -79,6 +106,8 @@ class StatsEvent :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class TripStatsEvent(StatsEvent) :
+    EventFields = StatsEvent.EventFields + (('Person', 'string'), ('TripID', 'string'), ('SourceNode', 'string'), ('DestinationNode', 'string'))
+
     # -----------------------------------------------------------------
     def __init__(self, timestep, statkey, person, tripid, snode, dnode) :
         StatsEvent.__init__(self, timestep, statkey)
@@ -110,6 +139,8 @@ class TripEndStatsEvent(TripStatsEvent) :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class SumoConnectorStatsEvent(StatsEvent) :
+    EventFields = StatsEvent.EventFields + (('ClockSkew', 'float'), ('VehicleCount', 'int'))
+
     # -----------------------------------------------------------------
     def __init__(self, timestep, clockskew = 0.0, vehiclecount = 0) :
         StatsEvent.__init__(self, timestep, 'sumoconnector')
@@ -125,6 +156,8 @@ class SumoConnectorStatsEvent(StatsEvent) :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class OpenSimConnectorStatsEvent(StatsEvent) :
+    EventFields = StatsEvent.EventFields + (('ClockSkew', 'float'),)
+
     # -----------------------------------------------------------------
     def __init__(self, timestep, clockskew = 0.0) :
         StatsEvent.__init__(self, timestep, 'osconnector')
@@ -139,6 +172,8 @@ class OpenSimConnectorStatsEvent(StatsEvent) :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class TimerEvent :
+    EventFields = (('CurrentStep', 'int'), ('CurrentTime', 'float'))
+
     # -----------------------------------------------------------------
     def __init__(self, currentStep, currentTime) :
         self.CurrentStep = currentStep
@@ -157,6 +192,8 @@ class TimerEvent :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class ObjectEvent :
+    EventFields = (('ObjectIdentity', 'string'),)
+
     # -----------------------------------------------------------------
     def __init__(self, identity) :
         self.ObjectIdentity = identity
@@ -173,6 +210,8 @@ class ObjectEvent :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class EventCreateObject(ObjectEvent) :
+    EventFields = ObjectEvent.EventFields + (('ObjectType', 'string'),)
+
     # -----------------------------------------------------------------
     def __init__(self, identity, objtype) :
         ObjectEvent.__init__(self, identity)
@@ -188,6 +227,8 @@ class EventCreateObject(ObjectEvent) :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class EventAddVehicle(ObjectEvent) :
+    EventFields = ObjectEvent.EventFields + (('ObjectType', 'string'), ('Route', 'string'), ('Target', 'string'))
+
     # -----------------------------------------------------------------
     def __init__(self, identity, objtype, route, target) :
         ObjectEvent.__init__(self, identity)
@@ -220,6 +261,8 @@ class EventDeleteObject(ObjectEvent) :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class EventPropertyChange(ObjectEvent) :
+    EventFields = ObjectEvent.EventFields + (('ObjectProperty', 'string'), ('ObjectValue', 'object'))
+
     # -----------------------------------------------------------------
     def __init__(self, identity, propkey, propval) :
         ObjectEvent.__init__(self, identity)
@@ -235,6 +278,8 @@ class EventPropertyChange(ObjectEvent) :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class EventObjectDynamics(ObjectEvent) :
+    EventFields = ObjectEvent.EventFields + (
+        ('ObjectPosition', 'vector3'), ('ObjectRotation', 'quaternion'), ('ObjectVelocity', 'vector3'))
 
     # -----------------------------------------------------------------
     def __init__(self, identity, position, rotation, velocity) :
@@ -249,9 +294,96 @@ class EventObjectDynamics(ObjectEvent) :
         fstring = "{0},x:{1},y:{2},z:{3}"
         return string.format(pstring,self.ObjectPosition.x,self.ObjectPosition.y,self.ObjectPosition.z)
 
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class EventObjectDynamicsBatch :
+    """
+    EventObjectDynamicsBatch -- the dynamics of all the objects updated in
+    one step, the positions, rotations and velocities are packed into arrays
+    of 3, 4 and 3 doubles per object in the order of ObjectIdentities
+    """
+
+    EventFields = (('ObjectIdentities', 'strings'), ('Positions', 'doubles'), ('Rotations', 'doubles'), ('Velocities', 'doubles'))
+
+    # -----------------------------------------------------------------
+    def __init__(self) :
+        self.ObjectIdentities = []
+        self.Positions = array('d')
+        self.Rotations = array('d')
+        self.Velocities = array('d')
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self.ObjectIdentities)
+
+    # -----------------------------------------------------------------
+    def __getstate__(self) :
+        # arrays pickle as lists of floats, send the raw bytes instead
+        return (self.ObjectIdentities, self.Positions.tostring(), self.Rotations.tostring(), self.Velocities.tostring())
+
+    # -----------------------------------------------------------------
+    def __setstate__(self, state) :
+        self.ObjectIdentities = state[0]
+        self.Positions = array('d')
+        self.Positions.fromstring(state[1])
+        self.Rotations = array('d')
+        self.Rotations.fromstring(state[2])
+        self.Velocities = array('d')
+        self.Velocities.fromstring(state[3])
+
+    # -----------------------------------------------------------------
+    def AddObject(self, identity, position, rotation, velocity) :
+        """
+        Args:
+            identity -- string name of the object
+            position -- sequence of x, y, z
+            rotation -- sequence of x, y, z, w
+            velocity -- sequence of x, y, z
+        """
+        self.ObjectIdentities.append(identity)
+        self.Positions.extend(position)
+        self.Rotations.extend(rotation)
+        self.Velocities.extend(velocity)
+
+    # -----------------------------------------------------------------
+    def IterObjects(self) :
+        """
+        IterObjects -- iterate over the objects as tuples of identity,
+        Vector3 position, Quaternion rotation and Vector3 velocity
+        """
+        pos = self.Positions
+        rot = self.Rotations
+        vel = self.Velocities
+        for i, identity in enumerate(self.ObjectIdentities) :
+            yield (identity,
+                   ValueTypes.Vector3(pos[3*i], pos[3*i+1], pos[3*i+2]),
+                   ValueTypes.Quaternion(rot[4*i], rot[4*i+1], rot[4*i+2], rot[4*i+3]),
+                   ValueTypes.Vector3(vel[3*i], vel[3*i+1], vel[3*i+2]))
+
+    # -----------------------------------------------------------------
+    def ToObjectEvents(self) :
+        """
+        ToObjectEvents -- iterate over an EventObjectDynamics for each object,
+        this is the adapter for handlers that take one object at a time
+        """
+        for identity, position, rotation, velocity in self.IterObjects() :
+            yield EventObjectDynamics(identity, position, rotation, velocity)
+
+    # -----------------------------------------------------------------
+    def __str__(self) :
+        fstring = "Objects:{0}"
+        return fstring.format(len(self.ObjectIdentities))
+
+    # -----------------------------------------------------------------
+    def Dump(self) :
+        fstring = "<{0},{1}>"
+        return fstring.format(self.__class__.__name__,str(self))
+
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class EventInductionLoop(ObjectEvent) :
+    EventFields = ObjectEvent.EventFields + (('VehicleCount', 'int'),)
+
     # -----------------------------------------------------------------
     def __init__(self, identity, count) :
         ObjectEvent.__init__(self, identity)
@@ -266,6 +398,8 @@ class EventInductionLoop(ObjectEvent) :
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class EventTrafficLightStateChange(ObjectEvent) :
+    EventFields = ObjectEvent.EventFields + (('StopLightState', 'string'),)
+
     # -----------------------------------------------------------------
     def __init__(self, identity, state) :
         ObjectEvent.__init__(self, identity)
@@ -362,7 +362,32 @@ class OpenSimConnector(EventHandler.EventHandler, BaseConnector.BaseConnector) :
 
     # -----------------------------------------------------------------
     def HandleObjectDynamicsEvent(self,event) :
-        vname = event.ObjectIdentity
+        pos = event.ObjectPosition
+        vel = event.ObjectVelocity
+        return self.UpdateVehicleDynamics(event.ObjectIdentity, (pos.x, pos.y, pos.z), event.ObjectRotation.ToList(), (vel.x, vel.y, vel.z))
+
+    # -----------------------------------------------------------------
+    def HandleObjectDynamicsBatchEvent(self,event) :
+        pos = event.Positions
+        rot = event.Rotations
+        vel = event.Velocities
+        for i, vname in enumerate(event.ObjectIdentities) :
+            self.UpdateVehicleDynamics(vname, pos[3*i:3*i+3], rot[4*i:4*i+4], vel[3*i:3*i+3])
+
+        return True
+
+    # -----------------------------------------------------------------
+    def UpdateVehicleDynamics(self, vname, position, rotation, velocity) :
+        """
+        UpdateVehicleDynamics -- record the reported dynamics of a vehicle and
+        queue an update for opensim when dead reckoning would drift
+
+        Args:
+            vname -- string name of the vehicle
+            position -- sequence of x, y, z normalized to the world size
+            rotation -- sequence of x, y, z, w
+            velocity -- sequence of x, y, z normalized to the world size
+        """
         if vname not in self.Vehicles :
             self.__Logger.warn("attempt to update unknown vehicle %s" % (vname))
             return True
@@ -373,10 +398,12 @@ class OpenSimConnector(EventHandler.EventHandler, BaseConnector.BaseConnector) :
         if deltat == 0 : return True
 
         # Save the dynamics information, acceleration is only needed in the tween update
+        wsize = self.WorldSize
+        woffs = self.WorldOffset
         update = OpenSimVehicleDynamics()
-        update.Position = event.ObjectPosition.ScaleVector(self.WorldSize).AddVector(self.WorldOffset)
-        update.Velocity = event.ObjectVelocity.ScaleVector(self.WorldSize)
-        update.Rotation = event.ObjectRotation
+        update.Position = ValueTypes.Vector3(position[0] * wsize.x + woffs.x, position[1] * wsize.y + woffs.y, position[2] * wsize.z + woffs.z)
+        update.Velocity = ValueTypes.Vector3(velocity[0] * wsize.x, velocity[1] * wsize.y, velocity[2] * wsize.z)
+        update.Rotation = ValueTypes.Quaternion(rotation[0], rotation[1], rotation[2], rotation[3])
         update.UpdateTime = self.CurrentTime
 
         # Compute the tween update (the update halfway between the last reported position and
@@ -465,6 +492,7 @@ class OpenSimConnector(EventHandler.EventHandler, BaseConnector.BaseConnector) :
         self.SubscribeEvent(EventTypes.EventCreateObject, self.HandleCreateObjectEvent)
         self.SubscribeEvent(EventTypes.EventDeleteObject, self.HandleDeleteObjectEvent)
         self.SubscribeEvent(EventTypes.EventObjectDynamics, self.HandleObjectDynamicsEvent)
+        self.SubscribeEvent(EventTypes.EventObjectDynamicsBatch, self.HandleObjectDynamicsBatchEvent)
         self.SubscribeEvent(EventTypes.TimerEvent, self.HandleTimerEvent)
         self.SubscribeEvent(EventTypes.ShutdownEvent, self.HandleShutdownEvent)
 
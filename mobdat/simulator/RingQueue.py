@@ -0,0 +1,539 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer. 
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution. 
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+
+@file    RingQueue.py
+@author  Mic Bowman
+@date    2014-04-13
+
+This module defines an event queue built on ring buffers in shared memory,
+it has the put and get calls of multiprocessing.Queue. Each producer
+thread claims its own single producer, single consumer ring so writers
+never contend, the consumer takes the oldest message at the head of the
+rings. Events are encoded to bytes by an EventCodec when they are put
+and copied straight into the ring, there is no pipe and no feeder thread.
+
+The rings are anonymous shared mappings so a queue must be created before
+the processes that use it are forked. A producer keeps its ring until it
+exits, the ring of a producer process or thread that is gone is handed to
+the next new producer so only live producers count against the slots.
+
+The ring only pays off on hosts where every connector has its own core. When
+the connectors share cores the consumer and the producers take turns with
+the scheduler and the ring with a codec measured about 22k events per
+second against about 32k for multiprocessing.Queue with a codec, so the
+"queue" transport stays the default and "ring" must be selected.
+
+"""
+
+import os, sys
+import logging
+
+sys.path.append(os.path.join(os.environ.get("SUMO_HOME"), "tools"))
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import mmap, struct, time, thread, errno
+import multiprocessing
+from Queue import Empty, Full
+
+import EventCodec
+
+logger = logging.getLogger(__name__)
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class RingBuffer :
+    """
+    RingBuffer -- a single producer, single consumer ring of messages in
+    an anonymous shared mapping
+
+    The header holds the count of bytes written and the count of bytes
+    read, each on its own cache line and each changed by only one side.
+    A message is a length, the time it was put and the data, a message
+    that would run past the end of the ring starts over at the beginning
+    and leaves a wrap marker behind.
+    """
+
+    WriteOffset = 0
+    ReadOffset = 64
+    DataOffset = 128
+
+    Count = struct.Struct('<Q')
+    Counts = struct.Struct('<Q56xQ')
+    Record = struct.Struct('<Id')
+    RecordSize = Record.size
+    WrapMarker = 0xFFFFFFFF
+
+    # -----------------------------------------------------------------
+    def __init__(self, capacity) :
+        """
+        Args:
+            capacity -- integer number of bytes of message data in the ring
+        """
+        self.Capacity = capacity
+        self.Map = mmap.mmap(-1, RingBuffer.DataOffset + capacity)
+
+    # -----------------------------------------------------------------
+    def _Counts(self) :
+        return RingBuffer.Counts.unpack_from(self.Map, RingBuffer.WriteOffset)
+
+    # -----------------------------------------------------------------
+    def _SetCount(self, offset, count) :
+        # pack_into clears the field before it packs the value so the other
+        # side could see a zero count, the slice copies the word at once
+        self.Map[offset:offset + RingBuffer.Count.size] = RingBuffer.Count.pack(count)
+
+    # -----------------------------------------------------------------
+    def Write(self, data, stamp) :
+        """
+        Write -- add a message to the ring, returns False when there is not
+        enough free space for it
+
+        Args:
+            data -- string of bytes
+            stamp -- float time the message was put
+        """
+        size = RingBuffer.RecordSize + len(data)
+        if size > self.Capacity :
+            raise ValueError('message of {0} bytes does not fit a ring of {1} bytes'.format(len(data), self.Capacity))
+
+        written, read = self._Counts()
+        offset = written % self.Capacity
+        tail = self.Capacity - offset
+        skip = tail if tail < size else 0
+        if written - read + skip + size > self.Capacity :
+            return False
+
+        if skip :
+            # a tail too short for a record header is skipped without a marker
+            if tail >= RingBuffer.RecordSize :
+                RingBuffer.Record.pack_into(self.Map, RingBuffer.DataOffset + offset, RingBuffer.WrapMarker, 0.0)
+            offset = 0
+
+        start = RingBuffer.DataOffset + offset
+        RingBuffer.Record.pack_into(self.Map, start, len(data), stamp)
+        self.Map[start + RingBuffer.RecordSize:start + size] = data
+
+        # publish the message only after it is in place
+        self._SetCount(RingBuffer.WriteOffset, written + skip + size)
+        return True
+
+    # -----------------------------------------------------------------
+    def _Head(self) :
+        """
+        _Head -- return the read count at the start of the next message
+        and the message header, skipping the end of the ring if it wraps,
+        or None when the ring is empty
+        """
+        written, read = self._Counts()
+        if read == written :
+            return None
+
+        offset = read % self.Capacity
+        tail = self.Capacity - offset
+        if tail < RingBuffer.RecordSize :
+            read += tail
+            offset = 0
+        else :
+            length, stamp = RingBuffer.Record.unpack_from(self.Map, RingBuffer.DataOffset + offset)
+            if length != RingBuffer.WrapMarker :
+                return read, length, stamp
+            read += tail
+            offset = 0
+
+        length, stamp = RingBuffer.Record.unpack_from(self.Map, RingBuffer.DataOffset)
+        return read, length, stamp
+
+    # -----------------------------------------------------------------
+    def Peek(self) :
+        """
+        Peek -- return the time the message at the head was put or None
+        when the ring is empty
+        """
+        head = self._Head()
+        return head[2] if head else None
+
+    # -----------------------------------------------------------------
+    def Read(self) :
+        """
+        Read -- remove the message at the head of the ring and return its
+        data, None when the ring is empty
+        """
+        head = self._Head()
+        if head is None :
+            return None
+
+        read, length, stamp = head
+        start = RingBuffer.DataOffset + read % self.Capacity + RingBuffer.RecordSize
+        data = self.Map[start:start + length]
+
+        self._SetCount(RingBuffer.ReadOffset, read + RingBuffer.RecordSize + length)
+        return data
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class RingQueue :
+    """
+    RingQueue -- a queue with one consumer and up to slots live producer
+    threads, each producer writes to its own RingBuffer
+    """
+
+    # the longest sleep of an empty consumer before it looks at the
+    # rings again
+    MaximumWait = 0.01
+
+    # -----------------------------------------------------------------
+    def __init__(self, capacity = 1 << 20, slots = 16, codec = None, spin = 0) :
+        """
+        Args:
+            capacity -- integer number of bytes in the ring of each producer
+            slots -- integer maximum number of live producer threads
+            codec -- EventCodec.EventCodec for the events of this queue
+            spin -- integer number of yields before an empty consumer sleeps,
+                only worth more than zero when producers have their own cores
+        """
+        self.SpinCount = spin
+        self.Rings = [RingBuffer(capacity) for i in range(0, slots)]
+        self.Codec = codec or EventCodec.EventCodec()
+
+        # an idle consumer sets Waiting and sleeps on Available, producers
+        # only post when it is set so a busy consumer drains many messages
+        # for each wake up rather than paying a context switch per message
+        self.Available = multiprocessing.Semaphore(0)
+        self.Waiting = multiprocessing.RawValue('i', 0)
+
+        # slot claims are shared and record the process and thread of the
+        # owner, a pid of zero marks a free slot, the slot of each producer
+        # is cached by the producer keyed by process and thread
+        self.ClaimLock = multiprocessing.Lock()
+        self.OwnerPids = multiprocessing.RawArray('l', slots)
+        self.OwnerThreads = multiprocessing.RawArray('L', slots)
+        self.ProducerSlots = {}
+
+        # one more than the highest claimed slot, the consumer only looks
+        # at the rings below it
+        self.ActiveSlots = multiprocessing.RawValue('i', 0)
+
+    # -----------------------------------------------------------------
+    def _ProducerRing(self) :
+        key = (os.getpid(), thread.get_ident())
+        slot = self.ProducerSlots.get(key)
+        if slot is None :
+            slot = self._ClaimSlot(key)
+
+        return self.Rings[slot]
+
+    # -----------------------------------------------------------------
+    def _ClaimSlot(self, key) :
+        """
+        _ClaimSlot -- claim a free slot for a producer, or the slot of a
+        producer that has exited when every slot is claimed
+
+        Args:
+            key -- tuple of process id and thread id of the producer
+        """
+        with self.ClaimLock :
+            slots = range(0, len(self.Rings))
+            free = [index for index in slots if not self.OwnerPids[index]]
+            if not free :
+                free = [index for index in slots if not self._OwnerAlive(index)]
+            if not free :
+                raise RuntimeError('all {0} producer slots of the ring queue are claimed by live producers'.format(len(self.Rings)))
+
+            # a message left behind by the previous owner is still read in
+            # order since the new owner writes after it
+            slot = free[0]
+            self.OwnerPids[slot], self.OwnerThreads[slot] = key
+            self.ActiveSlots.value = max(self.ActiveSlots.value, slot + 1)
+
+        for stale in [k for k, s in self.ProducerSlots.iteritems() if s == slot] :
+            del self.ProducerSlots[stale]
+        self.ProducerSlots[key] = slot
+
+        return slot
+
+    # -----------------------------------------------------------------
+    def _OwnerAlive(self, slot) :
+        """
+        _OwnerAlive -- return False when the producer that claimed a slot
+        has exited, the threads of other processes cannot be seen so their
+        slots are only freed when the whole process is gone
+
+        Args:
+            slot -- integer index of a claimed slot
+        """
+        pid = self.OwnerPids[slot]
+        if pid == os.getpid() :
+            return self.OwnerThreads[slot] in sys._current_frames()
+
+        try :
+            os.kill(pid, 0)
+        except OSError as detail :
+            return detail.errno != errno.ESRCH
+
+        return True
+
+    # -----------------------------------------------------------------
+    def put(self, event, block = True, timeout = None) :
+        ring = self._ProducerRing()
+        data = self.Codec.Encode(event)
+        stamp = time.time()
+
+        # a full ring waits for the consumer to make room, the first waits
+        # only yield since the consumer may be waiting for this core
+        deadline = None if timeout is None else stamp + timeout
+        delay = 0.0
+        while not self._Write(ring, data, stamp) :
+            if not block or (deadline is not None and time.time() >= deadline) :
+                self.Codec.Rollback()
+                raise Full
+            self._Wake()
+            time.sleep(delay)
+            delay = min(2 * delay or 0.00005, 0.001)
+
+        self._Wake()
+
+    # -----------------------------------------------------------------
+    def _Write(self, ring, data, stamp) :
+        try :
+            return ring.Write(data, stamp)
+        except ValueError :
+            self.Codec.Rollback()
+            raise
+
+    # -----------------------------------------------------------------
+    def _Wake(self) :
+        # clearing the flag keeps a burst of puts from piling up posts that
+        # the consumer would later spin through
+        if self.Waiting.value :
+            self.Waiting.value = 0
+            self.Available.release()
+
+    # -----------------------------------------------------------------
+    def _Take(self) :
+        # the oldest head across the rings keeps messages from different
+        # producers in roughly the order they were put
+        oldest = None
+        stamp = None
+        for ring in self.Rings[:self.ActiveSlots.value] :
+            head = ring.Peek()
+            if head is not None and (stamp is None or head < stamp) :
+                oldest = ring
+                stamp = head
+
+        return oldest.Read() if oldest is not None else None
+
+    # -----------------------------------------------------------------
+    def get(self, block = True, timeout = None) :
+        data = self._Take()
+        if data is not None :
+            return self.Codec.Decode(data)
+        if not block :
+            raise Empty
+
+        deadline = None if timeout is None else time.time() + timeout
+        while True :
+            # yielding first lets a producer on another core write a few
+            # messages before the consumer goes to sleep
+            for spin in range(0, self.SpinCount) :
+                time.sleep(0)
+                data = self._Take()
+                if data is not None :
+                    return self.Codec.Decode(data)
+
+            # check again after setting the flag so a write that missed it is
+            # still seen, the bounded wait covers a post that is lost between
+            # the check and the flag becoming visible to the producer
+            self.Waiting.value = 1
+            data = self._Take()
+            if data is None :
+                wait = RingQueue.MaximumWait
+                if deadline is not None :
+                    wait = min(wait, deadline - time.time())
+                if wait > 0 :
+                    self.Available.acquire(True, wait)
+                data = self._Take()
+            self.Waiting.value = 0
+
+            if data is not None :
+                return self.Codec.Decode(data)
+            if deadline is not None and time.time() >= deadline :
+                raise Empty
+
+    # -----------------------------------------------------------------
+    def empty(self) :
+        for ring in self.Rings[:self.ActiveSlots.value] :
+            if ring.Peek() is not None :
+                return False
+        return True
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class CodecQueue :
+    """
+    CodecQueue -- a multiprocessing.Queue that carries events encoded by
+    a codec, the queue only pickles the encoded string
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, codec = None) :
+        """
+        Args:
+            codec -- EventCodec.EventCodec for the events of this queue
+        """
+        self.Queue = multiprocessing.Queue()
+        self.Codec = codec or EventCodec.EventCodec()
+
+    # -----------------------------------------------------------------
+    def put(self, event, block = True, timeout = None) :
+        data = self.Codec.Encode(event)
+        try :
+            self.Queue.put(data, block, timeout)
+        except :
+            self.Codec.Rollback()
+            raise
+
+    # -----------------------------------------------------------------
+    def get(self, block = True, timeout = None) :
+        return self.Codec.Decode(self.Queue.get(block, timeout))
+
+    # -----------------------------------------------------------------
+    def empty(self) :
+        return self.Queue.empty()
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+def QueueFactory(settings) :
+    """
+    QueueFactory -- return the function that creates the event queues for
+    the transport named by EventTransport in the General settings, "queue"
+    for multiprocessing.Queue or "ring" for a RingQueue, EventEncoding
+    picks "binary" for an EventCodec or "pickle", every queue gets its
+    own codec
+
+    Args:
+        settings -- dictionary of General settings
+    """
+    encoding = settings.get("EventEncoding", "binary")
+    if encoding == "binary" :
+        codecfactory = EventCodec.EventCodec
+    elif encoding == "pickle" :
+        codecfactory = EventCodec.PickleCodec
+    else :
+        raise ValueError("unknown event encoding {0}".format(encoding))
+
+    transport = settings.get("EventTransport", "queue")
+    if transport == "queue" :
+        return lambda : CodecQueue(codecfactory())
+
+    if transport == "ring" :
+        capacity = int(settings.get("RingBufferSize", 1 << 20))
+        slots = int(settings.get("RingBufferSlots", 16))
+        spin = int(settings.get("RingBufferSpin", 0))
+        return lambda : RingQueue(capacity, slots, codecfactory(), spin)
+
+    raise ValueError("unknown event transport {0}".format(transport))
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    # compare the ring queue with multiprocessing.Queue, the throughput of
+    # publisher processes sending dynamics events to one consumer and the
+    # round trip latency of a single event between two processes
+    #     python RingQueue.py [events] [publishers] [roundtrips]
+    import EventTypes
+    from mobdat.common import ValueTypes
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    npublishers = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    roundtrips = int(sys.argv[3]) if len(sys.argv) > 3 else 20000
+
+    def MakeEvent(i) :
+        return EventTypes.EventObjectDynamics('veh%d' % i, ValueTypes.Vector3(i, i, 0.0), ValueTypes.Quaternion(), ValueTypes.Vector3(1.0, 1.0, 0.0))
+
+    # -----------------------------------------------------------------
+    def Publish(queue, first, last) :
+        for i in xrange(first, last) :
+            queue.put(MakeEvent(i))
+
+    # -----------------------------------------------------------------
+    def Echo(requests, replies, count) :
+        for i in xrange(0, count) :
+            replies.put(requests.get())
+
+    factories = [
+        ('queue', multiprocessing.Queue),
+        ('queue+codec', CodecQueue),
+        ('ring', lambda : RingQueue(codec = EventCodec.PickleCodec())),
+        ('ring+codec', RingQueue)
+        ]
+    for name, factory in factories :
+        queue = factory()
+        chunk = (count + npublishers - 1) / npublishers
+        publishers = [multiprocessing.Process(target = Publish, args = (queue, i * chunk, min(count, (i + 1) * chunk))) for i in range(0, npublishers)]
+
+        stime = time.time()
+        for proc in publishers :
+            proc.start()
+
+        received = 0
+        last = {}
+        ordered = True
+        for i in xrange(0, count) :
+            event = queue.get()
+            index = int(event.ObjectIdentity[3:])
+            ordered = ordered and index / chunk not in last or last[index / chunk] < index
+            last[index / chunk] = index
+            received += 1
+        elapsed = time.time() - stime
+
+        for proc in publishers :
+            proc.join()
+
+        print "{0:12s} {1} publishers: {2:.0f} events per second, {3} received, publisher order kept {4}".format(
+            name, npublishers, received / elapsed, received, ordered)
+
+    for name, factory in factories :
+        requests = factory()
+        replies = factory()
+        proc = multiprocessing.Process(target = Echo, args = (requests, replies, roundtrips))
+        proc.start()
+
+        event = MakeEvent(0)
+        stime = time.time()
+        for i in xrange(0, roundtrips) :
+            requests.put(event)
+            replies.get()
+        elapsed = time.time() - stime
+        proc.join()
+
+        print "{0:12s} round trip latency {1:.1f}us".format(name, 1000000.0 * elapsed / roundtrips)
@@ -46,8 +46,25 @@ sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","p
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
-import heapq
-import BaseConnector, EventRouter, EventHandler, EventTypes, Traveler, Trip
+import heapq, random, hashlib, multiprocessing
+import BaseConnector, EventRouter, EventHandler, EventTypes, Traveler, Trip, TripScheduler
+from mobdat.common import RoadNetwork, TravelTimeMatrix, TravelTimeEstimator, BusinessIndex, TimedEvent, PopulationStore
+
+# the connector planning schedules, set before the worker pool forks so
+# the workers inherit the world rather than receiving it through a pipe
+_PlanningConnector = None
+
+# -----------------------------------------------------------------
+def _PlanTravelers(names) :
+    cache = _PlanningConnector.ScheduleCache
+    hits, misses = (cache.Hits, cache.Misses) if cache is not None else (0, 0)
+
+    plans = [_PlanningConnector.PlanTraveler(name) for name in names]
+
+    # the cache lives in the worker, report what this chunk added to it
+    if cache is not None :
+        hits, misses = cache.Hits - hits, cache.Misses - misses
+    return plans, hits, misses
 
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
@@ -62,31 +79,290 @@ class SocialConnector(EventHandler.EventHandler, BaseConnector.BaseConnector) :
 
         self.MaximumTravelers = int(settings["General"].get("MaximumTravelers", 0))
         self.TripCallbackMap = {}
-        self.TripTimerEventQ = []
 
         self.CurrentStep = 0
         self.WorldTime = self.GetWorldTime(self.CurrentStep)
 
+        # pending trips wait in a heap ordered by start time or, with
+        # TripScheduler set to "wheel", in a timing wheel with a bucket for
+        # each of the next TripWheelSlots steps (a day by default)
+        scheduler = settings["SocialConnector"].get("TripScheduler", "heap")
+        if scheduler not in TripScheduler.Schedulers :
+            raise ValueError("unknown trip scheduler {0}".format(scheduler))
+
+        if scheduler == "wheel" :
+            slots = int(settings["SocialConnector"].get("TripWheelSlots", 24.0 * 3600.0 / self.SecondsPerStep))
+            self.TripTimerEventQ = TripScheduler.TimingWheelTripScheduler(self.GetWorldTime, slots, self.CurrentStep)
+        else :
+            self.TripTimerEventQ = TripScheduler.HeapTripScheduler(self.GetWorldTime)
+
+        # free flow travel times through the road network are the prior for
+        # trips that have not been taken, each simulation step covers
+        # SecondsPerStep seconds of world time
+        infofile = settings["General"].get("WorldInfoFile","info.js")
+        self.TravelTimePrior = self.LoadTravelTimePrior(infofile, self.SecondsPerStep / 3600.0)
+
+        # in shared mode all travelers learn travel times in one table, the
+        # table is saved at shutdown to TravelTimeFile so the next simulation
+        # starts warm, both are opt in since a warm start makes the schedules
+        # of a run depend on the runs before it
+        self.TravelTimeTable = None
+        self.TravelTimeFile = settings["SocialConnector"].get("TravelTimeFile")
+        if settings["SocialConnector"].get("SharedTravelTimes", False) :
+            buckets = int(settings["SocialConnector"].get("TravelTimeBuckets", 24))
+            capacity = int(settings["SocialConnector"].get("TravelTimeCapacity", 100000))
+            self.TravelTimeTable = TravelTimeEstimator.TravelTimeTable(buckets, capacity)
+            if self.TravelTimeFile and os.path.exists(self.TravelTimeFile) :
+                self.TravelTimeTable.LoadFromFile(self.TravelTimeFile)
+
+        # travelers pick coffee and lunch places from an index of the
+        # businesses, with NearbyBusinesses > 0 they choose among that many
+        # places closest to home rather than anywhere in the world
+        self.BusinessIndex = BusinessIndex.BusinessIndex(self.World)
+        self.NearbyBusinesses = int(settings["SocialConnector"].get("NearbyBusinesses", 0))
+
+        # constraint solver for the daily schedules, see TimedEventList.Solvers
+        self.ScheduleSolver = settings["SocialConnector"].get("ScheduleSolver", "worklist")
+
+        # with ScheduleWorkers > 0 schedules are solved by a pool of worker
+        # processes, each person then draws from a random stream seeded by
+        # ScheduleSeed and the person's name so the schedules do not depend
+        # on the number of workers, without a ScheduleSeed a new seed is
+        # drawn for every run
+        self.ScheduleWorkers = int(settings["SocialConnector"].get("ScheduleWorkers", 0))
+        self.ScheduleSeed = settings["SocialConnector"].get("ScheduleSeed")
+        if self.ScheduleSeed is None and self.ScheduleWorkers > 0 :
+            self.ScheduleSeed = random.getrandbits(32)
+
+        # with ScheduleCacheSize > 0 travelers sample their first day from
+        # shared schedule templates, travel times are rounded up to a
+        # multiple of ScheduleTravelQuantum hours to group similar commutes,
+        # the cache is opt in since the rounding changes the schedules
+        self.ScheduleCache = None
+        self.ScheduleTravelQuantum = float(settings["SocialConnector"].get("ScheduleTravelQuantum", 0.05))
+        cachesize = int(settings["SocialConnector"].get("ScheduleCacheSize", 0))
+        if cachesize > 0 :
+            self.ScheduleCache = TimedEvent.ScheduleTemplateCache(cachesize)
+
+        # with RollingSchedules travelers plan the next day when they run out
+        # of trips, the days that have been consumed are pruned from the
+        # event lists so the schedules do not grow with the length of the run
+        self.RollingSchedules = settings["SocialConnector"].get("RollingSchedules", False)
+
+        # with LazyTravelers a person is only a (wake time, index, day) entry
+        # in WakeQueue until TravelerWakeLead hours before work, the traveler
+        # is built then to plan the day and released after its last trip so
+        # only the people who are out and about hold a schedule
+        self.LazyTravelers = settings["SocialConnector"].get("LazyTravelers", False)
+        self.TravelerWakeLead = float(settings["SocialConnector"].get("TravelerWakeLead", 3.0))
+        self.WakeQueue = []
+        self.PersonNames = []
+        self.PersonIndex = {}
+        self.PersonPlaces = []
+
+        # with CompactPopulation the Person nodes are moved out of the world
+        # into the columns of a PopulationStore, travelers read their person
+        # through a PersonView built when the traveler is created
+        self.Population = None
+        if settings["SocialConnector"].get("CompactPopulation", False) :
+            self.Population = PopulationStore.PopulationStore.FromWorld(self.World, drop = True)
+
         self.Travelers = {}
         self.CreateTravelers()
 
         self.__Logger.warn('SocialConnector initialization complete')
 
+    # -----------------------------------------------------------------
+    def LoadTravelTimePrior(self, infofile, timescale) :
+        """
+        LoadTravelTimePrior -- memory map the travel time matrix written by the
+        builder, the mapping is created before the connector processes fork so
+        they share the pages. Fall back to routing over the road network when
+        the matrix is missing or older than the world.
+        """
+        matfile = TravelTimeMatrix.MatrixFileName(infofile)
+        if os.path.exists(matfile) :
+            if not os.path.exists(infofile) or os.path.getmtime(matfile) >= os.path.getmtime(infofile) :
+                try :
+                    return TravelTimeMatrix.TravelTimeMatrix(matfile, timescale)
+                except ValueError as detail :
+                    self.__Logger.warn('ignoring travel time matrix; %s', detail)
+            else :
+                self.__Logger.warn('travel time matrix %s is older than the world, ignoring it', matfile)
+
+        return RoadNetwork.RoadNetwork(self.World, timescale)
+
+    # -----------------------------------------------------------------
+    def FindNode(self, name) :
+        """
+        FindNode -- return the node with the name, people come from the
+        population store when the population is compact
+
+        Args:
+            name -- string name of a node in the world
+        """
+        if self.Population is not None :
+            person = self.Population.FindPerson(name)
+            if person is not None :
+                return person
+
+        return self.World.Nodes[name]
+
     # -----------------------------------------------------------------
     def AddTripToEventQueue(self, trip) :
-        heapq.heappush(self.TripTimerEventQ, trip)
+        self.TripTimerEventQ.Add(trip)
 
     # -----------------------------------------------------------------
     def CreateTravelers(self) :
         #for person in self.PerInfo.PersonList.itervalues() :
-        count = 0
-        for name, person in self.World.IterNodes(nodetype = 'Person') :
-            traveler = Traveler.Traveler(person, self)
+        if self.Population is not None :
+            people = self.Population.Names
+        else :
+            people = (name for name, person in self.World.IterNodes(nodetype = 'Person'))
+
+        names = []
+        for name in people :
+            names.append(name)
+            if self.MaximumTravelers > 0 and self.MaximumTravelers < len(names) :
+                break
+
+        if self.LazyTravelers :
+            self.CreateLazyTravelers(names)
+        elif self.ScheduleWorkers > 0 :
+            self.CreateTravelersInParallel(names)
+        else :
+            for name in names :
+                self.SeedTraveler(name)
+                self.Travelers[name] = Traveler.Traveler(self.FindNode(name), self)
+
+        if self.ScheduleCache is not None :
+            self.ScheduleCache.DumpToLog()
+
+    # -----------------------------------------------------------------
+    def CreateTravelersInParallel(self, names) :
+        """
+        CreateTravelersInParallel -- solve the schedules in a pool of worker
+        processes, the workers return the places and trips of each traveler
+        by name and the travelers are recreated from them here
+
+        Args:
+            names -- list of names of Person nodes
+        """
+        global _PlanningConnector
+        _PlanningConnector = self
+
+        chunksize = max(1, len(names) / (4 * self.ScheduleWorkers))
+        chunks = [names[i:i + chunksize] for i in range(0, len(names), chunksize)]
+
+        pool = multiprocessing.Pool(self.ScheduleWorkers)
+        try :
+            plans = pool.map(_PlanTravelers, chunks)
+        finally :
+            pool.close()
+            pool.join()
+            _PlanningConnector = None
+
+        for chunk, (chunkplans, hits, misses) in zip(chunks, plans) :
+            for name, plan in zip(chunk, chunkplans) :
+                self.Travelers[name] = Traveler.Traveler(self.FindNode(name), self, plan = plan)
+
+            if self.ScheduleCache is not None :
+                self.ScheduleCache.Hits += hits
+                self.ScheduleCache.Misses += misses
+
+        self.__Logger.info('planned %d travelers with %d workers', len(names), self.ScheduleWorkers)
+
+    # -----------------------------------------------------------------
+    def CreateLazyTravelers(self, names) :
+        """
+        CreateLazyTravelers -- add a wake up entry for each person, the
+        travelers are built by WakeTravelers when their day begins
+
+        Args:
+            names -- list of names of Person nodes
+        """
+        self.PersonNames = names
+        self.PersonIndex = dict((name, index) for index, name in enumerate(names))
+        self.PersonPlaces = [None] * len(names)
+
+        for index in xrange(0, len(names)) :
+            self.ScheduleWake(index, int(self.WorldTime / 24.0))
+
+        self.__Logger.info('%d of %d travelers are waiting for their first day', len(self.WakeQueue), len(names))
+
+    # -----------------------------------------------------------------
+    def ScheduleWake(self, index, day) :
+        """
+        ScheduleWake -- add a wake up entry for the first day at or after day
+        that the person works, people who never work are not woken
+
+        Args:
+            index -- integer index of the person in PersonNames
+            day -- integer world day
+        """
+        person = self.FindNode(self.PersonNames[index])
+        schedule = person.JobDescription.Schedule.NextScheduledEvent(day * 24.0)
+        if schedule is None :
+            return
+
+        waketime = schedule.WorldStartTime - self.TravelerWakeLead
+        heapq.heappush(self.WakeQueue, (waketime, index, schedule.Day))
+
+    # -----------------------------------------------------------------
+    def WakeTravelers(self) :
+        """
+        WakeTravelers -- build the travelers whose wake up time has arrived,
+        plan their day and schedule the first trip
+        """
+        while self.WakeQueue and self.WakeQueue[0][0] <= self.WorldTime :
+            waketime, index, day = heapq.heappop(self.WakeQueue)
+
+            name = self.PersonNames[index]
+            places = self.PersonPlaces[index]
+            if places is None :
+                traveler = Traveler.Traveler(self.FindNode(name), self, schedule = False, day = day)
+            else :
+                traveler = Traveler.Traveler(self.FindNode(name), self, plan = (dict(places), [], None), schedule = False)
+                traveler.PlanDailyEvents(day)
+
             self.Travelers[name] = traveler
+            traveler.ScheduleNextTrip()
 
-            count += 1
-            if self.MaximumTravelers > 0 and self.MaximumTravelers < count :
-                break
+    # -----------------------------------------------------------------
+    def ReleaseTraveler(self, traveler) :
+        """
+        ReleaseTraveler -- drop a lazy traveler that has no more trips, the
+        places it picked are kept for the next time it is woken
+
+        Args:
+            traveler -- Traveler.Traveler
+        """
+        name = traveler.Person.Name
+        index = self.PersonIndex[name]
+
+        self.PersonPlaces[index] = tuple(traveler.ExportPlan()[0].iteritems())
+        del self.Travelers[name]
+
+        self.ScheduleWake(index, traveler.PlannedDay + 1)
+
+    # -----------------------------------------------------------------
+    def SeedTraveler(self, name) :
+        """
+        SeedTraveler -- start the random stream for a person, does nothing
+        unless a schedule seed is set
+        """
+        if self.ScheduleSeed is not None :
+            digest = hashlib.md5('{0}:{1}'.format(self.ScheduleSeed, name)).hexdigest()
+            random.seed(int(digest[:16], 16))
+
+    # -----------------------------------------------------------------
+    def PlanTraveler(self, name) :
+        """
+        PlanTraveler -- solve the schedule for one person without adding
+        trips to the queue, returns the plan from Traveler.ExportPlan
+        """
+        self.SeedTraveler(name)
+        return Traveler.Traveler(self.FindNode(name), self, schedule = False).ExportPlan()
 
             
     # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
@@ -178,22 +454,22 @@ class SocialConnector(EventHandler.EventHandler, BaseConnector.BaseConnector) :
         self.CurrentStep = event.CurrentStep
         self.WorldTime = self.GetWorldTime(self.CurrentStep)
 
+        if self.WakeQueue :
+            self.WakeTravelers()
+
         if self.CurrentStep % 100 == 0 :
             wtime = self.WorldTime
             qlen = len(self.TripTimerEventQ)
-            stime = self.TripTimerEventQ[0].ScheduledStartTime if self.TripTimerEventQ else 0.0
+            stime = self.TripTimerEventQ.NextStartTime() if qlen else 0.0
             self.__Logger.info('at time %0.3f, timer queue contains %s elements, next event scheduled for %0.3f', wtime, qlen, stime)
 
-        while self.TripTimerEventQ :
-            if self.TripTimerEventQ[0].ScheduledStartTime > self.WorldTime :
-                break
-
-            trip = heapq.heappop(self.TripTimerEventQ)
+        for trip in self.TripTimerEventQ.PopDueTrips(self.CurrentStep) :
             trip.TripStarted(self)
 
     # -----------------------------------------------------------------
     def HandleShutdownEvent(self, event) :
-        pass
+        if self.TravelTimeTable is not None and self.TravelTimeFile :
+            self.TravelTimeTable.SaveToFile(self.TravelTimeFile)
 
     # -----------------------------------------------------------------
     def SimulationStart(self) :
@@ -89,7 +89,7 @@ class SumoConnector(EventHandler.EventHandler, BaseConnector.BaseConnector) :
     # -----------------------------------------------------------------
     # -----------------------------------------------------------------
     def __NormalizeCoordinate(self,pos) :
-        return ValueTypes.Vector3((pos[0] - self.XBase) / self.XSize, (pos[1] - self.YBase) / self.YSize, 0.0)
+        return ((pos[0] - self.XBase) / self.XSize, (pos[1] - self.YBase) / self.YSize, 0.0)
 
     # -----------------------------------------------------------------
     # see http://www.euclideanspace.com/maths/geometry/rotations/conversions/eulerToQuaternion/
@@ -98,7 +98,7 @@ class SumoConnector(EventHandler.EventHandler, BaseConnector.BaseConnector) :
     def __NormalizeAngle(self,heading) :
         # convert to radians
         heading = (2.0 * heading * math.pi) / 360.0
-        return ValueTypes.Quaternion.FromHeading(heading)
+        return ValueTypes.Quaternion.HeadingComponents(heading)
 
     # -----------------------------------------------------------------
     def __NormalizeVelocity(self, speed, heading) :
@@ -113,7 +113,7 @@ class SumoConnector(EventHandler.EventHandler, BaseConnector.BaseConnector) :
         x = self.VelocityFudgeFactor * self.TimeScale * speed * math.cos(heading)
         y = self.VelocityFudgeFactor * self.TimeScale * speed * math.sin(heading)
 
-        return ValueTypes.Vector3(x / self.XSize, y / self.YSize, 0.0)
+        return (x / self.XSize, y / self.YSize, 0.0)
 
     # -----------------------------------------------------------------
     def _RecomputeRoutes(self) :
@@ -176,13 +176,19 @@ class SumoConnector(EventHandler.EventHandler, BaseConnector.BaseConnector) :
 
     # -----------------------------------------------------------------
     def HandleVehicleUpdates(self, currentStep) :
+        # all the vehicles of the step go out in one event, the normalized
+        # values are tuples packed straight into the arrays of the batch
+        batch = EventTypes.EventObjectDynamicsBatch()
+
         changelist = traci.vehicle.getSubscriptionResults()
         for v, info in changelist.iteritems() :
             pos = self.__NormalizeCoordinate(info[tc.VAR_POSITION])
             ang = self.__NormalizeAngle(info[tc.VAR_ANGLE])
             vel = self.__NormalizeVelocity(info[tc.VAR_SPEED], info[tc.VAR_ANGLE])
-            event = EventTypes.EventObjectDynamics(v, pos, ang, vel)
-            self.PublishEvent(event)
+            batch.AddObject(v, pos, ang, vel)
+
+        if len(batch) > 0 :
+            self.PublishEvent(batch)
 
     # -----------------------------------------------------------------
     # def HandleRerouteVehicle(self, event) :
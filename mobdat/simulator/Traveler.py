@@ -46,7 +46,8 @@ sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","p
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
 sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
-import random
+import random, math
+from collections import deque
 import Trip
 
 from mobdat.common import TravelTimeEstimator, TimedEvent, TimeVariable
@@ -78,11 +79,14 @@ class EventController :
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 class Traveler :
     # -----------------------------------------------------------------
-    def __init__(self, person, connector) :
+    def __init__(self, person, connector, plan = None, schedule = True, day = None) :
         """
         Args:
             person -- Graph.Node (NodeType == Person) or SocialNodes.Person
             connector -- SocialConnector
+            plan -- tuple of places, trips and planned day from ExportPlan, None to build the schedule
+            schedule -- boolean, add the first trip to the connector's queue
+            day -- integer day to plan when there is no plan, defaults to the current day
         """
         self.Connector = connector
         self.World = self.Connector.World
@@ -91,19 +95,60 @@ class Traveler :
         self.Employer = self.Person.EmployedBy
         self.Job = self.Person.JobDescription
 
-        self.InitializeLocationNameMap()
-        self.TravelEstimator = TravelTimeEstimator.TravelTimeEstimator()
+        # queue of (start time, source capsule, destination capsule) for
+        # the trips in the solved schedule
+        self.TripList = deque()
+
+        # the last day added to the schedule, with rolling schedules the
+        # following days are planned as the trips run out
+        self.PlannedDay = None
+
+        if plan is None :
+            self.InitializeLocationNameMap()
+        else :
+            self.LocationNameMap = dict((name, self.Connector.FindNode(node)) for name, node in plan[0].iteritems())
+
+        self.TravelEstimator = TravelTimeEstimator.TravelTimeEstimator(self.Connector.TravelTimePrior, self.FindLocation, self.Connector.TravelTimeTable)
 
         self.Controller = EventController()
-        self.EventList = TimedEvent.TimedEventList('home', 7 * 24.0, estimator = self.TravelEstimator)
+        self.EventList = self.CreateEventList()
+
+        if plan is None :
+            self.PlanDailyEvents(day)
+            if self.Connector.RollingSchedules and not self.Connector.LazyTravelers :
+                self.PlanAhead()
+        else :
+            self.TripList.extend((stime, self.Connector.FindNode(src), self.Connector.FindNode(dst)) for stime, src, dst in plan[1])
+            self.PlannedDay = plan[2]
+
+        if schedule :
+            self.ScheduleNextTrip()
 
-        self.BuildDailyEvents()
+    # -----------------------------------------------------------------
+    def ExportPlan(self) :
+        """
+        ExportPlan -- return the places, pending trips and last planned day of
+        the traveler by name so they can be passed between processes
+        """
+        places = dict((name, node.Name) for name, node in self.LocationNameMap.iteritems())
+        trips = [(stime, src.Name, dst.Name) for stime, src, dst in self.TripList]
+        return (places, trips, self.PlannedDay)
+
+    # -----------------------------------------------------------------
+    def CreateEventList(self) :
+        return TimedEvent.TimedEventList('home', 7 * 24.0, estimator = self.TravelEstimator, solver = self.Connector.ScheduleSolver)
 
     # -----------------------------------------------------------------
     def FindBusinessByType(self, biztype, bizclass) :
-        predicate = SocialDecoration.BusinessProfileDecoration.BusinessTypePred(biztype, bizclass)
-        nodes = self.World.FindNodes(nodetype = 'Business', predicate = predicate)
-        return random.choice(nodes)
+        if self.Connector.NearbyBusinesses > 0 :
+            business = self.Connector.BusinessIndex.PickNearbyBusiness(biztype, bizclass, self.Person, self.Connector.NearbyBusinesses)
+        else :
+            business = self.Connector.BusinessIndex.PickBusiness(biztype, bizclass)
+
+        if business is None :
+            raise ValueError("no business of type {0} with class {1} for {2}".format(biztype, bizclass, self.Person.Name))
+
+        return business
     
     # -----------------------------------------------------------------
     def InitializeLocationNameMap(self) :
@@ -117,49 +162,181 @@ class Traveler :
     def ResolveLocationName(self, name) :
         return self.LocationNameMap[name].ResidesAt
 
+    # -----------------------------------------------------------------
+    def FindLocation(self, name) :
+        """
+        FindLocation -- resolve a place name to the capsule where the place
+        is located, returns None for names with no known location
+        """
+        return self.ResolveLocationName(name) if name in self.LocationNameMap else None
+
     # -----------------------------------------------------------------
     def BuildDailyEvents(self) :
-        worldday = int(self.Connector.WorldTime / 24.0)
-        worldtime = worldday * 24.0
+        if self.PlanDailyEvents() :
+            self.ScheduleNextTrip()
+
+    # -----------------------------------------------------------------
+    def PlanDailyEvents(self, worldday = None) :
+        """
+        PlanDailyEvents -- add the events for a day to the schedule, solve it
+        and append the resulting trips to the trip list
+
+        Args:
+            worldday -- integer day to plan, defaults to the current day
 
-        jobdeviation = 2.0 if self.Job.FlexibleHours else 0.2
+        Returns:
+            True if the schedule constraints were resolved
+        """
+        if worldday is None :
+            worldday = int(self.Connector.WorldTime / 24.0)
+        worldtime = worldday * 24.0
 
-        lastev = self.EventList.LastEvent.EventID
+        firstday = self.PlannedDay is None
+        self.PlannedDay = worldday
 
         schedule = self.Job.Schedule.NextScheduledEvent(worldtime)
-        if schedule.Day == worldday :
-            workev = AddWorkEvent(self.EventList, lastev, schedule, deviation = jobdeviation)
+        working = schedule.Day == worldday
+        coffee = working and self.Controller.FireCoffeeBeforeWork(schedule)
+        lunch = working and self.Controller.FireLunchAtWork(schedule)
 
-            if self.Controller.FireCoffeeBeforeWork(schedule) :
-                AddCoffeeBeforeWorkEvent(self.EventList, workev, worldtime)
+        # templates describe a day planned from an empty event list
+        if self.Connector.ScheduleCache is not None and firstday and len(self.EventList.Events) == 1 :
+            return self.PlanDailyEventsFromTemplate(schedule if working else None, worldtime, coffee, lunch)
 
-            if self.Controller.FireLunchAtWork(schedule) :
-                AddLunchToPlaceEvent(self.EventList, workev, worldtime)
+        # drop the days that have been consumed and move the horizon of the
+        # event list so that the new day fits
+        if self.Connector.RollingSchedules :
+            self.EventList.RollHorizon(worldtime)
+
+        AddDailyEvents(self.EventList, schedule if working else None, worldtime, self.Job.FlexibleHours, coffee, lunch)
 
         if not self.EventList.SolveConstraints() :
             logger.warn('Failed to resolve schedule constraints for traveler %s', self.Person.Name)
             self.EventList.DumpToLog()
-            return
 
-        self.ScheduleNextTrip()
+            # the unresolved events would be carried into the next day
+            if self.Connector.RollingSchedules :
+                self.EventList = self.CreateEventList()
+            return False
 
-    # -----------------------------------------------------------------
-    def ScheduleNextTrip(self) :
         while self.EventList.MoreTripEvents() :
             tripev = self.EventList.PopTripEvent()
-            starttime = float(tripev.StartTime)
+            source = self.ResolveLocationName(tripev.SrcName)
+            destination = self.ResolveLocationName(tripev.DstName)
+            self.TripList.append((float(tripev.StartTime), source, destination))
+
+        return True
+
+    # -----------------------------------------------------------------
+    def PlanDailyEventsFromTemplate(self, schedule, worldtime, coffee, lunch) :
+        """
+        PlanDailyEventsFromTemplate -- sample the trips for the day from a cached
+        template, travelers whose days have the same shape share a template so
+        only the first of them builds and propagates the constraint network
+
+        Args:
+            schedule -- Schedule.ScheduledEvent for work today or None
+            worldtime -- float world time at the start of the day
+            coffee -- boolean, stop for coffee before work
+            lunch -- boolean, go out for lunch during work
+
+        Returns:
+            True if the schedule constraints were resolved
+        """
+        flexible = self.Job.FlexibleHours
+        legs = self.ClassifyTravelTimes(schedule, worldtime, coffee, lunch) if schedule else ()
+        shape = (schedule.Day, schedule.StartTime, schedule.EndTime) if schedule else None
+        key = (worldtime, shape, flexible, coffee, lunch, legs)
+
+        def BuildTemplate() :
+            evlist = TimedEvent.TimedEventList('home', 7 * 24.0, estimator = FixedTravelTimeEstimator(dict(legs)))
+            AddDailyEvents(evlist, schedule, worldtime, flexible, coffee, lunch)
+            return TimedEvent.ScheduleTemplate(evlist)
+
+        trips = self.Connector.ScheduleCache.FindTemplate(key, BuildTemplate).Sample()
+        if trips is None :
+            logger.warn('Failed to resolve schedule constraints for traveler %s', self.Person.Name)
+            return False
+
+        for starttime, srcname, dstname in trips :
+            self.TripList.append((starttime, self.ResolveLocationName(srcname), self.ResolveLocationName(dstname)))
+
+        return True
+
+    # -----------------------------------------------------------------
+    def ClassifyTravelTimes(self, schedule, worldtime, coffee, lunch) :
+        """
+        ClassifyTravelTimes -- estimate the travel time for each leg of the
+        day, rounded up to a multiple of ScheduleTravelQuantum so that
+        travelers with similar commutes share a schedule template
+
+        Returns:
+            Tuple of ((source, destination), hours) for the legs of the day
+        """
+        legs = []
+        if coffee :
+            legs.append(('home', 'coffee', schedule.WorldStartTime))
+            legs.append(('coffee', 'work', schedule.WorldStartTime))
+        else :
+            legs.append(('home', 'work', schedule.WorldStartTime))
+
+        if lunch :
+            legs.append(('work', 'lunch', worldtime + 12.0))
+            legs.append(('lunch', 'work', worldtime + 13.0))
+
+        legs.append(('work', 'home', schedule.WorldEndTime))
+
+        quantum = self.Connector.ScheduleTravelQuantum
+        result = []
+        for src, dst, when in legs :
+            hours = self.TravelEstimator.ComputeTravelTime(src, dst, when)
+            if quantum > 0 :
+                hours = math.ceil(hours / quantum) * quantum
+            result.append(((src, dst), hours))
+
+        return tuple(result)
+
+    # -----------------------------------------------------------------
+    def PlanAhead(self) :
+        """
+        PlanAhead -- plan the days after the last planned day until there is
+        a trip that starts after the current world time, planning stops a
+        week past the current day. A day that cannot be resolved is skipped.
+
+        Returns:
+            True if there is a trip in the future
+        """
+        worldday = int(self.Connector.WorldTime / 24.0)
+        while not self.TripList or self.TripList[-1][0] <= self.Connector.WorldTime :
+            nextday = worldday if self.PlannedDay is None else max(self.PlannedDay + 1, worldday)
+            if nextday > worldday + 7 :
+                return False
+
+            self.PlanDailyEvents(nextday)
+
+        return True
+
+    # -----------------------------------------------------------------
+    def ScheduleNextTrip(self) :
+        # lazy travelers are released after their last trip of the day and
+        # the connector plans the next day when it wakes them again
+        if self.Connector.RollingSchedules and not self.Connector.LazyTravelers :
+            self.PlanAhead()
+
+        while self.TripList :
+            starttime, source, destination = self.TripList.popleft()
 
             # this just allows us to start in the middle of the day, traveler at work
             # will start at work rather than starting at home
             if starttime > self.Connector.WorldTime :
-                source = self.ResolveLocationName(tripev.SrcName)
-                destination = self.ResolveLocationName(tripev.DstName)
                 self.Connector.AddTripToEventQueue(Trip.Trip(self, starttime, source, destination))
 
                 logger.info('Scheduled trip from %s to %s', source.Name, destination.Name)
                 return
 
         logger.info('No trip events for %s', self.Person.Name)
+        if self.Connector.LazyTravelers :
+            self.Connector.ReleaseTraveler(self)
 
     # -----------------------------------------------------------------
     def TripCompleted(self, trip) :
@@ -169,13 +346,58 @@ class Traveler :
         Args:
             trip -- initialized Trip object
         """
-        self.TravelEstimator.SaveTravelTime(trip.Source, trip.Destination, self.Connector.WorldTime - trip.ActualStartTime)
+        duration = self.Connector.WorldTime - trip.ActualStartTime
+        self.TravelEstimator.SaveTravelTime(trip.Source, trip.Destination, duration, trip.ActualStartTime)
         self.ScheduleNextTrip()
 
     # -----------------------------------------------------------------
     def TripStarted(self, trip) :
         pass
 
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class FixedTravelTimeEstimator :
+    """
+    FixedTravelTimeEstimator -- travel times for the legs of a schedule
+    template, the same legs always give the same template
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, legs) :
+        """
+        Args:
+            legs -- dictionary mapping (source, destination) --> hours
+        """
+        self.Legs = legs
+
+    # -----------------------------------------------------------------
+    def ComputeTravelTime(self, src, dst, when = None) :
+        return self.Legs.get((src, dst), TimedEvent.TravelEvent.DefaultDuration)
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+def AddDailyEvents(evlist, schedule, worldtime, flexible, coffee, lunch) :
+    """Add the events for one day to an event list
+
+    Args:
+        schedule -- Schedule.ScheduledEvent for work that day or None
+        worldtime -- float world time at the start of the day
+        flexible -- boolean, the job has flexible hours
+        coffee -- boolean, stop for coffee before work
+        lunch -- boolean, go out for lunch during work
+    """
+    if schedule is None :
+        return
+
+    jobdeviation = 2.0 if flexible else 0.2
+    workev = AddWorkEvent(evlist, evlist.LastEvent.EventID, schedule, deviation = jobdeviation)
+
+    if coffee :
+        AddCoffeeBeforeWorkEvent(evlist, workev, worldtime)
+
+    if lunch :
+        AddLunchToPlaceEvent(evlist, workev, worldtime)
+
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 ## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 def AddWorkEvent(evlist, event, schedule, deviation = 2.0) :
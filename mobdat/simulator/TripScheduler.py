@@ -0,0 +1,396 @@
+#!/usr/bin/env python
+"""
+Copyright (c) 2014, Intel Corporation
+
+Redistribution and use in source and binary forms, with or without
+modification, are permitted provided that the following conditions are
+met:
+
+* Redistributions of source code must retain the above copyright notice,
+  this list of conditions and the following disclaimer. 
+
+* Redistributions in binary form must reproduce the above copyright
+  notice, this list of conditions and the following disclaimer in the
+  documentation and/or other materials provided with the distribution. 
+
+* Neither the name of Intel Corporation nor the names of its
+  contributors may be used to endorse or promote products derived from
+  this software without specific prior written permission. 
+
+THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS "AS
+IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT LIMITED
+TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR A
+PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT OWNER
+OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL, SPECIAL,
+EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT LIMITED TO,
+PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE, DATA, OR
+PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY THEORY OF
+LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT (INCLUDING
+NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE OF THIS
+SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE. 
+
+@file    TripScheduler.py
+@author  Mic Bowman
+@date    2014-04-09
+
+This module defines the queues that hold the trips waiting to start in
+the SocialConnector. HeapTripScheduler keeps the trips in a binary heap
+ordered by start time. TimingWheelTripScheduler hashes trips into one
+bucket per simulation step so that adding a trip is constant time and
+each timer event only touches the trips that are due.
+
+"""
+
+import os, sys
+import logging
+
+sys.path.append(os.path.join(os.environ.get("SUMO_HOME"), "tools"))
+sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","python"))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..")))
+sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
+
+import heapq, itertools
+
+logger = logging.getLogger(__name__)
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class HeapTripScheduler :
+    """
+    HeapTripScheduler -- trips in a heap of (start time, sequence, trip)
+    entries, cancelled trips are left in the heap and skipped when they
+    reach the top
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, steptime) :
+        """
+        Args:
+            steptime -- function that maps a simulation step to world time
+        """
+        self.StepTime = steptime
+
+        self.Heap = []
+        self.Sequence = itertools.count()
+
+        # map trip id --> heap entry for the trips that are pending
+        self.Entries = {}
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self.Entries)
+
+    # -----------------------------------------------------------------
+    def __iter__(self) :
+        return (entry[2] for entry in self.Entries.itervalues())
+
+    # -----------------------------------------------------------------
+    def Add(self, trip) :
+        """
+        Add -- add a trip to start at its scheduled start time
+
+        Args:
+            trip -- Trip.Trip
+        """
+        if trip.TripID in self.Entries :
+            raise ValueError('trip {0} is already scheduled'.format(trip.TripID))
+
+        entry = [trip.ScheduledStartTime, next(self.Sequence), trip]
+        self.Entries[trip.TripID] = entry
+        heapq.heappush(self.Heap, entry)
+
+    # -----------------------------------------------------------------
+    def Cancel(self, trip) :
+        """
+        Cancel -- remove a pending trip, returns False if the trip is not pending
+
+        Args:
+            trip -- Trip.Trip
+        """
+        entry = self.Entries.pop(trip.TripID, None)
+        if entry is None :
+            return False
+
+        entry[2] = None
+        return True
+
+    # -----------------------------------------------------------------
+    def Reschedule(self, trip, stime) :
+        """
+        Reschedule -- move a trip to a new start time
+
+        Args:
+            trip -- Trip.Trip
+            stime -- float, new world time at the start of the trip
+        """
+        self.Cancel(trip)
+        trip.ScheduledStartTime = stime
+        self.Add(trip)
+
+    # -----------------------------------------------------------------
+    def NextStartTime(self) :
+        while self.Heap and self.Heap[0][2] is None :
+            heapq.heappop(self.Heap)
+
+        return self.Heap[0][0] if self.Heap else None
+
+    # -----------------------------------------------------------------
+    def PopDueTrips(self, currentstep) :
+        """
+        PopDueTrips -- remove and return the trips whose start time has been
+        reached, in order of start time
+
+        Args:
+            currentstep -- integer simulation step
+        """
+        worldtime = self.StepTime(currentstep)
+
+        trips = []
+        heap = self.Heap
+        while heap and heap[0][0] <= worldtime :
+            trip = heapq.heappop(heap)[2]
+            if trip is not None :
+                del self.Entries[trip.TripID]
+                trips.append(trip)
+
+        return trips
+
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+# XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+class TimingWheelTripScheduler :
+    """
+    TimingWheelTripScheduler -- a calendar queue with one bucket for each
+    of the next Slots simulation steps, trips further out wait in an
+    overflow heap until the wheel turns far enough to hold them
+    """
+
+    # -----------------------------------------------------------------
+    def __init__(self, steptime, slots = 43200, currentstep = 0) :
+        """
+        Args:
+            steptime -- function that maps a simulation step to world time
+            slots -- number of steps covered by the wheel
+            currentstep -- integer step of the last drain, trips at or before it are due
+        """
+        self.StepTime = steptime
+        self.Slots = slots
+        self.Cursor = currentstep
+
+        self.StartTime = steptime(0)
+        self.StepLength = steptime(1) - self.StartTime
+
+        # Wheel[step % Slots] maps trip id --> (sequence, trip) for the steps
+        # from Cursor + 1 through Cursor + Slots, buckets are created on
+        # demand, the sequence orders trips with the same start time
+        self.Wheel = [None] * slots
+
+        # heap of (step, sequence, trip id) for trips past the wheel, the
+        # entry is stale if the trip is no longer in OverflowTrips
+        self.Overflow = []
+        self.OverflowTrips = {}
+        self.Sequence = itertools.count()
+
+        # map trip id --> step for the trips that are pending
+        self.Steps = {}
+
+    # -----------------------------------------------------------------
+    def __len__(self) :
+        return len(self.Steps)
+
+    # -----------------------------------------------------------------
+    def __iter__(self) :
+        for bucket in self.Wheel :
+            if bucket :
+                for seq, trip in bucket.itervalues() :
+                    yield trip
+
+        for seq, trip in self.OverflowTrips.itervalues() :
+            yield trip
+
+    # -----------------------------------------------------------------
+    def StepOf(self, stime) :
+        """
+        StepOf -- return the first step whose world time is at or after stime,
+        the estimate is corrected with steptime so that a trip comes due on
+        exactly the step where the heap would start it
+        """
+        step = int((stime - self.StartTime) / self.StepLength)
+        while self.StepTime(step) < stime :
+            step += 1
+        while self.StepTime(step - 1) >= stime :
+            step -= 1
+
+        return step
+
+    # -----------------------------------------------------------------
+    def Add(self, trip) :
+        """
+        Add -- add a trip to start at its scheduled start time
+
+        Args:
+            trip -- Trip.Trip
+        """
+        if trip.TripID in self.Steps :
+            raise ValueError('trip {0} is already scheduled'.format(trip.TripID))
+
+        # trips that are already late start on the next drain
+        step = max(self.StepOf(trip.ScheduledStartTime), self.Cursor + 1)
+        seq = next(self.Sequence)
+        self.Steps[trip.TripID] = step
+
+        if step - self.Cursor > self.Slots :
+            self.OverflowTrips[trip.TripID] = (seq, trip)
+            heapq.heappush(self.Overflow, (step, seq, trip.TripID))
+            return
+
+        slot = step % self.Slots
+        bucket = self.Wheel[slot]
+        if bucket is None :
+            bucket = self.Wheel[slot] = {}
+        bucket[trip.TripID] = (seq, trip)
+
+    # -----------------------------------------------------------------
+    def Cancel(self, trip) :
+        """
+        Cancel -- remove a pending trip, returns False if the trip is not pending
+
+        Args:
+            trip -- Trip.Trip
+        """
+        step = self.Steps.pop(trip.TripID, None)
+        if step is None :
+            return False
+
+        # overflow entries are dropped when they reach the top of the heap
+        if self.OverflowTrips.pop(trip.TripID, None) is None :
+            del self.Wheel[step % self.Slots][trip.TripID]
+        return True
+
+    # -----------------------------------------------------------------
+    def Reschedule(self, trip, stime) :
+        """
+        Reschedule -- move a trip to a new start time
+
+        Args:
+            trip -- Trip.Trip
+            stime -- float, new world time at the start of the trip
+        """
+        self.Cancel(trip)
+        trip.ScheduledStartTime = stime
+        self.Add(trip)
+
+    # -----------------------------------------------------------------
+    def NextStartTime(self) :
+        for step in xrange(self.Cursor + 1, self.Cursor + self.Slots + 1) :
+            bucket = self.Wheel[step % self.Slots]
+            if bucket :
+                return min(trip.ScheduledStartTime for seq, trip in bucket.itervalues())
+
+        if self.OverflowTrips :
+            return min(trip.ScheduledStartTime for seq, trip in self.OverflowTrips.itervalues())
+        return None
+
+    # -----------------------------------------------------------------
+    def _Refill(self) :
+        """
+        _Refill -- move the overflow trips that now fall within the wheel into
+        their buckets
+        """
+        horizon = self.Cursor + self.Slots
+        while self.Overflow and self.Overflow[0][0] <= horizon :
+            step, seq, tripid = heapq.heappop(self.Overflow)
+            entry = self.OverflowTrips.get(tripid)
+            if entry is None or entry[0] != seq :
+                continue
+
+            del self.OverflowTrips[tripid]
+            slot = step % self.Slots
+            bucket = self.Wheel[slot]
+            if bucket is None :
+                bucket = self.Wheel[slot] = {}
+            bucket[tripid] = entry
+
+    # -----------------------------------------------------------------
+    def PopDueTrips(self, currentstep) :
+        """
+        PopDueTrips -- remove and return the trips whose start time has been
+        reached, in order of start time
+
+        Args:
+            currentstep -- integer simulation step
+        """
+        trips = []
+        while self.Cursor < currentstep :
+            self.Cursor += 1
+            slot = self.Cursor % self.Slots
+            bucket = self.Wheel[slot]
+            if bucket :
+                self.Wheel[slot] = None
+                for seq, trip in sorted(bucket.itervalues(), key = lambda entry : (entry[1].ScheduledStartTime, entry[0])) :
+                    del self.Steps[trip.TripID]
+                    trips.append(trip)
+
+            if self.Overflow :
+                self._Refill()
+
+        return trips
+
+# -----------------------------------------------------------------
+Schedulers = {
+    'heap' : HeapTripScheduler,
+    'wheel' : TimingWheelTripScheduler
+}
+
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+## XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
+if __name__ == '__main__' :
+    # compare the schedulers with a large number of pending trips
+    #     python TripScheduler.py [trips] [days]
+    import random, time
+
+    class BenchmarkTrip :
+        def __init__(self, tripid, stime) :
+            self.TripID = tripid
+            self.ScheduledStartTime = stime
+
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000000
+    days = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+
+    # the default settings, 2 second steps from 8am
+    steptime = lambda step : 8.0 + (step * 2.0) / (60.0 * 60.0)
+    laststep = int(days * 24.0 * 1800.0)
+
+    random.seed(count)
+    starts = [random.uniform(steptime(0), steptime(laststep)) for i in xrange(count)]
+    moves = random.sample(xrange(count), count / 10)
+
+    results = {}
+    for name in sorted(Schedulers) :
+        trips = [BenchmarkTrip(i, stime) for i, stime in enumerate(starts)]
+        scheduler = Schedulers[name](steptime)
+
+        stime = time.time()
+        for trip in trips :
+            scheduler.Add(trip)
+        addtime = time.time() - stime
+
+        # cancel every other moved trip and reschedule the rest an hour later
+        stime = time.time()
+        for i, index in enumerate(moves) :
+            if i % 2 :
+                scheduler.Cancel(trips[index])
+            else :
+                scheduler.Reschedule(trips[index], trips[index].ScheduledStartTime + 1.0)
+        movetime = time.time() - stime
+
+        order = []
+        stime = time.time()
+        for step in xrange(1, laststep + 1802) :
+            order.extend(trip.TripID for trip in scheduler.PopDueTrips(step))
+        draintime = time.time() - stime
+
+        results[name] = order
+        print "{0:6s} {1} trips, add {2:.3f}s, cancel/reschedule {3} {4:.3f}s, drain {5} steps {6:.3f}s, {7} started, {8} left".format(
+            name, count, addtime, len(moves), movetime, laststep + 1801, draintime, len(order), len(scheduler))
+
+    print "same start order: {0}".format(results['heap'] == results['wheel'])
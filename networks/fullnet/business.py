@@ -44,6 +44,7 @@ from mobdat.common.Schedule import WeeklySchedule
 from mobdat.common.Utilities import GenName
 from mobdat.common.Decoration import *
 from mobdat.common import SocialNodes, SocialEdges, SocialDecoration
+from mobdat.builder import Placement
 
 import random
 
@@ -184,28 +185,12 @@ AddSchoolProfile("high-school", { 'teacher' : 30, 'admin' : 8, 'principal' : 4},
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 
-# -----------------------------------------------------------------
-def PlaceBusiness(business) :
-    global world
-
-    bestloc = None
-    bestfit = 0
-    for locname, location in world.IterNodes(nodetype = 'BusinessLocation') :
-        fitness = location.BusinessLocation.Fitness(business)
-        if fitness > bestfit :
-            bestfit = fitness
-            bestloc = location
-
-    if bestloc :
-        capsule = bestloc.BusinessLocation.AddBusiness(business)
-        world.SetResidence(business, capsule)
-
-    return bestloc
-
 # -----------------------------------------------------------------
 def PlaceBusinesses() :
     global world
 
+    placement = Placement.BusinessPlacement(world)
+
     profiles = {}
     for profname, profile in world.IterNodes(nodetype = 'BusinessProfile') :
         profiles[profname] = profile
@@ -217,7 +202,7 @@ def PlaceBusinesses() :
 
         name = GenName(pname)
         business = world.AddBusiness(name, profile)
-        location = PlaceBusiness(business)
+        location = placement.PlaceBusiness(business)
 
         # if we could not place the business, then all locations
         # have fitness of 0... so don't try again
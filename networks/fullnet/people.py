@@ -47,6 +47,7 @@ sys.path.append(os.path.join(os.environ.get("OPENSIM","/share/opensim"),"lib","p
 #sys.path.append(os.path.realpath(os.path.join(os.path.dirname(__file__), "..", "lib")))
 
 from mobdat.common.Utilities import GenName
+from mobdat.builder import Placement
 
 import random
 
@@ -68,28 +69,6 @@ for vtype in laysettings.VehicleTypes.itervalues() :
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 # XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX
 
-# -----------------------------------------------------------------
-ResidentialNodes = None
-
-def PlacePerson(person) :
-    global ResidentialNodes
-    if not ResidentialNodes :
-        ResidentialNodes = world.FindNodes(nodetype = 'ResidentialLocation')
-
-    bestloc = None
-    bestfit = 0
-    for location in ResidentialNodes :
-        fitness = location.ResidentialLocation.Fitness(person)
-        if fitness > bestfit :
-            bestfit = fitness
-            bestloc = location
-
-    if bestloc :
-        endpoint = bestloc.ResidentialLocation.AddResident(person)
-        world.SetResidence(person, endpoint)
-
-    return bestloc
-
 # -----------------------------------------------------------------
 def PlacePeople() :
     global world
@@ -100,26 +79,33 @@ def PlacePeople() :
     for name, biz in world.IterNodes(nodetype = 'Business') :
         bizlist[name] = biz
 
-    people = 0
+    # pick the vehicles for the whole workforce at once
+    demand = sum(sum(biz.EmploymentProfile.JobList.itervalues()) for biz in bizlist.itervalues())
+    vehicles = wprof.VehicleType.PickVehicleTypes(demand)
+
+    people = []
     for name, biz in bizlist.iteritems() :
         bprof = biz.EmploymentProfile
         for job, demand in bprof.JobList.iteritems() :
             for p in range(0, demand) :
-                people += 1
                 name = GenName(wprof.Name)
                 person = world.AddPerson(name, wprof)
                 person.SetJob(job)
                 world.SetEmployer(person, biz)
 
-                person.SetVehicle(wprof.VehicleType.PickVehicleType())
-
-                location = PlacePerson(person)
-                if not location :
-                    print 'ran out of residences after %s people' % people
-                    return
+                person.SetVehicle(vehicles[len(people)])
+                people.append(person)
 
+    # place the whole workforce at once, the people who do not fit
+    # anywhere are dropped from the world
+    placement = Placement.ResidentialPlacement(world)
+    unplaced = placement.PlaceResidents(people)
+    if unplaced :
+        print 'ran out of residences after %s people' % (len(people) - len(unplaced))
+        for person in unplaced :
+            world.DropNode(person)
 
-    print 'created %s people' % people
+    print 'created %s people' % (len(people) - len(unplaced))
 
 PlacePeople()
 
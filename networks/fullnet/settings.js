@@ -7,6 +7,7 @@
         "StartTimeOfDay" : 7.0,
         "MaximumTravelers" : 0, 
 	"WorldInfoFile" : "networks/fullnet/data/worldinfo.js",
+        "WorldInfoIndent" : 2,
         "Connectors" : ["opensim", "sumo", "social", "stats"]
     },
 